@@ -0,0 +1,142 @@
+"""
+IVF (inverted file) approximate nearest-neighbour index over data/embeddings_fp16.npy.
+
+Built offline with `python ann_index.py`, saved next to the embeddings and
+memory-mapped by search._initialize_search_resources. `nprobe` is the
+recall/latency knob: the number of coarse clusters scanned per query.
+"""
+import argparse
+import os
+import time
+import numpy as np
+
+from file_downloader import EMBEDDINGS_PATH
+
+CENTROIDS_FILE = "ann_centroids.npy"   # (n_lists, dim) float32
+OFFSETS_FILE   = "ann_offsets.npy"     # (n_lists + 1,) int64, list boundaries into ids
+IDS_FILE       = "ann_ids.npy"         # (n,) int32, record indices grouped by list
+
+DEFAULT_NPROBE = int(os.getenv("ANN_NPROBE", "32"))
+# probing widens until the allowed candidates reach this multiple of top_k
+CANDIDATE_FACTOR = float(os.getenv("ANN_CANDIDATE_FACTOR", "4"))
+
+def _index_paths(directory):
+    return [os.path.join(directory, f) for f in (CENTROIDS_FILE, OFFSETS_FILE, IDS_FILE)]
+
+def _assign(embeddings, centroids, block=65536):
+    """Nearest centroid (by dot product) for every row, scanning the mmap in blocks."""
+    out = np.empty(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), block):
+        chunk = np.asarray(embeddings[start:start + block], dtype=np.float32)
+        out[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return out
+
+def _kmeans(sample, n_lists, n_iter, rng):
+    """Spherical k-means: the model emits unit vectors, so cosine == dot."""
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        present, starts = np.unique(assign[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        # re-seed empty clusters from random points so every list stays usable
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+def build_ivf_index(embeddings_path=EMBEDDINGS_PATH, out_dir=None, n_lists=None,
+                    n_iter=20, sample_per_list=64, seed=0):
+    """
+    Train coarse centroids on a sample, assign every row and write the
+    inverted lists next to the embeddings. Files are swapped in atomically.
+    """
+    out_dir = out_dir or os.path.dirname(embeddings_path)
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    n = len(embeddings)
+    if n_lists is None:
+        n_lists = int(4 * np.sqrt(n))
+    n_lists = max(1, min(n_lists, n))
+
+    t0 = time.time()
+    rng = np.random.default_rng(seed)
+    sample_size = min(n, n_lists * sample_per_list)
+    sample_idx = np.sort(rng.choice(n, sample_size, replace=False))
+    sample = np.asarray(embeddings[sample_idx], dtype=np.float32)
+    centroids = _kmeans(sample, n_lists, n_iter, rng)
+    print(f"[ANN] trained {n_lists} centroids on {sample_size} rows in {time.time() - t0:.1f}s")
+
+    assign = _assign(embeddings, centroids)
+    ids = np.argsort(assign, kind="stable").astype(np.int32)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assign, minlength=n_lists), out=offsets[1:])
+
+    os.makedirs(out_dir, exist_ok=True)
+    for path, arr in zip(_index_paths(out_dir), (centroids, offsets, ids)):
+        tmp = path + ".tmp.npy"
+        np.save(tmp, arr)
+        os.replace(tmp, path)
+    print(f"[ANN] indexed {n} rows into {out_dir} in {time.time() - t0:.1f}s")
+
+class IVFIndex:
+    def __init__(self, directory):
+        centroids_path, offsets_path, ids_path = _index_paths(directory)
+        self.centroids = np.load(centroids_path)                 # small, keep in RAM
+        self.offsets   = np.load(offsets_path, mmap_mode="r")
+        self.ids       = np.load(ids_path, mmap_mode="r")
+
+    def search(self, embeddings, q, top_k, nprobe=DEFAULT_NPROBE, allowed=None):
+        """
+        Scan the `nprobe` closest lists and return (record indices, scores),
+        best first. `allowed` is an optional boolean mask over record indices.
+        nprobe doubles until the probed lists hold CANDIDATE_FACTOR * top_k
+        allowed candidates (or every list is probed), so a selective mask
+        still fills top_k with a recall close to the unmasked search.
+        """
+        q = np.asarray(q, dtype=np.float32).ravel()
+        n_lists = len(self.centroids)
+        nprobe = max(1, min(nprobe, n_lists))
+        order = np.argsort(self.centroids @ q)[::-1]             # closest lists first
+
+        while True:
+            cand = np.concatenate([
+                self.ids[self.offsets[l]:self.offsets[l + 1]] for l in order[:nprobe]
+            ])
+            if allowed is not None:
+                cand = cand[allowed[cand]]
+            if len(cand) >= CANDIDATE_FACTOR * top_k or nprobe == n_lists:
+                break
+            nprobe = min(2 * nprobe, n_lists)
+        if len(cand) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cand.sort()                                              # sequential mmap reads
+
+        scores = np.asarray(embeddings[cand], dtype=np.float32) @ q
+        k = min(top_k, len(cand))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return cand[top].astype(np.int64), scores[top]
+
+def load_ivf_index(embeddings_path=EMBEDDINGS_PATH):
+    """Return the IVFIndex next to `embeddings_path`, or None if missing or stale."""
+    directory = os.path.dirname(embeddings_path)
+    paths = _index_paths(directory)
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    if min(os.path.getmtime(p) for p in paths) < os.path.getmtime(embeddings_path):
+        print("[ANN] index is older than the embeddings, falling back to exact scan")
+        return None
+    return IVFIndex(directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the IVF index over the embeddings.")
+    parser.add_argument("--embeddings", default=EMBEDDINGS_PATH)
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--n-iter", type=int, default=20)
+    args = parser.parse_args()
+    build_ivf_index(args.embeddings, args.out_dir, args.n_lists, args.n_iter)
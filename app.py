@@ -1,5 +1,11 @@
-from flask import Flask, request, render_template, jsonify, redirect, url_for, session, flash, abort
-from tasks import enrich_data_task, celery  # celery is our Celery app instance
+from flask import Flask, request, render_template, jsonify, redirect, url_for, session, flash, abort, Response, stream_with_context
+from task_signatures import celery, enqueue_enrich, enqueue_enrich_many  # no tasks import: keeps torch & co. out of the web tier
+from warm_start import ready_workers
+from progress import sse_stream
+import dedup
+from field_values import bound_error
+import metrics
+import importlib.util
 import uuid
 import os
 import boto3
@@ -17,6 +23,38 @@ s3 = boto3.client("s3")
 if not S3_BUCKET:
     raise RuntimeError("S3_BUCKET env‑var is required")
 
+# result_writer.WRITERS; parquet is only offered where pyarrow is installed (workers share requirements.txt)
+OUTPUT_FORMATS = {"xlsx": "Excel (.xlsx)", "csv": "CSV (zip)"}
+if importlib.util.find_spec("pyarrow") is not None:
+    OUTPUT_FORMATS["parquet"] = "Parquet (zip)"
+
+@app.context_processor
+def _form_options():
+    return {"output_formats": OUTPUT_FORMATS}
+
+def form_filters(form):
+    """
+    Structured prefilters from the form (see field_index.py):
+    filter.<field>=a, b  → {field: ["a", "b"]};  filter.<field>.min / .max → {field: {"min", "max"}}
+    """
+    filters = {}
+    for name, value in form.items():
+        value = value.strip()
+        if not name.startswith("filter.") or not value:
+            continue
+        field = name[len("filter."):]
+        if field.endswith((".min", ".max")):
+            field, bound = field.rsplit(".", 1)
+            filters.setdefault(field, {})[bound] = value
+        else:
+            filters[field] = [v.strip() for v in value.split(",") if v.strip()]
+    return filters or None
+
+def filter_errors(filters):
+    """Messages for range filters whose bounds cannot be applied (checked before enqueueing)."""
+    return [error for field, condition in (filters or {}).items()
+            if isinstance(condition, dict) and (error := bound_error(field, condition))]
+
 @app.route('/', methods=['GET', 'POST'])
 def home():
     if not session.get('logged_in'):
@@ -25,18 +63,47 @@ def home():
     if request.method == 'POST':
         # Retrieve the keywords (company names) from the form.
         prompt = request.form.get('prompt')
+        # optional related prompts, one per line: searched as one batch, one output file
+        prompts = [prompt] + [p.strip() for p in request.form.get('extra_prompts', '').splitlines() if p.strip()]
         search_types = request.form.getlist('search_types')
+        mode = "batch" if request.form.get('batch_mode') else "interactive"
+        output_format = request.form.get('output_format', 'xlsx')
+        filters = form_filters(request.form)
+        errors = filter_errors(filters)
+        if output_format not in OUTPUT_FORMATS:
+            errors.append(f"Output format {output_format!r} is not available")
+        if errors:
+            for error in errors:
+                flash(error)
+            return render_template('index.html'), 400
         request_id = generate_unique_id()
         # print input to have a way to see what ppl are searching (not great but whatever)
         print("PROMPT: ", prompt)
         print("SEARCH TYPES: ", ', '.join(search_types))
-
-        # Enqueue the enrichment task.
-        task = enrich_data_task.delay(prompt, search_types, request_id)
+        if filters:
+            print("FILTERS: ", filters)
+
+        # Enqueue the enrichment task, unless an identical job is running or just finished.
+        if len(prompts) > 1:
+            enqueue = lambda task_id, key: enqueue_enrich_many(prompts, search_types, request_id, mode,
+                                                               output_format, task_id=task_id, dedup_key=key,
+                                                               filters=filters)
+        else:
+            enqueue = lambda task_id, key: enqueue_enrich(prompt, search_types, request_id, mode,
+                                                          output_format, task_id=task_id, dedup_key=key,
+                                                          filters=filters)
+        task_id, request_id, dedup_status, s3_key = dedup.submit(
+            prompts if len(prompts) > 1 else prompt, search_types, request_id, mode, output_format, enqueue,
+            filters=filters,
+        )
+        if dedup_status != "new":
+            print(f"DEDUP: {dedup_status} task {task_id}")
+        # an identical job finished recently: its file is offered right away
         return render_template('submission.html', 
-                               prompt=prompt,
+                               prompt="; ".join(prompts),
                                request_id=request_id,
-                               task_id=task.id)
+                               task_id=task_id,
+                               reused=dedup_status == "reused" and bool(s3_key))
     return render_template('index.html')
 
 @app.route('/status/<task_id>')
@@ -58,12 +125,29 @@ def task_status(task_id):
         response = {'state': task.state, 'status': str(task.info)}
     return jsonify(response)
 
+@app.route('/events/<task_id>')
+def task_events(task_id):
+    """
+    Server-Sent Events: coalesced progress pushed by the worker (see progress.py).
+    Streams last SSE_MAX_SECONDS and hold a worker thread meanwhile (gthread, gunicorn.conf.py).
+    """
+    return Response(
+        stream_with_context(sse_stream(task_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.route("/download/<task_id>")
 def download_file(task_id):
     """Return a 302 redirect to a pre‑signed S3 object, or JSON status if pending."""
     keywords = request.args.get("keywords", "")   # purely for analytics, not used now
     task = celery.AsyncResult(task_id)
 
+    # a deduplicated job's result outlives Celery's (see dedup.result_key)
+    reused_key = dedup.result_key(task_id) if task.state == "PENDING" else None
+    if reused_key:
+        return _redirect_to_result(task_id, reused_key, os.path.basename(reused_key))
+
     # ---------------------------- PENDING / RUNNING ----------------------------
     if task.state == "PENDING":
         return jsonify({"state": task.state,
@@ -84,11 +168,10 @@ def download_file(task_id):
     s3_key = task.info.get("s3_key")
     if not s3_key:
         abort(404, description="Result key missing in task metadata")
+    return _redirect_to_result(task_id, s3_key, task.info.get("filename", os.path.basename(s3_key)))
 
+def _redirect_to_result(task_id, s3_key, filename):
     try:
-
-        filename = task.info.get("filename", os.path.basename(s3_key))
-
         presigned_url = s3.generate_presigned_url(
             "get_object",
             Params={
@@ -112,7 +195,26 @@ def download_file(task_id):
 
 @app.route("/healthz", methods=["GET","HEAD"])
 def healthz():
-    return "OK", 200
+    """Web liveness plus worker readiness; with ?ready=1, 503 until a worker has warmed up."""
+    try:
+        workers = ready_workers()
+    except Exception as e:
+        app.logger.warning("readiness lookup failed: %s", e)
+        workers = {}
+    body = {
+        "web": "ok",
+        "workers_ready": len(workers),
+        "workers": {name: {"startup_seconds": r.get("seconds")} for name, r in workers.items()},
+    }
+    if request.args.get("ready") and not workers:
+        return jsonify(body), 503
+    return jsonify(body), 200
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape: stage timings, GPT attempts/tokens, jobs (all processes with PROMETHEUS_MULTIPROC_DIR)."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
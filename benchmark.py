@@ -0,0 +1,429 @@
+"""
+Reproducible benchmarks for search and enrichment on a synthetic corpus.
+
+    python benchmark.py corpus --out bench/100k --size 100000         # records.json + embeddings_fp16.npy
+    python benchmark.py search --data bench/100k --queries 100 --out search.json
+    python benchmark.py enrich --data bench/100k --records 300 --latency 0.5 --error-rate 0.05 --out enrich.json
+    python benchmark.py compare base.json search.json                # p50/p95/p99 change per stage
+
+The corpus has topic clusters: each record's embedding sits near its
+cluster centre and its combined_text draws from the cluster's vocabulary,
+so semantic and BM25 retrieval agree the way real data does. Records carry
+the same fields as production (company / deal / trial / asset / award,
+phase, countries, deal value and date).
+
+`search` times each stage per query (encode, semantic, bm25, fusion,
+rerank, filter, plus the whole of search._search_indices) and the peak RSS
+seen while the stage runs. By default the models are synthetic: a
+deterministic encoder that knows the cluster centres and a term-overlap
+cross-encoder, so runs need no model download and measure the pipeline
+itself. --models real loads models.py. Query caches are off unless --cache.
+
+`enrich` runs gpt.enrich end to end against fake_openai.py (injected
+latency, jitter, rpm limit and random 429s), with the enrichment cache off.
+
+Every command writes {"meta": ..., "stages": {stage: {"p50_ms", "p95_ms",
+"p99_ms", "mean_ms", "n", "peak_rss_mb"}}} as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+import psutil
+
+from file_downloader import RECORDS_FILE, EMBEDDINGS_FILE
+
+CORPUS_META_FILE = "bench_corpus.json"
+TYPE_MIX = {"company": 0.35, "deal": 0.25, "trial": 0.25, "asset": 0.1, "award": 0.05}
+PHASES = ["Phase 1", "Phase 1/Phase 2", "Phase 2", "Phase 3", "Phase 4"]
+COUNTRIES = ["China", "United States", "Japan", "Korea", "Germany", "France", "United Kingdom", "India"]
+AREAS = ["Oncology", "Ophthalmology", "Neurology", "Immunology", "Cardiology", "Infectious Disease"]
+CLUSTER_WORDS = 40              # topic words per cluster
+COMMON_WORDS = 5000             # shared Zipf-distributed vocabulary
+TEXT_WORDS = (30, 120)          # combined_text length range
+
+# ---- synthetic corpus ----
+
+def _centres(seed, clusters, dim):
+    rng = np.random.default_rng(seed)
+    c = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return c / np.linalg.norm(c, axis=1, keepdims=True)
+
+def _cluster_word(c, j):
+    return f"t{c}x{j}"
+
+def _text(rng, cluster):
+    n = int(rng.integers(*TEXT_WORDS))
+    topic = [_cluster_word(cluster, j) for j in rng.zipf(1.5, n // 3) % CLUSTER_WORDS]
+    common = [f"w{j}" for j in rng.zipf(1.3, n - len(topic)) % COMMON_WORDS]
+    words = topic + common
+    rng.shuffle(words)
+    return " ".join(words)
+
+def _record(rng, i, record_type, cluster):
+    rec = {"type": record_type, "combined_text": _text(rng, cluster)}
+    if record_type == "company":
+        rec["company"] = f"Company {i}"
+    elif record_type == "deal":
+        rec.update(acquirer=f"Acquirer {int(rng.integers(i + 1))}", acquired_company=f"Target {i}",
+                   value=f"${int(rng.integers(1, 5000))}M",
+                   date=f"{int(rng.integers(2005, 2026))}-{int(rng.integers(1, 13)):02d}-{int(rng.integers(1, 29)):02d}")
+    elif record_type == "trial":
+        rec.update(BriefTitle=f"Study {i}", NCTId=f"NCT{i:08d}", TherapeuticArea=AREAS[cluster % len(AREAS)],
+                   StudyType="Interventional", Disease=f"disease {cluster}", Interventions=f"drug {i}",
+                   Phase=PHASES[int(rng.integers(len(PHASES)))], Sponsor=f"Sponsor {int(rng.integers(500))}",
+                   Countries=[str(c) for c in rng.choice(COUNTRIES, int(rng.integers(1, 4)), replace=False)])
+    else:
+        rec["name"] = f"{record_type.title()} {i}"
+    return rec
+
+def write_corpus(out_dir, size, dim=384, clusters=512, noise=0.6, seed=0, block=65536):
+    """records.json + embeddings_fp16.npy with `size` records, streamed in blocks."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    centres = _centres(seed, clusters, dim)
+    types, weights = list(TYPE_MIX), np.array(list(TYPE_MIX.values()))
+    emb = np.lib.format.open_memmap(os.path.join(out_dir, EMBEDDINGS_FILE), mode="w+",
+                                    dtype=np.float16, shape=(size, dim))
+    started = time.perf_counter()
+    with open(os.path.join(out_dir, RECORDS_FILE), "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for start in range(0, size, block):
+            m = min(block, size - start)
+            cl = rng.integers(clusters, size=m)
+            x = centres[cl] + noise * rng.standard_normal((m, dim)).astype(np.float32) / np.sqrt(dim)
+            emb[start:start + m] = x / np.linalg.norm(x, axis=1, keepdims=True)
+            kinds = rng.choice(len(types), m, p=weights / weights.sum())
+            for j in range(m):
+                rec = _record(rng, start + j, types[kinds[j]], int(cl[j]))
+                f.write(("" if start + j == 0 else ",\n") + json.dumps(rec))
+        f.write("\n]\n")
+    emb.flush()
+    with open(os.path.join(out_dir, CORPUS_META_FILE), "w") as f:
+        json.dump({"size": size, "dim": dim, "clusters": clusters, "noise": noise, "seed": seed}, f)
+    print(f"[BENCH] wrote {size} records ({dim}-d) to {out_dir} in {time.perf_counter() - started:.1f}s")
+
+class SyntheticEncoder:
+    """Deterministic stand-in for the sentence model: topic words pull toward their cluster centre."""
+
+    def __init__(self, corpus_meta):
+        self.dim = corpus_meta["dim"]
+        self.centres = _centres(corpus_meta["seed"], corpus_meta["clusters"], self.dim)
+
+    def _one(self, text):
+        clusters = [int(w[1:].split("x")[0]) for w in text.split() if w.startswith("t") and "x" in w]
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))     # stable across processes
+        v = rng.standard_normal(self.dim).astype(np.float32) * 0.3 / np.sqrt(self.dim)
+        if clusters:
+            v += self.centres[clusters].mean(axis=0)
+        return v / np.linalg.norm(v)
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._one(sentences)
+        return np.stack([self._one(s) for s in sentences])
+
+class SyntheticCrossEncoder:
+    """Term-overlap scores in roughly the cross-encoder's range (-5 .. 5)."""
+
+    def predict(self, pairs, **kwargs):
+        out = []
+        for query, text in pairs:
+            terms, words = set(query.split()), text.split()
+            hits = sum(w in terms for w in words)
+            out.append(10 * hits / (len(words) + 10) - 2)
+        return np.array(out, dtype=np.float32)
+
+def _queries(corpus_meta, n, seed=1):
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        c = int(rng.integers(corpus_meta["clusters"]))
+        words = [_cluster_word(c, int(j)) for j in rng.zipf(1.5, 3) % CLUSTER_WORDS]
+        out.append(" ".join(words + [f"w{int(rng.integers(50))}"]))
+    return out
+
+# ---- measurement ----
+
+class PeakRss:
+    """Background sampler: peak RSS per named stage (psutil, every `interval` seconds)."""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peaks = {}
+        self._stage = None
+        self._proc = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            stage = self._stage
+            if stage is not None:
+                rss = self._proc.memory_info().rss
+                self.peaks[stage] = max(self.peaks.get(stage, 0), rss)
+            time.sleep(self.interval)
+
+    @contextmanager
+    def stage(self, name):
+        self._stage = name
+        rss = self._proc.memory_info().rss
+        self.peaks[name] = max(self.peaks.get(name, 0), rss)
+        try:
+            yield
+        finally:
+            self.peaks[name] = max(self.peaks[name], self._proc.memory_info().rss)
+            self._stage = None
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+def summarize(samples_ms, peak_rss=None):
+    a = np.asarray(samples_ms, dtype=np.float64)
+    out = {
+        "n": int(len(a)),
+        "mean_ms": round(float(a.mean()), 3) if len(a) else None,
+        "p50_ms": round(float(np.percentile(a, 50)), 3) if len(a) else None,
+        "p95_ms": round(float(np.percentile(a, 95)), 3) if len(a) else None,
+        "p99_ms": round(float(np.percentile(a, 99)), 3) if len(a) else None,
+    }
+    if peak_rss is not None:
+        out["peak_rss_mb"] = round(peak_rss / 1024**2, 1)
+    return out
+
+def _meta(**params):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), **params}
+
+def _load_corpus_meta(data_dir):
+    path = os.path.join(data_dir, CORPUS_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+# ---- search stages ----
+
+def bench_search(data_dir, queries=50, models="synthetic", search_types=("company", "deal", "trial"),
+                 sem_top_k=2000, alpha=0.7, top_k=1000, rerank_top_n=500, lex_top_k=0,
+                 exact=False, tier=None, warmup=3):
+    """Per-stage latency and peak RSS of search over `queries` synthetic queries."""
+    import search
+    corpus_meta = _load_corpus_meta(data_dir)
+    if models == "real":
+        from models import get_sentence_model, get_cross_encoder
+        model, re_ranker = get_sentence_model(), get_cross_encoder()
+    else:
+        if corpus_meta is None:
+            raise SystemExit(f"{data_dir} is not a benchmark corpus; use --models real")
+        model, re_ranker = SyntheticEncoder(corpus_meta), SyntheticCrossEncoder()
+    texts = _queries(corpus_meta, queries + warmup) if corpus_meta else \
+        [f"query {i}" for i in range(queries + warmup)]
+
+    rss = PeakRss()
+    timings = {s: [] for s in ("encode", "semantic", "bm25", "fusion", "rerank", "filter", "search_total")}
+    t0 = time.perf_counter()
+    with rss.stage("load"):
+        data = search.SearchData(data_dir, "bench")
+    load_ms = (time.perf_counter() - t0) * 1000
+    types = [t for t in search_types if t in data.type_offsets]
+    quotas = {t: search.DEFAULT_TYPE_QUOTA for t in types}
+    options = dict(sem_top_k=sem_top_k, alpha=alpha, top_k=top_k, rerank_top_n=rerank_top_n,
+                   exact=exact, tier=tier, lex_top_k=lex_top_k)
+
+    def timed(stage, n, fn):
+        with rss.stage(stage):
+            t = time.perf_counter()
+            out = fn()
+            elapsed = (time.perf_counter() - t) * 1000
+        if n >= warmup:
+            timings[stage].append(elapsed)
+        return out, elapsed
+
+    for n, query in enumerate(texts):
+        q_text = query + " " + " ".join(types)
+        q_emb, _ = timed("encode", n, lambda: np.asarray(model.encode(q_text), dtype=np.float32))
+        (idxs, scores), _ = timed("semantic", n, lambda: search._semantic_stage(
+            data, q_emb, types, sem_top_k, exact=exact, tier=tier or search.SEARCH_TIER))
+        _, bm25_ms = timed("bm25", n, lambda: data.bm25.get_scores(query, np.asarray(idxs, dtype=np.int64)))
+        # _hybrid_heads scores BM25 itself; fusion is its time minus this query's bm25 time
+        (heads, hybrid), hybrid_ms = timed("fusion", n, lambda: search._hybrid_heads(
+            data, query, q_emb, types, idxs, scores, alpha, top_k, lex_top_k))
+        if n >= warmup:
+            timings["fusion"][-1] = max(hybrid_ms - bm25_ms, 0.0)
+        reranked, _ = timed("rerank", n, lambda: search._rerank_many(
+            data, [(query, heads, quotas)], search.DEFAULT_SCORE_FLOOR, rerank_top_n, re_ranker)[0])
+        grouped = {t: [(data.records[i], sc) for i, sc in scored] for t, scored in reranked.items()}
+        timed("filter", n, lambda: [[r["combined_text"] for r in search.filter(grouped, doc_type=t)]
+                                    for t in types])
+        timed("search_total", n, lambda: search._search_indices(
+            query, types, model, re_ranker=re_ranker, data=data, **options))
+    rss.close()
+
+    stages = {s: summarize(v, rss.peaks.get(s)) for s, v in timings.items()}
+    stages["load"] = summarize([load_ms], rss.peaks.get("load"))
+    return {"meta": _meta(benchmark="search", data=data_dir, corpus=corpus_meta, records=len(data.records),
+                          queries=queries, models=models, search_types=types, **options),
+            "stages": stages}
+
+# ---- end-to-end enrichment ----
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def bench_enrich(data_dir, records=200, latency=0.5, jitter=0.5, rpm=0, error_rate=0.05,
+                 engine="async", prompt="oncology companies in Asia", output_format="xlsx", repeat=1):
+    """
+    gpt.enrich on `records` GPT-backed records against a local fake OpenAI.
+    Sets OPENAI_BASE_URL / ENRICH_ENGINE before gpt is imported, so call it
+    in a fresh process (the CLI does).
+    """
+    import fake_openai
+    port = _free_port()
+    server, state = fake_openai.serve(port, latency=latency, jitter=jitter, rpm=rpm, error_rate=error_rate)
+    os.environ.update(OPENAI_BASE_URL=f"http://127.0.0.1:{port}/v1", OPENAI_API_KEY="fake",
+                      ENRICH_CACHE="off", ENRICH_ENGINE=engine)
+    import gpt
+    from record_store import RecordStore, build_record_store, store_stale
+
+    if store_stale(data_dir, os.path.join(data_dir, RECORDS_FILE)):
+        build_record_store(os.path.join(data_dir, RECORDS_FILE), data_dir)
+    store = RecordStore(data_dir)
+    gpt_codes = [c for c, t in enumerate(store.type_names) if t not in gpt.PASSTHROUGH_TYPES]
+    candidates = np.flatnonzero(np.isin(store.type_codes, gpt_codes))
+    rng = random.Random(0)
+    picked = sorted(rng.sample(range(len(candidates)), min(records, len(candidates))))
+    batch = [store[int(candidates[i])] for i in picked]
+
+    rss = PeakRss()
+    done_ms, totals = [], []
+    for run in range(repeat):
+        started = time.perf_counter()
+        seen = [0]
+
+        def progress_cb(done, total, cache_hits=0):
+            now = (time.perf_counter() - started) * 1000
+            done_ms.extend([now] * (done - seen[0]))
+            seen[0] = done
+
+        with rss.stage("enrich"):
+            output = gpt.enrich(batch, prompt, progress_cb=progress_cb, output_format=output_format)
+        output.file.close()
+        totals.append((time.perf_counter() - started) * 1000)
+    rss.close()
+    server.shutdown()
+
+    total_s = sum(totals) / 1000
+    return {
+        "meta": _meta(benchmark="enrich", data=data_dir, records=len(batch), latency=latency, jitter=jitter,
+                      rpm=rpm, error_rate=error_rate, engine=engine, repeat=repeat, output_format=output_format),
+        "stages": {
+            "enrich_job": summarize(totals, rss.peaks.get("enrich")),
+            "record_done": summarize(done_ms),        # time from job start until each record finished
+        },
+        "throughput": {
+            "records_per_s": round(len(batch) * repeat / total_s, 2) if total_s else None,
+            "requests": state.requests,
+            "throttled_429": state.throttled,
+        },
+    }
+
+# ---- comparison ----
+
+def compare(base, new):
+    """{stage: {metric: relative change}} for the percentile metrics of two runs."""
+    out = {}
+    for stage, b in base["stages"].items():
+        n = new["stages"].get(stage)
+        if not n:
+            continue
+        out[stage] = {m: round((n[m] - b[m]) / b[m], 3) if b.get(m) and n.get(m) is not None else None
+                      for m in ("p50_ms", "p95_ms", "p99_ms", "peak_rss_mb") if m in b}
+    return out
+
+def _write(report, path):
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+        print(f"[BENCH] wrote {path}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search and enrichment benchmarks on a synthetic corpus.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    c = sub.add_parser("corpus", help="write a synthetic records.json + embeddings_fp16.npy")
+    c.add_argument("--out", required=True)
+    c.add_argument("--size", type=int, default=10000, help="records (10k .. 5M)")
+    c.add_argument("--dim", type=int, default=384)
+    c.add_argument("--clusters", type=int, default=512)
+    c.add_argument("--seed", type=int, default=0)
+
+    s = sub.add_parser("search", help="per-stage search latency and peak RSS")
+    s.add_argument("--data", required=True)
+    s.add_argument("--queries", type=int, default=50)
+    s.add_argument("--models", choices=["synthetic", "real"], default="synthetic")
+    s.add_argument("--types", nargs="+", default=["company", "deal", "trial"])
+    s.add_argument("--sem-top-k", type=int, default=2000)
+    s.add_argument("--alpha", type=float, default=0.7)
+    s.add_argument("--top-k", type=int, default=1000)
+    s.add_argument("--rerank-top-n", type=int, default=500)
+    s.add_argument("--lex-top-k", type=int, default=0)
+    s.add_argument("--exact", action="store_true", help="bypass the ANN index")
+    s.add_argument("--tier", choices=["fp16", "int8", "binary"])
+    s.add_argument("--cache", action="store_true", help="keep the query caches on")
+    s.add_argument("--out")
+
+    e = sub.add_parser("enrich", help="end-to-end gpt.enrich against a fake OpenAI server")
+    e.add_argument("--data", required=True)
+    e.add_argument("--records", type=int, default=200)
+    e.add_argument("--latency", type=float, default=0.5, help="mean seconds per completion")
+    e.add_argument("--jitter", type=float, default=0.5)
+    e.add_argument("--rpm", type=int, default=0, help="fake server requests per minute (0 = unlimited)")
+    e.add_argument("--error-rate", type=float, default=0.05, help="probability of a random 429")
+    e.add_argument("--engine", choices=["async", "threads"], default="async")
+    e.add_argument("--format", default="xlsx")
+    e.add_argument("--repeat", type=int, default=1)
+    e.add_argument("--out")
+
+    m = sub.add_parser("compare", help="relative p50/p95/p99 change between two result files")
+    m.add_argument("base")
+    m.add_argument("new")
+
+    args = parser.parse_args()
+    if args.command == "corpus":
+        write_corpus(args.out, args.size, dim=args.dim, clusters=args.clusters, seed=args.seed)
+    elif args.command == "search":
+        if not args.cache:
+            os.environ["QUERY_CACHE"] = "off"          # read when query_cache is first imported
+        _write(bench_search(args.data, args.queries, args.models, args.types, args.sem_top_k, args.alpha,
+                            args.top_k, args.rerank_top_n, args.lex_top_k, args.exact, args.tier), args.out)
+    elif args.command == "enrich":
+        _write(bench_enrich(args.data, args.records, args.latency, args.jitter, args.rpm, args.error_rate,
+                            args.engine, output_format=args.format, repeat=args.repeat), args.out)
+    else:
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print(json.dumps(compare(base, new), indent=2))
@@ -0,0 +1,154 @@
+"""
+Corpus-level BM25 (Okapi) inverted index over records' combined_text.
+
+Built once per data refresh and memory-mapped at search init. Tokenization,
+IDF and term weighting match rank_bm25.BM25Okapi, but document frequencies
+come from the whole corpus rather than the per-query candidate set.
+
+    bm25_vocab.json     {term: term id}
+    bm25_offsets.npy    (n_terms + 1,) int64, postings boundaries per term
+    bm25_docs.npy       (n_postings,) int32, record indices (ascending per term)
+    bm25_tfs.npy        (n_postings,) uint16, term frequencies
+    bm25_doclen.npy     (n_docs,) int32
+    bm25_idf.npy        (n_terms,) float32
+    bm25_meta.json      {"k1", "b", "avgdl", "n_docs"}
+"""
+import json
+import os
+from array import array
+from collections import Counter
+import numpy as np
+from build_lock import tmp_path
+
+FILES = {
+    "vocab":   "bm25_vocab.json",
+    "offsets": "bm25_offsets.npy",
+    "docs":    "bm25_docs.npy",
+    "tfs":     "bm25_tfs.npy",
+    "doclen":  "bm25_doclen.npy",
+    "idf":     "bm25_idf.npy",
+    "meta":    "bm25_meta.json",
+}
+
+def tokenize(text):
+    return text.lower().split()
+
+def _paths(directory):
+    return {name: os.path.join(directory, f) for name, f in FILES.items()}
+
+def bm25_stale(directory, *sources):
+    """True if any index file is missing or older than one of `sources`."""
+    paths = list(_paths(directory).values())
+    if not all(os.path.exists(p) for p in paths):
+        return True
+    return min(os.path.getmtime(p) for p in paths) < max(os.path.getmtime(s) for s in sources)
+
+def build_bm25_index(texts, out_dir, k1=1.5, b=0.75, epsilon=0.25):
+    """Build the index from an iterable of document texts (in record order)."""
+    vocab = {}
+    post_terms, post_docs, post_tfs = array("i"), array("i"), array("H")
+    doclen = array("i")
+
+    for doc_id, text in enumerate(texts):
+        tokens = tokenize(text)
+        doclen.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            post_terms.append(vocab.setdefault(term, len(vocab)))
+            post_docs.append(doc_id)
+            post_tfs.append(min(tf, 65535))
+
+    terms = np.frombuffer(post_terms, dtype=np.int32)
+    order = np.argsort(terms, kind="stable")              # docs stay ascending within a term
+    df = np.bincount(terms, minlength=len(vocab))
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+
+    # BM25Okapi idf: negative values are floored at epsilon * mean idf
+    n_docs = len(doclen)
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    idf[idf < 0] = epsilon * idf.mean() if len(idf) else 0
+    doclen = np.frombuffer(doclen, dtype=np.int32)
+    meta = {"k1": k1, "b": b, "n_docs": n_docs,
+            "avgdl": float(doclen.mean()) if n_docs else 0.0}
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = _paths(out_dir)
+    arrays = {
+        "offsets": offsets,
+        "docs":    np.frombuffer(post_docs, dtype=np.int32)[order],
+        "tfs":     np.frombuffer(post_tfs, dtype=np.uint16)[order],
+        "doclen":  doclen,
+        "idf":     idf.astype(np.float32),
+    }
+    for name, arr in arrays.items():
+        np.save(tmp_path(paths[name], ".npy"), arr)
+        os.replace(tmp_path(paths[name], ".npy"), paths[name])
+    for name, obj in (("vocab", vocab), ("meta", meta)):
+        with open(tmp_path(paths[name]), "w") as f:
+            json.dump(obj, f)
+        os.replace(tmp_path(paths[name]), paths[name])
+    print(f"[BM25] indexed {n_docs} docs, {len(vocab)} terms, {len(terms)} postings")
+
+class BM25Index:
+    def __init__(self, directory):
+        paths = _paths(directory)
+        with open(paths["vocab"]) as f:
+            self.vocab = json.load(f)
+        with open(paths["meta"]) as f:
+            meta = json.load(f)
+        self.k1, self.b, self.avgdl = meta["k1"], meta["b"], meta["avgdl"]
+        self.offsets = np.load(paths["offsets"], mmap_mode="r")
+        self.docs    = np.load(paths["docs"], mmap_mode="r")
+        self.tfs     = np.load(paths["tfs"], mmap_mode="r")
+        self.doclen  = np.load(paths["doclen"], mmap_mode="r")
+        self.idf     = np.load(paths["idf"], mmap_mode="r")
+
+    def _postings(self, query):
+        """(idf, docs, tfs) per query token; repeated tokens count repeatedly, as in BM25Okapi."""
+        for term in tokenize(query):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            lo, hi = self.offsets[tid], self.offsets[tid + 1]
+            yield float(self.idf[tid]), self.docs[lo:hi], self.tfs[lo:hi].astype(np.float32)
+
+    def _weight(self, idf, tf, doc_ids):
+        dl = self.doclen[doc_ids]
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / self.avgdl))
+
+    def get_scores(self, query, doc_ids):
+        """BM25 scores of `query` for the given record indices (any order)."""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        scores = np.zeros(len(doc_ids), dtype=np.float32)
+        if not len(doc_ids):
+            return scores
+        order = np.argsort(doc_ids)
+        sorted_ids = doc_ids[order]
+        for idf, docs, tfs in self._postings(query):
+            if not len(docs):
+                continue
+            pos = np.minimum(np.searchsorted(docs, sorted_ids), len(docs) - 1)
+            hit = docs[pos] == sorted_ids
+            if not hit.any():
+                continue
+            scores[order[hit]] += self._weight(idf, tfs[pos[hit]], sorted_ids[hit])
+        return scores
+
+    def top_k(self, query, k, allowed=None):
+        """Standalone lexical top-k over the corpus (optionally masked) → (record indices, scores)."""
+        parts = list(self._postings(query))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        all_docs = np.concatenate([docs for _, docs, _ in parts])
+        weights = np.concatenate([self._weight(idf, tfs, docs) for idf, docs, tfs in parts])
+        uniq, inverse = np.unique(all_docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        if allowed is not None:
+            keep = allowed[uniq]
+            uniq, scores = uniq[keep], scores[keep]
+        k = min(k, len(uniq))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return uniq[top].astype(np.int64), scores[top]
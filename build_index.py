@@ -0,0 +1,291 @@
+"""
+Offline build of the search inputs from raw records:
+
+    python build_index.py raw_records.json --out-dir data [--workers 4] [--publish]
+
+writes, in --out-dir,
+
+    records.json              the raw records, each with combined_text
+    embeddings_fp16.npy       (n, dim) fp16, row i = records.json[i]
+    embeddings_hashes.npy     (n,) |S16 content hash of each row's combined_text
+    embeddings_build.json     {"model", "n", "dim"} of the last complete build
+
+Raw records are a JSON array or JSON lines. combined_text is kept when a
+record already has one, else built from its "field: value" lines.
+
+Embedding runs in a spawn process pool, each worker loading
+models.get_sentence_model once. Workers write their chunks straight into a
+preallocated fp16 memmap (embeddings_fp16.npy.partial), and every finished
+chunk is appended to a checkpoint, so an interrupted build resumes where it
+stopped when rerun with the same input.
+
+Incremental: rows whose content hash matches a row of the previous build
+(same model) copy its embedding; only added or changed records are
+encoded. --full re-embeds everything.
+
+The derived indexes (record store, shards, BM25, field index) rebuild on
+the next search load; the IVF index is rebuilt with ann_index.py.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+import numpy as np
+
+from file_downloader import RECORDS_FILE, EMBEDDINGS_FILE
+from models import SENTENCE_MODEL_NAME, INFERENCE_BACKEND
+from record_store import iter_json_array
+from build_lock import tmp_path
+
+HASHES_FILE = "embeddings_hashes.npy"
+BUILD_META_FILE = "embeddings_build.json"
+BUILD_CHUNK = int(os.getenv("BUILD_CHUNK", "2048"))             # rows per worker task (and checkpoint)
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+ENCODE_BATCH = int(os.getenv("BUILD_ENCODE_BATCH", "64"))
+COPY_BLOCK = 65536
+TEXT_SKIP = {"type", "combined_text"}
+
+def model_id():
+    """Embeddings from different models / backends are never reused for one another."""
+    return f"{SENTENCE_MODEL_NAME}:{INFERENCE_BACKEND}"
+
+def iter_raw_records(path):
+    """JSON array, or one JSON object per line."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(4096).lstrip()
+    if head.startswith("["):
+        yield from iter_json_array(path)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def combined_text(record):
+    text = record.get("combined_text")
+    if isinstance(text, str) and text.strip():
+        return text
+    lines = []
+    for key, value in record.items():
+        if key in TEXT_SKIP or value in (None, "", []):
+            continue
+        if isinstance(value, list):
+            value = "; ".join(str(v) for v in value)
+        lines.append(f"{key.replace('_', ' ')}: {value}")
+    return "\n".join(lines)
+
+def content_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def write_records(raw_path, out_dir):
+    """Stream the raw records into records.json.tmp with combined_text; returns their hashes."""
+    hashes = []
+    tmp = os.path.join(out_dir, RECORDS_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("[")
+        for n, record in enumerate(iter_raw_records(raw_path)):
+            record["combined_text"] = combined_text(record)
+            hashes.append(content_hash(record["combined_text"]))
+            f.write(("\n" if n == 0 else ",\n") + json.dumps(record, ensure_ascii=False))
+        f.write("\n]\n")
+    return np.array(hashes, dtype="S16")
+
+def previous_rows(out_dir, hashes):
+    """Row of the previous build with the same content for every new row (-1 → encode)."""
+    reuse = np.full(len(hashes), -1, dtype=np.int64)
+    meta_path = os.path.join(out_dir, BUILD_META_FILE)
+    hashes_path = os.path.join(out_dir, HASHES_FILE)
+    if not (os.path.exists(meta_path) and os.path.exists(hashes_path)):
+        return reuse
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("model") != model_id():
+        print(f"[BUILD] previous build used {meta.get('model')}; re-embedding everything")
+        return reuse
+    old = np.load(hashes_path)
+    embeddings_path = os.path.join(out_dir, EMBEDDINGS_FILE)
+    if meta.get("n") != len(old) or not os.path.exists(embeddings_path) \
+            or np.load(embeddings_path, mmap_mode="r").shape[0] != len(old):
+        print("[BUILD] previous build is incomplete; re-embedding everything")
+        return reuse
+    order = np.argsort(old, kind="stable")
+    pos = np.minimum(np.searchsorted(old[order], hashes), len(old) - 1)
+    found = old[order][pos] == hashes
+    reuse[found] = order[pos[found]]
+    return reuse
+
+# ---- worker side (spawned processes) ----
+
+_model = None
+
+def _init_worker(threads):
+    global _model
+    if INFERENCE_BACKEND != "onnx":
+        import torch
+        torch.set_num_threads(threads)
+    from models import get_sentence_model
+    _model = get_sentence_model()
+
+def _dimension():
+    return int(np.asarray(_model.encode(["dimension probe"])).shape[1])
+
+def _encode_chunk(partial_path, chunk_no, rows, texts):
+    """Encode one chunk into the shared memmap; returns (chunk_no, seconds)."""
+    t0 = time.perf_counter()
+    embs = np.asarray(_model.encode(texts, batch_size=ENCODE_BATCH), dtype=np.float32)
+    out = np.load(partial_path, mmap_mode="r+")
+    out[rows] = embs.astype(np.float16)
+    out.flush()
+    del out
+    return chunk_no, time.perf_counter() - t0
+
+# ---- parent side ----
+
+def _chunks(records_tmp, encode_rows, chunk_size):
+    """(chunk_no, rows, texts) for the rows to encode, read back from records.json.tmp."""
+    wanted = np.zeros(encode_rows[-1] + 1 if len(encode_rows) else 0, dtype=bool)
+    wanted[encode_rows] = True
+    rows, texts, chunk_no = [], [], 0
+    for i, record in enumerate(iter_json_array(records_tmp)):
+        if i >= len(wanted):
+            break
+        if not wanted[i]:
+            continue
+        rows.append(i)
+        texts.append(record["combined_text"])
+        if len(rows) == chunk_size:
+            yield chunk_no, np.array(rows), texts
+            rows, texts, chunk_no = [], [], chunk_no + 1
+    if rows:
+        yield chunk_no, np.array(rows), texts
+
+def _plan_digest(hashes, reuse, chunk_size):
+    digest = hashlib.sha256(model_id().encode())
+    digest.update(hashes.tobytes())
+    digest.update((reuse >= 0).tobytes())
+    digest.update(str(chunk_size).encode())
+    return digest.hexdigest()
+
+def _open_checkpoint(partial_path, plan, shape):
+    """Chunk numbers already written by an interrupted build of the same plan."""
+    state_path = partial_path + ".json"
+    done_path = partial_path + ".done"
+    if os.path.exists(state_path) and os.path.exists(partial_path) and os.path.exists(done_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get("plan") == plan and tuple(state.get("shape", ())) == shape:
+            with open(done_path) as f:
+                done = {int(line) for line in f if line.strip()}
+            print(f"[BUILD] resuming: {len(done)} chunks already encoded")
+            return done
+    np.lib.format.open_memmap(partial_path, mode="w+", dtype=np.float16, shape=shape).flush()
+    open(done_path, "w").close()
+    with open(state_path, "w") as f:
+        json.dump({"plan": plan, "shape": list(shape)}, f)
+    return set()
+
+def _copy_reused(out_dir, partial_path, reuse):
+    rows = np.flatnonzero(reuse >= 0)
+    if not len(rows):
+        return
+    old = np.load(os.path.join(out_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    out = np.load(partial_path, mmap_mode="r+")
+    for start in range(0, len(rows), COPY_BLOCK):
+        block = rows[start:start + COPY_BLOCK]
+        out[block] = old[reuse[block]]
+    out.flush()
+    print(f"[BUILD] reused {len(rows)} embeddings from the previous build")
+
+def build_index(raw_path, out_dir, workers=BUILD_WORKERS, chunk_size=BUILD_CHUNK, full=False):
+    os.makedirs(out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    records_tmp = os.path.join(out_dir, RECORDS_FILE + ".tmp")
+    partial_path = os.path.join(out_dir, EMBEDDINGS_FILE + ".partial")
+
+    hashes = write_records(raw_path, out_dir)
+    n = len(hashes)
+    if not n:
+        raise ValueError(f"No records in {raw_path}")
+    reuse = np.full(n, -1, dtype=np.int64) if full else previous_rows(out_dir, hashes)
+    encode_rows = np.flatnonzero(reuse < 0)
+    print(f"[BUILD] {n} records, {len(encode_rows)} to encode with {workers} workers")
+
+    if not len(encode_rows):
+        # nothing changed: no model load, the previous embeddings are copied in order
+        dim = np.load(os.path.join(out_dir, EMBEDDINGS_FILE), mmap_mode="r").shape[1]
+        _open_checkpoint(partial_path, _plan_digest(hashes, reuse, chunk_size), (n, dim))
+        _copy_reused(out_dir, partial_path, reuse)
+        return _publish_build(out_dir, records_tmp, partial_path, hashes, dim, t0)
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context("spawn")       # no inherited torch / OpenMP state
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(threads,)) as pool:
+        dim = pool.submit(_dimension).result()
+        done = _open_checkpoint(partial_path, _plan_digest(hashes, reuse, chunk_size), (n, dim))
+        _copy_reused(out_dir, partial_path, reuse)
+
+        encoded, pending = len(done), set()
+        total = -(-len(encode_rows) // chunk_size)
+        with open(partial_path + ".done", "a") as checkpoint:
+            for chunk_no, rows, texts in _chunks(records_tmp, encode_rows, chunk_size):
+                if chunk_no in done:
+                    continue
+                # bounded in-flight window: texts are read back lazily, not all held in memory
+                if len(pending) >= 2 * workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    encoded += _record_done(finished, checkpoint, encoded, total)
+                pending.add(pool.submit(_encode_chunk, partial_path, chunk_no, rows, texts))
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                encoded += _record_done(finished, checkpoint, encoded, total)
+    return _publish_build(out_dir, records_tmp, partial_path, hashes, dim, t0)
+
+def _publish_build(out_dir, records_tmp, partial_path, hashes, dim, t0):
+    n = len(hashes)
+    meta_path = os.path.join(out_dir, BUILD_META_FILE)
+    hashes_path = os.path.join(out_dir, HASHES_FILE)
+    # the build meta vouches that embeddings and hashes match: it goes first and comes back
+    # last, so a crash in between leaves no meta and the next run re-embeds instead of
+    # reusing rows by stale hashes
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    np.save(tmp_path(hashes_path, ".npy"), hashes)
+    os.replace(partial_path, os.path.join(out_dir, EMBEDDINGS_FILE))
+    os.replace(tmp_path(hashes_path, ".npy"), hashes_path)
+    with open(tmp_path(meta_path), "w") as f:
+        json.dump({"model": model_id(), "n": n, "dim": dim}, f)
+    os.replace(tmp_path(meta_path), meta_path)
+    # records.json (what search keys staleness on) last
+    os.replace(records_tmp, os.path.join(out_dir, RECORDS_FILE))
+    for suffix in (".json", ".done"):
+        os.remove(partial_path + suffix)
+    print(f"[BUILD] wrote {n} records and embeddings to {out_dir} in {time.perf_counter() - t0:.1f}s")
+    return [os.path.join(out_dir, RECORDS_FILE), os.path.join(out_dir, EMBEDDINGS_FILE)]
+
+def _record_done(finished, checkpoint, encoded, total):
+    for future in finished:
+        chunk_no, seconds = future.result()
+        checkpoint.write(f"{chunk_no}\n")
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+        encoded += 1
+        print(f"[BUILD] chunk {chunk_no} encoded in {seconds:.1f}s ({encoded}/{total})")
+    return len(finished)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build records.json and embeddings_fp16.npy from raw records.")
+    parser.add_argument("raw", help="raw records: JSON array or JSON lines")
+    parser.add_argument("--out-dir", default="data")
+    parser.add_argument("--workers", type=int, default=BUILD_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=BUILD_CHUNK)
+    parser.add_argument("--full", action="store_true", help="re-embed every record")
+    parser.add_argument("--publish", action="store_true", help="publish the result as a snapshot version")
+    args = parser.parse_args()
+    paths = build_index(args.raw, args.out_dir, args.workers, args.chunk_size, args.full)
+    if args.publish:
+        from file_downloader import publish_snapshot
+        publish_snapshot(paths)
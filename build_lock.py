@@ -0,0 +1,38 @@
+"""
+Guards for the indexes derived next to a data version (record store, type
+shards, field index, quantized tiers, BM25).
+
+Every prefork child and service process opens the same snapshot directory,
+and each one polls for new snapshots. build_lock serialises the staleness
+check + build per directory, so the first process builds and the others,
+after waiting, find fresh files and only open them. tmp_path gives each
+builder pid-unique temporary names, so even an unguarded build (a CLI run
+next to a serving process) never writes into another process's tmp file.
+"""
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+LOCK_FILE = ".build.lock"
+
+@contextmanager
+def build_lock(directory):
+    """Exclusive, cross-process lock on `directory`'s derived indexes."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), "a") as f:
+        t0 = time.time()
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"[BUILD] waiting for another process building indexes in {directory}")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            print(f"[BUILD] lock on {directory} acquired after {time.time() - t0:.1f}s")
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def tmp_path(path, suffix=""):
+    """Temporary name for `path` unique to this process (suffix ".npy" for np.save)."""
+    return f"{path}.tmp-{os.getpid()}{suffix}"
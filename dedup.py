@@ -0,0 +1,128 @@
+"""
+Job deduplication for the web tier.
+
+A job is identified by the normalized prompt, the sorted search types, mode,
+output format, structured filters and the data snapshot version. submit() claims that key in
+Redis before enqueuing (SET NX), so of several identical submissions only
+one task runs:
+
+    in flight   later duplicates attach to the running task id
+    done        duplicates within DEDUP_DONE_TTL reuse the finished task
+                and get its S3 result key back, without enqueuing anything;
+                the key is also kept per task id (result_key), so the
+                download still works after Celery's result has expired
+    failed      the key is released; the next submission runs again
+
+Workers report completion with mark_done / release (tasks.py).
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from enrich_cache import normalize_prompt
+
+DEDUP_REDIS_URL = os.getenv("DEDUP_REDIS_URL") or os.getenv("CELERY_BROKER_URL")
+DEDUP_INFLIGHT_TTL = int(os.getenv("DEDUP_INFLIGHT_TTL", str(2 * 3600)))   # bounds a lost worker
+DEDUP_DONE_TTL = int(os.getenv("DEDUP_DONE_TTL", "3600"))
+KEY_PREFIX = "ctic:job:"
+RESULT_PREFIX = "ctic:job_result:"
+VERSION_CHECK_SECONDS = 60
+
+_version = (0.0, None)          # (checked at, snapshot version)
+
+def _redis():
+    import redis
+    return redis.Redis.from_url(DEDUP_REDIS_URL)
+
+def snapshot_version():
+    """Current data snapshot version ("unversioned" without SNAPSHOT_SOURCE), cached briefly."""
+    global _version
+    checked, version = _version
+    if version is None or time.time() - checked > VERSION_CHECK_SECONDS:
+        from file_downloader import get_snapshot_source
+        source = get_snapshot_source()
+        try:
+            version = source.manifest()["version"] if source else "unversioned"
+        except Exception as e:
+            print(f"[DEDUP] snapshot version unavailable: {e}")
+            version = version or "unknown"
+        _version = (time.time(), version)
+    return version
+
+def job_key(prompt, search_types, mode="interactive", output_format="xlsx", version=None, filters=None):
+    """`prompt` may be a list for multi-prompt jobs (never equal to a single-prompt key)."""
+    if isinstance(prompt, (list, tuple)):
+        prompt = [normalize_prompt(p) for p in prompt]
+    else:
+        prompt = normalize_prompt(prompt)
+    parts = [prompt, sorted(set(search_types)), mode, output_format, version or snapshot_version()]
+    if filters:
+        parts.append(filters)
+    raw = json.dumps(parts, sort_keys=True)
+    return KEY_PREFIX + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def submit(prompt, search_types, request_id, mode, output_format, enqueue, filters=None):
+    """
+    Enqueue unless an identical job is running or recently done. `enqueue`
+    is called as enqueue(task_id, dedup_key). Returns (task_id, request_id,
+    status, s3_key) with status "new", "attached" or "reused"; s3_key is the
+    finished job's result for "reused", else None.
+    """
+    key = job_key(prompt, search_types, mode, output_format, filters=filters)
+    task_id = str(uuid.uuid4())
+    entry = {"state": "running", "task_id": task_id, "request_id": request_id}
+    try:
+        r = _redis()
+        claimed = r.set(key, json.dumps(entry), nx=True, ex=DEDUP_INFLIGHT_TTL)
+        existing = None if claimed else r.get(key)
+    except Exception as e:
+        print(f"[DEDUP] unavailable, enqueuing without dedup: {e}")
+        enqueue(task_id, None)
+        return task_id, request_id, "new", None
+    if existing:
+        entry = json.loads(existing)
+        if entry["state"] == "done":
+            return entry["task_id"], entry["request_id"], "reused", entry.get("s3_key")
+        return entry["task_id"], entry["request_id"], "attached", None
+    try:
+        enqueue(task_id, key)
+    except Exception:
+        # never queued: drop the claim so identical submissions do not attach to it
+        try:
+            release(key, task_id)
+        except Exception as e:
+            print(f"[DEDUP] could not release {task_id}: {e}")
+        raise
+    return task_id, request_id, "new", None
+
+def mark_done(key, task_id, s3_key):
+    if not key:
+        return
+    r = _redis()
+    current = r.get(key)
+    if current and json.loads(current)["task_id"] == task_id:
+        entry = dict(json.loads(current), state="done", s3_key=s3_key)
+        pipe = r.pipeline()
+        pipe.set(key, json.dumps(entry), ex=DEDUP_DONE_TTL)
+        pipe.set(RESULT_PREFIX + task_id, s3_key, ex=DEDUP_DONE_TTL)
+        pipe.execute()
+
+def result_key(task_id):
+    """S3 result key of a deduplicated job that finished within DEDUP_DONE_TTL, or None."""
+    try:
+        s3_key = _redis().get(RESULT_PREFIX + task_id)
+    except Exception as e:
+        print(f"[DEDUP] result lookup failed for {task_id}: {e}")
+        return None
+    return s3_key.decode() if s3_key else None
+
+def release(key, task_id):
+    """Forget a failed job so an identical submission runs again."""
+    if not key:
+        return
+    r = _redis()
+    current = r.get(key)
+    if current and json.loads(current)["task_id"] == task_id:
+        r.delete(key)
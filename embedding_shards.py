@@ -0,0 +1,155 @@
+"""
+Per-type contiguous re-export of data/embeddings_fp16.npy.
+
+Rows are grouped by record type so a type selection is a handful of
+contiguous slices of one mmap instead of a fancy-index gather:
+
+    embeddings_by_type_fp16.npy   (n, dim) float16, rows grouped by type
+    shard_ids.npy                 (n,) int64, shard row -> record index
+    type_offsets.json             {type: [start, end]} into the two arrays above
+"""
+import json
+import os
+import numpy as np
+from build_lock import tmp_path
+
+SHARDS_FILE  = "embeddings_by_type_fp16.npy"
+IDS_FILE     = "shard_ids.npy"
+OFFSETS_FILE = "type_offsets.json"
+
+SCAN_BLOCK = int(os.getenv("SCAN_BLOCK_ROWS", "16384"))
+
+def shard_paths(directory):
+    return [os.path.join(directory, f) for f in (SHARDS_FILE, IDS_FILE, OFFSETS_FILE)]
+
+def shards_stale(directory, *sources):
+    """True if any shard file is missing or older than one of `sources`."""
+    paths = shard_paths(directory)
+    if not all(os.path.exists(p) for p in paths):
+        return True
+    newest_source = max(os.path.getmtime(s) for s in sources)
+    return min(os.path.getmtime(p) for p in paths) < newest_source
+
+def build_type_shards(types, embeddings_path, out_dir=None, block=65536):
+    """
+    Re-export `embeddings_path` grouped by `types` (one type per record, in
+    record order). Copies in blocks so peak memory stays at one block.
+    """
+    out_dir = out_dir or os.path.dirname(embeddings_path)
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    types = np.asarray(types)
+    order = np.argsort(types, kind="stable")             # record indices, grouped by type
+
+    shards_path, ids_path, offsets_path = shard_paths(out_dir)
+    tmp_shards = tmp_path(shards_path, ".npy")
+    out = np.lib.format.open_memmap(
+        tmp_shards, mode="w+", dtype=np.float16, shape=embeddings.shape
+    )
+    for start in range(0, len(order), block):
+        rows = order[start:start + block]                 # ascending within a type → mostly sequential
+        out[start:start + len(rows)] = embeddings[rows]
+    out.flush()
+    del out
+
+    offsets = {}
+    sorted_types = types[order]
+    for t in np.unique(sorted_types):
+        lo = int(np.searchsorted(sorted_types, t, side="left"))
+        hi = int(np.searchsorted(sorted_types, t, side="right"))
+        offsets[str(t)] = [lo, hi]
+
+    np.save(tmp_path(ids_path, ".npy"), order.astype(np.int64))
+    with open(tmp_path(offsets_path), "w") as f:
+        json.dump(offsets, f)
+    os.replace(tmp_shards, shards_path)
+    os.replace(tmp_path(ids_path, ".npy"), ids_path)
+    os.replace(tmp_path(offsets_path), offsets_path)
+    print(f"[SHARDS] wrote {len(order)} rows in {len(offsets)} type shards to {out_dir}")
+
+def load_type_shards(directory):
+    """Return (shards mmap, shard_ids mmap, type_offsets dict)."""
+    shards_path, ids_path, offsets_path = shard_paths(directory)
+    with open(offsets_path) as f:
+        offsets = {t: tuple(v) for t, v in json.load(f).items()}
+    return (np.load(shards_path, mmap_mode="r"),
+            np.load(ids_path, mmap_mode="r"),
+            offsets)
+
+def _blocks(ranges, rows, block):
+    """(start, stop) slices over `ranges`, or index arrays of up to `block` of `rows`."""
+    if rows is not None:
+        for start in range(0, len(rows), block):
+            yield rows[start:start + block]
+        return
+    for lo, hi in ranges:
+        for start in range(lo, hi, block):
+            yield slice(start, min(start + block, hi))
+
+def _block_rows(sel):
+    return np.arange(sel.start, sel.stop) if isinstance(sel, slice) else sel
+
+def blocked_topk(matrix, q, k, ranges, block=SCAN_BLOCK, rows=None):
+    """
+    Exact dot-product top-k over the row `ranges` [(start, end), ...] of an
+    fp16 mmap. Each block is upcast into one reusable fp32 buffer and cut down
+    with argpartition, so scratch memory is O(block + k) whatever the corpus
+    size. With `rows` (sorted shard rows, e.g. after a field prefilter) only
+    those rows are gathered and scored, and `ranges` is ignored.
+    Returns (row indices, scores), best first.
+    """
+    q = np.asarray(q, dtype=np.float32).ravel()
+    buf = np.empty((block, matrix.shape[1]), dtype=np.float32)
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+
+    for sel in _blocks(ranges, rows, block):
+        block_rows = _block_rows(sel)
+        m = len(block_rows)
+        np.copyto(buf[:m], matrix[sel])
+        scores = buf[:m] @ q
+        if m > k:
+            keep = np.argpartition(scores, -k)[-k:]
+        else:
+            keep = np.arange(m)
+        best_rows = np.concatenate([best_rows, block_rows[keep]])
+        best_scores = np.concatenate([best_scores, scores[keep]])
+        if len(best_scores) > k:
+            keep = np.argpartition(best_scores, -k)[-k:]
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+    order = np.argsort(best_scores)[::-1]
+    return best_rows[order], best_scores[order]
+
+def blocked_topk_many(matrix, queries, k, ranges, block=SCAN_BLOCK, rows=None):
+    """
+    blocked_topk for a batch of queries in one pass: each block is upcast
+    once and scored against all queries with a single (block × dim) @
+    (dim × n_queries) multiply. Returns [(row indices, scores), ...] per query.
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, matrix.shape[1])
+    nq = len(queries)
+    buf = np.empty((block, matrix.shape[1]), dtype=np.float32)
+    best_rows = [np.empty(0, dtype=np.int64) for _ in range(nq)]
+    best_scores = [np.empty(0, dtype=np.float32) for _ in range(nq)]
+
+    for sel in _blocks(ranges, rows, block):
+        block_rows = _block_rows(sel)
+        m = len(block_rows)
+        np.copyto(buf[:m], matrix[sel])
+        scores = buf[:m] @ queries.T                      # (m, n_queries)
+        if m > k:
+            keep = np.argpartition(scores, -k, axis=0)[-k:]
+        else:
+            keep = np.broadcast_to(np.arange(m)[:, None], (m, nq))
+        for j in range(nq):
+            best_rows[j] = np.concatenate([best_rows[j], block_rows[keep[:, j]]])
+            best_scores[j] = np.concatenate([best_scores[j], scores[keep[:, j], j]])
+            if len(best_scores[j]) > k:
+                top = np.argpartition(best_scores[j], -k)[-k:]
+                best_rows[j], best_scores[j] = best_rows[j][top], best_scores[j][top]
+
+    out = []
+    for rows_j, scores in zip(best_rows, best_scores):
+        order = np.argsort(scores)[::-1]
+        out.append((rows_j[order], scores[order]))
+    return out
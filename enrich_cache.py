@@ -0,0 +1,127 @@
+"""
+Persistent cache of parsed gpt_prompt results.
+
+Keyed by record identity, record type, a hash of the normalized user prompt
+and the prompt-template version, so a template change invalidates old
+entries. Entries expire after ENRICH_CACHE_TTL seconds and the least
+recently used ones are evicted beyond ENRICH_CACHE_MAX_ENTRIES.
+
+Backend: local SQLite (ENRICH_CACHE_PATH) by default, Redis when
+ENRICH_CACHE_URL is set. ENRICH_CACHE=off disables caching.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+CACHE_TTL = int(os.getenv("ENRICH_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("ENRICH_CACHE_MAX_ENTRIES", "100000"))
+CACHE_PATH = os.getenv("ENRICH_CACHE_PATH", "data/enrich_cache.sqlite3")
+
+# fields that identify the entity a record is about, per record type
+IDENTITY_FIELDS = {
+    "company": ("company",),
+    "deal": ("acquirer", "acquired_company"),
+}
+
+def normalize_prompt(prompt):
+    """Lowercase, drop punctuation and collapse whitespace so near-identical prompts match."""
+    prompt = re.sub(r"[^\w\s]", " ", (prompt or "").lower())
+    return " ".join(prompt.split())
+
+def record_identity(record):
+    fields = IDENTITY_FIELDS.get(record.get("type"), ("company",))
+    return "|".join(" ".join(str(record.get(f) or "").lower().split()) for f in fields)
+
+def cache_key(record, prompt, template_version):
+    prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()[:16]
+    raw = f"{record.get('type')}|{record_identity(record)}|{prompt_hash}|v{template_version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class SQLiteCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl, self.max_entries = ttl, max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS enrich_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS enrich_cache_lru ON enrich_cache(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM enrich_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM enrich_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE enrich_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO enrich_cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._conn.execute("DELETE FROM enrich_cache WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM enrich_cache WHERE key IN ("
+                " SELECT key FROM enrich_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+class RedisCache:
+    PREFIX = "enrich_cache:"
+    LRU_KEY = "enrich_cache:lru"        # zset of key → last access time
+
+    def __init__(self, url, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        import redis
+        self.ttl, self.max_entries = ttl, max_entries
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._redis.get(self.PREFIX + key)
+        if value is None:
+            return None
+        self._redis.zadd(self.LRU_KEY, {key: time.time()})
+        return json.loads(value)
+
+    def set(self, key, value):
+        pipe = self._redis.pipeline()
+        pipe.set(self.PREFIX + key, json.dumps(value), ex=self.ttl)
+        pipe.zadd(self.LRU_KEY, {key: time.time()})
+        pipe.zremrangebyscore(self.LRU_KEY, 0, time.time() - self.ttl)
+        pipe.zcard(self.LRU_KEY)
+        size = pipe.execute()[-1]
+        if size > self.max_entries:
+            evicted = [k.decode() for k, _ in self._redis.zpopmin(self.LRU_KEY, size - self.max_entries)]
+            if evicted:
+                self._redis.delete(*(self.PREFIX + k for k in evicted))
+
+@lru_cache(maxsize=1)
+def get_cache():
+    """The configured cache backend, or None when caching is disabled."""
+    if os.getenv("ENRICH_CACHE", "").lower() in ("0", "off", "false"):
+        return None
+    url = os.getenv("ENRICH_CACHE_URL")
+    if url:
+        return RedisCache(url)
+    return SQLiteCache()
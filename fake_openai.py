@@ -0,0 +1,134 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+Answers POST /v1/chat/completions with a JSON enrichment shaped like the
+real model's, sends x-ratelimit-* headers and can inject latency and 429s:
+
+    python fake_openai.py --port 8089 --latency 1.5 --rpm 120 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake ...
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPANY_KEYS = ["Company", "Asset", "Asset Target", "Asset Type", "Modality", "Disease",
+                "Global Highest Phase", "Indication", "Mechanism/Technology"]
+DEAL_KEYS = ["Acquirer", "Target Company", "Deal Type", "Deal Value", "Payment Structure",
+             "Financial Advisors", "Announcement Date", "Deal Terms", "Strategic Rationale",
+             "Additional Details"]
+
+class FakeOpenAI:
+    """Shared state of one fake server: latency, rate limit and counters."""
+
+    def __init__(self, latency=0.0, jitter=0.5, rpm=0, error_rate=0.0):
+        self.latency, self.jitter = latency, jitter
+        self.rpm, self.error_rate = rpm, error_rate
+        self.requests = 0
+        self.throttled = 0
+        self._window = []                     # request timestamps in the last minute
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """(allowed, remaining, reset seconds) under the sliding-window rpm limit."""
+        now = time.time()
+        with self._lock:
+            self.requests += 1
+            self._window = [t for t in self._window if now - t < 60]
+            if self.rpm and len(self._window) >= self.rpm:
+                self.throttled += 1
+                return False, 0, max(60 - (now - self._window[0]), 0.05)
+            if random.random() < self.error_rate:
+                self.throttled += 1
+                return False, 0, 1.0
+            self._window.append(now)
+            remaining = self.rpm - len(self._window) if self.rpm else 10000
+            return True, remaining, 60.0
+
+    def answer(self, messages):
+        text = " ".join(m.get("content", "") for m in messages)
+        if "deal analysis" in text:
+            keys = DEAL_KEYS
+            m = re.search(r'deal involving "([^"]*)" and "([^"]*)"', text)
+            first = {"Acquirer": m.group(1), "Target Company": m.group(2)} if m else {}
+        else:
+            keys = COMPANY_KEYS
+            m = re.search(r'For the company "([^"]*)"', text)
+            first = {"Company": m.group(1)} if m else {}
+        data = {k: first.get(k, f"fake {k.lower()}") for k in keys}
+        return "```json\n" + json.dumps(data) + "\n```", len(text.split())
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, headers):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}}, {})
+
+            allowed, remaining, reset = state.admit()
+            headers = {
+                "x-ratelimit-limit-requests": str(state.rpm or 10000),
+                "x-ratelimit-remaining-requests": str(remaining),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            }
+            if not allowed:
+                headers["retry-after"] = f"{reset:.3f}"
+                return self._send(429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                                  "code": "rate_limit_exceeded"}}, headers)
+
+            if state.latency:
+                time.sleep(max(0.0, random.gauss(state.latency, state.latency * state.jitter)))
+            content, prompt_tokens = state.answer(body.get("messages", []))
+            completion_tokens = len(content.split())
+            self._send(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }, headers)
+
+    return Handler
+
+def serve(port=8089, host="127.0.0.1", **options):
+    """Start a fake server in a daemon thread; returns (server, state)."""
+    state = FakeOpenAI(**options)
+    server = ThreadingHTTPServer((host, port), _make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds per completion")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a random 429")
+    args = parser.parse_args()
+    server, _ = serve(args.port, latency=args.latency, rpm=args.rpm, error_rate=args.error_rate)
+    print(f"Fake OpenAI listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,183 @@
+"""
+Structured-field prefilter indexes over the record store, built next to it:
+
+    fields_meta.json        {"n", "categorical": {field: {...}}, "range": {field: {...}}}
+    fields_bitmaps.npy      (values, ceil(n / 8)) uint8, one packed bitmap per
+                            categorical value (phase, country, therapeutic area, ...)
+    fields_r<i>_values.npy  sorted float64 values of range field i (numbers, or
+                            dates as days since 1970-01-01)
+    fields_r<i>_ids.npy     record index of each sorted value
+
+Fields are classified at build time: mostly dates → date range, mostly
+numbers ("$1.2B" included) → number range, otherwise categorical when it has
+at most FIELD_INDEX_MAX_VALUES distinct values (list values and "a; b, c"
+strings count each element). Free text (combined_text, titles) is skipped.
+
+Filters are {field: value | [values] | {"min": ..., "max": ...}}: values of
+one field are OR-ed, fields are AND-ed; a plain value on a range field is an
+exact match (a bare year on a date field: that year). A filter only constrains the record
+types that carry the field, so a Phase filter narrows trials and leaves
+companies and deals alone. Filters on fields that are not indexed are
+ignored with a log line.
+"""
+import json
+import os
+import re
+import numpy as np
+
+from record_store import META_FILE as RECORDS_META_FILE
+from build_lock import tmp_path
+from field_values import parse_date, parse_number, parse_bound
+
+FIELDS_META_FILE = "fields_meta.json"
+BITMAPS_FILE = "fields_bitmaps.npy"
+FIELD_INDEX_MAX_VALUES = int(os.getenv("FIELD_INDEX_MAX_VALUES", "256"))
+SKIP_FIELDS = {"combined_text"}
+PARSED_SHARE = 0.95             # share of a field's values that must parse as date / number
+
+_SPLIT = re.compile(r"\s*[;,|]\s*")
+
+def _range_paths(directory, i):
+    base = os.path.join(directory, f"fields_r{i}")
+    return base + "_values.npy", base + "_ids.npy"
+
+def fields_stale(directory):
+    meta = os.path.join(directory, FIELDS_META_FILE)
+    return (not os.path.exists(meta)
+            or os.path.getmtime(meta) < os.path.getmtime(os.path.join(directory, RECORDS_META_FILE)))
+
+def normalize_value(value):
+    return " ".join(str(value).lower().split())
+
+def _categories(value):
+    values = value if isinstance(value, list) else _SPLIT.split(str(value))
+    return {normalize_value(v) for v in values if str(v).strip()}
+
+def build_field_index(store, directory):
+    """Classify and index every field of `store` (a RecordStore) in one pass per field."""
+    n = len(store)
+    meta = {"n": n, "categorical": {}, "range": {}}
+    bitmaps = []
+    written = []            # arrays saved under tmp names; swapped in together at the end
+    for field in store.fields:
+        if field in SKIP_FIELDS:
+            continue
+        dates, numbers, categories = [], [], {}
+        present, codes = 0, set()
+        for i in range(n):
+            if not store.has_field(i, field):
+                continue
+            value = store.field(i, field)
+            present += 1
+            codes.add(int(store.type_codes[i]))
+            d = parse_date(value) if isinstance(value, str) else None
+            x = parse_number(value)
+            if d is not None:
+                dates.append((d, i))
+            if x is not None:
+                numbers.append((x, i))
+            if categories is not None:
+                for category in _categories(value):
+                    categories.setdefault(category, []).append(i)
+                if len(categories) > FIELD_INDEX_MAX_VALUES:
+                    categories = None          # free text; only a range index can still apply
+        if not present:
+            continue
+        types = sorted(store.type_names[c] for c in codes)
+        if len(dates) >= PARSED_SHARE * present or len(numbers) >= PARSED_SHARE * present:
+            kind, pairs = ("date", dates) if len(dates) >= PARSED_SHARE * present else ("number", numbers)
+            pairs.sort()
+            r = len(meta["range"])
+            values_path, ids_path = _range_paths(directory, r)
+            np.save(tmp_path(values_path, ".npy"), np.array([v for v, _ in pairs], dtype=np.float64))
+            np.save(tmp_path(ids_path, ".npy"), np.array([i for _, i in pairs], dtype=np.int64))
+            written += [values_path, ids_path]
+            meta["range"][field] = {"file": r, "kind": kind, "types": types}
+        elif categories is not None:
+            meta["categorical"][field] = {"row": len(bitmaps), "values": sorted(categories),
+                                          "types": types}
+            for category in sorted(categories):
+                mask = np.zeros(n, dtype=bool)
+                mask[categories[category]] = True
+                bitmaps.append(np.packbits(mask))
+    bitmaps_path = os.path.join(directory, BITMAPS_FILE)
+    np.save(tmp_path(bitmaps_path, ".npy"),
+            np.stack(bitmaps) if bitmaps else np.zeros((0, (n + 7) // 8), dtype=np.uint8))
+    written.append(bitmaps_path)
+    meta_path = os.path.join(directory, FIELDS_META_FILE)
+    with open(tmp_path(meta_path), "w") as f:
+        json.dump(meta, f)
+    # renamed, never truncated: open memory maps keep the previous version's files
+    for path in written:
+        os.replace(tmp_path(path, ".npy"), path)
+    # meta last: its mtime marks the index as complete
+    os.replace(tmp_path(meta_path), meta_path)
+    print(f"[FIELDS] indexed {len(meta['categorical'])} categorical and {len(meta['range'])} "
+          f"range fields over {n} records in {directory}")
+
+class FieldIndex:
+    def __init__(self, directory, type_codes, type_names):
+        with open(os.path.join(directory, FIELDS_META_FILE)) as f:
+            meta = json.load(f)
+        self.n = meta["n"]
+        self.categorical = meta["categorical"]
+        self.range = meta["range"]
+        self.bitmaps = np.load(os.path.join(directory, BITMAPS_FILE), mmap_mode="r")
+        self._ranges = {field: tuple(np.load(p, mmap_mode="r") for p in _range_paths(directory, spec["file"]))
+                        for field, spec in self.range.items()}
+        self._type_codes = type_codes
+        self._type_names = type_names
+
+    def fields(self):
+        """{field: "categorical" | "date" | "number"}"""
+        out = {field: "categorical" for field in self.categorical}
+        out.update({field: spec["kind"] for field, spec in self.range.items()})
+        return out
+
+    def _field_mask(self, field, condition):
+        mask = np.zeros(self.n, dtype=bool)
+        if field in self.categorical:
+            spec = self.categorical[field]
+            wanted = condition if isinstance(condition, list) else [condition]
+            for value in wanted:
+                value = normalize_value(value)
+                if value in spec["values"]:
+                    row = self.bitmaps[spec["row"] + spec["values"].index(value)]
+                    mask |= np.unpackbits(row, count=self.n).view(bool)
+        else:
+            if isinstance(condition, dict):
+                self._range_mask(mask, field, condition)
+            else:
+                # plain values (the form sends a list): exact-match ranges
+                for value in condition if isinstance(condition, list) else [condition]:
+                    try:
+                        self._range_mask(mask, field, {"min": value, "max": value})
+                    except ValueError as e:
+                        print(f"[FIELDS] {field}: {e}; matches nothing")
+        return mask
+
+    def _range_mask(self, mask, field, condition):
+        kind = self.range[field]["kind"]
+        values, ids = self._ranges[field]
+        lo = 0 if condition.get("min") in (None, "") else \
+            np.searchsorted(values, parse_bound(kind, condition["min"]), side="left")
+        hi = len(values) if condition.get("max") in (None, "") else \
+            np.searchsorted(values, parse_bound(kind, condition["max"], upper=True), side="right")
+        mask[ids[lo:hi]] = True
+
+    def mask(self, filters):
+        """Boolean mask over record indices for `filters`, or None when nothing applies."""
+        mask = None
+        for field, condition in (filters or {}).items():
+            if field in self.categorical:
+                types = self.categorical[field]["types"]
+            elif field in self.range:
+                types = self.range[field]["types"]
+            else:
+                print(f"[FIELDS] no index for filter field {field!r}; ignored")
+                continue
+            # types that never carry the field are not constrained by it
+            other = [c for c, t in enumerate(self._type_names) if t not in types]
+            field_mask = self._field_mask(field, condition) | np.isin(self._type_codes, other)
+            mask = field_mask if mask is None else mask & field_mask
+        return mask
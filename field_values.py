@@ -0,0 +1,60 @@
+"""
+Field value parsing shared by field_index.py (index build and filter masks
+on the workers) and app.form_filters (bound validation in the web tier, so
+no numpy here).
+"""
+import datetime
+import re
+
+_DATE = re.compile(r"^\d{4}-\d{2}(-\d{2})?")      # bare years index as numbers
+_NUMBER = re.compile(r"^\$?\s*(-?[\d,]*\.?\d+)\s*(k|m|mm|b|bn)?$", re.IGNORECASE)
+_SCALE = {"k": 1e3, "m": 1e6, "mm": 1e6, "b": 1e9, "bn": 1e9}
+_EPOCH = datetime.date(1970, 1, 1)
+
+def parse_date(value):
+    """Days since 1970-01-01 for "YYYY-MM" or "YYYY-MM-DD..." values, else None."""
+    match = _DATE.match(str(value).strip())
+    if not match:
+        return None
+    parts = [int(p) for p in match.group(0).split("-")]
+    try:
+        return float((datetime.date(*parts, *([1] * (3 - len(parts)))) - _EPOCH).days)
+    except ValueError:
+        return None
+
+def parse_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = _NUMBER.match(str(value).strip())
+    if not match:
+        return None
+    return float(match.group(1).replace(",", "")) * _SCALE.get((match.group(2) or "").lower(), 1)
+
+def parse_bound(kind, value, upper=False):
+    """A filter bound of a "date" or "number" field; raises ValueError when it does not parse."""
+    if kind == "date" and re.fullmatch(r"\d{4}", str(value).strip()):
+        value = f"{str(value).strip()}-{'12-31' if upper else '01-01'}"     # a bare year covers the year
+    parsed = parse_date(value) if kind == "date" else parse_number(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {kind} bound: {value!r}")
+    return parsed
+
+def bound_error(field, bounds):
+    """
+    Message for a {"min", "max"} filter the index could not apply (neither
+    bound parses as a date or number, or min > max), else None. The field's
+    kind is only known to the index, so either kind is accepted here.
+    """
+    parsed = {}
+    for kind in ("date", "number"):
+        try:
+            parsed[kind] = [parse_bound(kind, bounds[b], upper=(b == "max")) if bounds.get(b) else None
+                            for b in ("min", "max")]
+        except ValueError:
+            continue
+    if not parsed:
+        return (f"{field}: bounds must be numbers (e.g. 100M, $2B) or dates (YYYY, YYYY-MM, YYYY-MM-DD); "
+                f"got {', '.join(str(v) for v in bounds.values())}")
+    if all(lo is not None and hi is not None and lo > hi for lo, hi in parsed.values()):
+        return f"{field}: minimum {bounds['min']} is above maximum {bounds['max']}"
+    return None
@@ -1,5 +1,10 @@
 import os
 import boto3
+import hashlib
+import json
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 S3_BUCKET = os.environ.get('S3_BUCKET_NAME')
@@ -31,4 +36,218 @@ def download_files_from_s3():
             s3.download_file(S3_BUCKET, KEY, FILE_PATH)
             print(f"File {FILE_PATH} downloaded successfully.")
         else:
-            print(f"Local file {FILE_PATH} already exists.")
\ No newline at end of file
+            print(f"Local file {FILE_PATH} already exists.")
+
+# ---- versioned snapshots ----
+#
+# SNAPSHOT_SOURCE (s3://bucket/prefix or a local directory) holds
+#
+#     manifest.json            {"version", "created", "files": {name: {"size", "sha256"}}}
+#     <version>/<name>         records.json, embeddings_fp16.npy, optional ann_*.npy
+#
+# manifest.json is written last by publish_snapshot, so it always names a
+# complete version. sync_snapshot downloads a new version with parallel
+# ranged GETs into a staging directory, verifies the checksums and renames
+# it into data/snapshots/<version>; search swaps to it without a restart.
+# With SNAPSHOT_SOURCE unset, download_files_from_s3 above is used as before.
+
+SNAPSHOT_SOURCE = os.environ.get('SNAPSHOT_SOURCE')
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'data/snapshots')
+SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', '2'))                  # local versions kept
+RANGE_BYTES = int(os.environ.get('SNAPSHOT_RANGE_MB', '16')) * 1024**2
+DOWNLOAD_WORKERS = int(os.environ.get('SNAPSHOT_DOWNLOAD_WORKERS', '8'))
+MANIFEST_FILE = 'manifest.json'
+RECORDS_FILE = os.path.basename(RECORDS_PATH)
+EMBEDDINGS_FILE = os.path.basename(EMBEDDINGS_PATH)
+
+class LocalSnapshotSource:
+    def __init__(self, root):
+        self.root = root
+
+    def manifest(self):
+        with open(os.path.join(self.root, MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    def read_range(self, version, name, start, end):
+        """Yield the bytes [start, end) of a snapshot file in chunks."""
+        with open(os.path.join(self.root, version, name), 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                chunk = f.read(min(remaining, 1 << 20))
+                if not chunk:
+                    raise IOError(f"{name}: short read at {end - remaining}")
+                remaining -= len(chunk)
+                yield chunk
+
+    def put(self, name, path):
+        dest = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest + '.tmp')
+        os.replace(dest + '.tmp', dest)
+
+class S3SnapshotSource:
+    def __init__(self, bucket, prefix=''):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.s3 = boto3.client('s3')
+
+    def _key(self, *parts):
+        return '/'.join(p for p in (self.prefix, *parts) if p)
+
+    def manifest(self):
+        obj = self.s3.get_object(Bucket=self.bucket, Key=self._key(MANIFEST_FILE))
+        return json.loads(obj['Body'].read())
+
+    def read_range(self, version, name, start, end):
+        obj = self.s3.get_object(Bucket=self.bucket, Key=self._key(version, name),
+                                 Range=f'bytes={start}-{end - 1}')
+        yield from obj['Body'].iter_chunks(1 << 20)
+
+    def put(self, name, path):
+        self.s3.upload_file(path, self.bucket, self._key(name))
+
+def get_snapshot_source(location=None):
+    """Source for `location` (default SNAPSHOT_SOURCE); None when snapshots are off."""
+    location = location or SNAPSHOT_SOURCE
+    if not location:
+        return None
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3SnapshotSource(bucket, prefix)
+    return LocalSnapshotSource(location)
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _download(source, version, name, size, dest):
+    """Fetch one file as parallel ranged reads written in place with pwrite."""
+    with open(dest, 'wb') as f:
+        f.truncate(size)
+    fd = os.open(dest, os.O_WRONLY)
+    try:
+        def fetch(start):
+            pos = start
+            for chunk in source.read_range(version, name, start, min(start + RANGE_BYTES, size)):
+                os.pwrite(fd, chunk, pos)
+                pos += len(chunk)
+            return pos - start
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            fetched = sum(pool.map(fetch, range(0, size, RANGE_BYTES)))
+    finally:
+        os.close(fd)
+    if fetched != size:
+        raise IOError(f"{name}: got {fetched} of {size} bytes")
+
+def snapshot_path(version):
+    return os.path.join(SNAPSHOT_DIR, version)
+
+def current_snapshot():
+    """Version last activated on this host, or None."""
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _set_current(version):
+    path = os.path.join(SNAPSHOT_DIR, 'CURRENT')
+    with open(path + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(path + '.tmp', path)
+
+def _prune(keep):
+    """Delete all but the `keep` newest local versions (never the current one)."""
+    versions = [v for v in os.listdir(SNAPSHOT_DIR)
+                if os.path.isfile(os.path.join(SNAPSHOT_DIR, v, MANIFEST_FILE))]
+    versions.sort(key=lambda v: os.path.getmtime(os.path.join(SNAPSHOT_DIR, v, MANIFEST_FILE)))
+    current = current_snapshot()
+    for version in versions[:-keep]:
+        if version != current:
+            # processes still serving it keep their mmaps; unlinked files stay readable
+            shutil.rmtree(snapshot_path(version), ignore_errors=True)
+            print(f"[SNAPSHOT] pruned {version}")
+
+def sync_snapshot(source=None):
+    """
+    Make the source's current version available locally and return
+    (version, directory). Files are verified against the manifest checksums
+    before the staging directory is renamed into place.
+    """
+    source = source or get_snapshot_source()
+    manifest = source.manifest()
+    version = manifest['version']
+    final = snapshot_path(version)
+    if not os.path.isfile(os.path.join(final, MANIFEST_FILE)):
+        staging = os.path.join(SNAPSHOT_DIR, f'.staging-{version}-{os.getpid()}')
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        t0 = time.time()
+        try:
+            for name, meta in manifest['files'].items():
+                dest = os.path.join(staging, name)
+                _download(source, version, name, meta['size'], dest)
+                if _sha256(dest) != meta['sha256']:
+                    raise IOError(f"checksum mismatch for {name} in snapshot {version}")
+            # one shared mtime, so the staleness checks of derived indexes
+            # (ANN files vs embeddings) don't depend on download order
+            for name in manifest['files']:
+                os.utime(os.path.join(staging, name), (manifest['created'], manifest['created']))
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f)
+            try:
+                os.rename(staging, final)
+            except OSError:
+                if not os.path.isfile(os.path.join(final, MANIFEST_FILE)):
+                    raise
+                # another process on this host finished the same version first
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        total = sum(m['size'] for m in manifest['files'].values())
+        print(f"[SNAPSHOT] downloaded {version} ({total / 1024**2:.1f} MB) in {time.time() - t0:.1f}s")
+    _set_current(version)
+    _prune(max(SNAPSHOT_KEEP, 1))
+    return version, final
+
+def latest_snapshot_version(source=None):
+    return (source or get_snapshot_source()).manifest()['version']
+
+def publish_snapshot(paths, location=None, version=None):
+    """Upload `paths` as a new version, then point the manifest at it."""
+    source = get_snapshot_source(location)
+    version = version or time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    files = {}
+    for path in paths:
+        name = os.path.basename(path)
+        files[name] = {'size': os.path.getsize(path), 'sha256': _sha256(path)}
+        source.put(f'{version}/{name}', path)
+    manifest = {'version': version, 'created': time.time(), 'files': files}
+    tmp = os.path.join(SNAPSHOT_DIR, f'.manifest-{os.getpid()}.json')
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    try:
+        source.put(MANIFEST_FILE, tmp)
+    finally:
+        os.remove(tmp)
+    print(f"[SNAPSHOT] published {version} with {', '.join(files)}")
+    return version
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Publish or fetch versioned data snapshots.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    pub = sub.add_parser('publish', help="upload files as a new snapshot version")
+    pub.add_argument('paths', nargs='+')
+    pub.add_argument('--to', default=SNAPSHOT_SOURCE, required=not SNAPSHOT_SOURCE)
+    pub.add_argument('--version', default=None)
+    sub.add_parser('sync', help="download the current version from SNAPSHOT_SOURCE")
+    args = parser.parse_args()
+    if args.command == 'publish':
+        publish_snapshot(args.paths, args.to, args.version)
+    else:
+        print(sync_snapshot())
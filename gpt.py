@@ -1,17 +1,26 @@
-import pandas as pd
 from openai import OpenAI
 import json
 import time
 import os
 import re
-import io
-import base64
 import concurrent.futures
+import contextvars
+import uuid
+from enrich_cache import get_cache, cache_key
+from result_writer import get_writer, EXPECTED_COLUMNS
+from prompt_compaction import group_entities
+from metrics import span, record_gpt_usage, GPT_ATTEMPTS
 
 client = OpenAI(
     api_key = os.environ.get("OPENAI_API_KEY")
 )
 
+# "async" (adaptive-concurrency asyncio engine, see gpt_async.py) or "threads"
+ENRICH_ENGINE = os.getenv("ENRICH_ENGINE", "async")
+
+# Bump whenever build_prompt's templates change so cached enrichments are not reused.
+PROMPT_TEMPLATE_VERSION = 1
+
 # Define the detailed prompt template for the GPT model.
 # The prompt instructs the model to search for the following fields:
 # Company, Asset, Asset Target, Asset Type, Modality, Disease, Global Highest Phase, Indication, Mechanism/Technology.
@@ -98,39 +107,20 @@ def extract_json_and_source(text):
     
     return data
 
-# Function to call the GPT model and parse the returned JSON.
-def gpt_prompt(record, prompt, max_retries=3):
-    company_name = record["company"]
-    prompt = build_prompt(record, prompt)
-    
+GPT_MODEL = "gpt-4o-search-preview"
+WEB_SEARCH_OPTIONS = {"search_context_size": "high"}
+
+def build_messages(record, prompt):
     # Set up the conversation for ChatCompletion (if using a chat-based model)
-    messages = [
+    return [
         {"role": "system", "content": "You are a research assistant that extracts specific information in JSON format."},
-        {"role": "user", "content": prompt}
+        {"role": "user", "content": build_prompt(record, prompt)}
     ]
-    
-    for attempt in range(max_retries):
-        if os.getenv("DRY_RUN"):
-            break
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o-search-preview",
-                web_search_options={
-                    "search_context_size": "high",
-                },
-                messages=messages
-            )
-            # Extract the assistant's message
-            content = response.choices[0].message.content.strip()
-            data = extract_json_and_source(content)
-            print(data)
-            return data
-        except Exception as e:
-            print(f"Error processing {company_name} on attempt {attempt+1}: {e}")
-            time.sleep(2)  # wait before retrying
-    # If all retries fail, return a dictionary with null values
+
+def empty_result(record):
+    """Result used when enrichment fails: every field null."""
     return {
-        "Company": company_name,
+        "Company": record.get("company", None),
         "Asset": None,
         "Asset Target": None,
         "Asset Type": None,
@@ -141,112 +131,214 @@ def gpt_prompt(record, prompt, max_retries=3):
         "Mechanism/Technology": None
     }
 
-def enrich(records, prompt, progress_cb=None):
-    """
-    Enriches a list of records concurrently and returns an Excel file
-    (as a Base64-encoded string) with one sheet per search type.
-    The search type is taken from record["type"] (e.g., "company", "deal", "asset").
-    """
-    # Define expected columns per record type
-    EXPECTED_COLUMNS = {
-        "deal": [
-            "Acquirer", "Target Company", "Deal Type", "Deal Value",
-            "Payment Structure", "Financial Advisors", "Announcement Date",
-            "Deal Terms", "Strategic Rationale", "Additional Details"
-        ],
-        "company": [
-            "Company", "Asset", "Asset Target", "Asset Type",
-            "Modality", "Disease", "Global Highest Phase",
-            "Indication", "Mechanism/Technology"
-        ],
-        "trial": [
-            "BriefTitle", "NCTId", "TherapeuticArea", "StudyType", "Disease",
-            "Interventions", "Phase", "Sponsor", "Countries"
-        ]
-        # Add "asset": [...] here if needed
-    }
-
-    search_type_data = {}
-    max_workers = 5
-
-    # Separate gpt-needed records and process non-gpts concurrently
-    non_gpt_records = [r for r in records if r.get("type") not in ("trial","award", "asset")]
-    trial_records = [r for r in records if r.get("type") == "trial"]
-    award_records = [r for r in records if r.get("type") == "award"]
-    asset_records = [r for r in records if r.get("type") == "asset"]
-    total = len(non_gpt_records)
-
-    # Save cleaned trial and award records immediately (no GPT)
-    for record in trial_records:
-        clean_record = {k: v for k, v in record.items() if k not in ("type", "combined_text")}
-        search_type_data.setdefault("trial", []).append(clean_record)
-    for record in award_records:
-        clean = {k:v for k,v in record.items() if k not in ("type","combined_text")}
-        search_type_data.setdefault("award", []).append(clean)
-    for record in asset_records:
-        clean = {k:v for k,v in record.items() if k not in ("type","combined_text")}
-        search_type_data.setdefault("asset", []).append(clean)
+# Function to call the GPT model and parse the returned JSON.
+def gpt_prompt(record, prompt, max_retries=3):
+    company_name = record["company"]
+    cache = get_cache()
+    key = cache_key(record, prompt, PROMPT_TEMPLATE_VERSION)
+    messages = build_messages(record, prompt)
+    
+    with span("gpt_call", engine="threads") as attrs:
+        for attempt in range(max_retries):
+            if os.getenv("DRY_RUN"):
+                break
+            attrs["attempts"] = attempt + 1
+            try:
+                response = client.chat.completions.create(
+                    model=GPT_MODEL,
+                    web_search_options=WEB_SEARCH_OPTIONS,
+                    messages=messages
+                )
+                GPT_ATTEMPTS.labels("ok").inc()
+                record_gpt_usage(attrs, getattr(response, "usage", None))
+                # Extract the assistant's message
+                content = response.choices[0].message.content.strip()
+                data = extract_json_and_source(content)
+                print(data)
+                if cache is not None:
+                    cache.set(key, data)
+                return data
+            except Exception as e:
+                GPT_ATTEMPTS.labels("error").inc()
+                print(f"Error processing {company_name} on attempt {attempt+1}: {e}")
+                time.sleep(2)  # wait before retrying
+        # If all retries fail, return a dictionary with null values
+        attrs["failed"] = 1
+        return empty_result(record)
 
+def _enrich_threaded(records, prompt, on_result, max_workers):
+    """Fixed-size thread pool engine; on_result(record, result) runs in the caller's thread."""
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         future_to_record = {
-            executor.submit(gpt_prompt, record, prompt): record 
-            for record in non_gpt_records
+            # each call in a copy of this context, so its span joins the task's trace
+            executor.submit(contextvars.copy_context().run, gpt_prompt, record, prompt): record
+            for record in records
         }
-        completed = 0
         for future in concurrent.futures.as_completed(future_to_record):
             record = future_to_record[future]
-            print("TYPE ", type(record))
             try:
                 result = future.result()
             except Exception as exc:
                 print(f"{record} generated an exception: {exc}")
-                result = {
-                    "Company": record.get("company", None),
-                    "Asset": None,
-                    "Asset Target": None,
-                    "Asset Type": None,
-                    "Modality": None,
-                    "Disease": None,
-                    "Global Highest Phase": None,
-                    "Indication": None,
-                    "Mechanism/Technology": None
-                }
-            record_type = record.get("type", "Unknown")
-            result["type"] = record_type
-
-            if record_type not in search_type_data:
-                search_type_data[record_type] = []
-            search_type_data[record_type].append(result)
+                result = empty_result(record)
+            on_result(record, result)
+
+PASSTHROUGH_TYPES = ("trial", "award", "asset")      # written as-is, no GPT call
 
+def open_writer(records, output_format="xlsx", writer=None, prompt=None):
+    """
+    Result writer with the trial, award and asset records already written.
+    Pass `writer` to add to an open one; with `prompt`, rows get a leading
+    "Prompt" column (multi-prompt jobs share one file).
+    """
+    writer = writer or get_writer(output_format)
+    lead = ["Prompt"] if prompt is not None else []
+    for st in PASSTHROUGH_TYPES:
+        cleaned = [
+            {**({"Prompt": prompt} if lead else {}),
+             **{k: v for k, v in r.items() if k not in ("type", "combined_text")}}
+            for r in records if r.get("type") == st
+        ]
+        if not cleaned:
+            continue
+        if st not in writer.columns:
+            present = list(dict.fromkeys(k for row in cleaned for k in row))
+            expected = EXPECTED_COLUMNS.get(st)
+            writer.add_sheet(st, lead + [c for c in expected if c in present] if expected else present)
+        for row in cleaned:
+            writer.write_row(st, row)
+    return writer
+
+def write_result(writer, record_type, result, prompt=None):
+    if prompt is not None:
+        result = {"Prompt": prompt, **result}
+    if record_type not in writer.columns:
+        expected = EXPECTED_COLUMNS.get(record_type)
+        lead = ["Prompt"] if prompt is not None else []
+        writer.add_sheet(record_type, lead + expected if expected else list(result))
+    writer.write_row(record_type, result)
+
+def enrich_results(records, prompt, on_result, progress_cb=None, mode="interactive", job_id=None):
+    """
+    GPT-enrich `records` (all GPT-backed), calling on_result(record, result)
+    as each completes. Cache hits are served first without a GPT call; the
+    misses are grouped by entity (one call each, result fanned out to every
+    member) with combined_text trimmed to the token budget (see
+    prompt_compaction.py). progress_cb(completed, total, cache_hits=...)
+    follows along per record. A retried batch job (same job_id) passes the
+    same records in the same order.
+    """
+    max_workers = 5
+    total = len(records)
+    started = time.time()
+
+    # Serve cache hits first; only misses go to GPT
+    cache = get_cache()
+    cache_hits = 0
+    gpt_records = []
+    pending = {}                                    # id(record) → position in `records`, for the misses
+    for position, record in enumerate(records):
+        cached = cache.get(cache_key(record, prompt, PROMPT_TEMPLATE_VERSION)) if cache else None
+        if cached is None:
+            gpt_records.append(record)
+            pending[id(record)] = position
+        else:
+            cache_hits += 1
+            on_result(record, cached)
+    completed = cache_hits
+    if progress_cb:
+        progress_cb(completed, total, cache_hits=cache_hits)
+
+    # One call per entity on compacted text. "_members" (positions in `records`)
+    # survives batch checkpoints: a retried batch job fans out the checkpointed
+    # representatives even though its cache misses, hence groups, may differ now
+    tokens = {}
+    groups = group_entities(gpt_records, prompt, stats=tokens)
+    for representative, members in groups:
+        representative["_members"] = [pending[id(m)] for m in members]
+    calls = [representative for representative, _ in groups]
+    pending = set(pending.values())
+
+    def on_gpt_result(representative, result):
+        nonlocal completed
+        for position in representative["_members"]:
+            if position not in pending:             # served from the cache on this attempt
+                continue
+            pending.discard(position)
+            on_result(records[position], result)
             completed += 1
             if progress_cb:
-                progress_cb(completed, total)
-
-    search_type_dataframes = {}
-    for st, data in search_type_data.items():
-        df = pd.DataFrame(data)
-        expected_cols = EXPECTED_COLUMNS.get(st)
-        if expected_cols:
-            df = df[[col for col in expected_cols if col in df.columns]]
-        # Final safety drop of 'type' column
-        df = df.drop(columns=["type"], errors="ignore")
-        search_type_dataframes[st] = df
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for st, df in search_type_dataframes.items():
-            sheet_name = st if len(st) <= 31 else st[:31]
-            if st == "company":
-                sheet_name = "Companies"
-            if st == "deal":
-                sheet_name = "Deals"
-            if st == "trial":
-                sheet_name = "Trials"
-            if st == "asset":
-                sheet_name = "Assets"
-            if st == "award":
-                sheet_name = "Awards"
-            df.to_excel(writer, index=False, sheet_name=sheet_name)
-    output.seek(0)
-    excel_base64 = base64.b64encode(output.read()).decode('utf-8')
-    return excel_base64
+                progress_cb(completed, total, cache_hits=cache_hits)
+
+    if mode == "batch":
+        from gpt_batch import enrich_batch
+        enrich_batch(calls, prompt, on_gpt_result, job_id or uuid.uuid4().hex)
+    elif ENRICH_ENGINE == "async":
+        from gpt_async import enrich_async
+        enrich_async(calls, prompt, on_gpt_result)
+    else:
+        _enrich_threaded(calls, prompt, on_gpt_result, max_workers)
+
+    if gpt_records:
+        # passthrough records never reach here: total = cache hits + misses
+        print(f"[ENRICH] job {job_id or '-'}: {total} GPT-backed records = "
+              f"{cache_hits} cache hits + {len(gpt_records)} misses, "
+              f"{len(calls)} GPT calls for the misses, "
+              f"~{tokens['sent_tokens']} record-text tokens sent "
+              f"(~{tokens['text_tokens']} before compaction), "
+              f"{time.time() - started:.1f}s")
+
+def enrich(records, prompt, progress_cb=None, mode="interactive", job_id=None,
+           output_format="xlsx"):
+    """
+    Enriches a list of records concurrently and returns an EnrichedOutput
+    (spooled file, extension, content type) with one sheet per search type.
+    The search type is taken from record["type"] (e.g., "company", "deal", "asset").
+    Rows are written as results complete (see result_writer.py), so nothing
+    is buffered beyond the spooled file.
+    Records already in the enrichment cache are served without a GPT call;
+    progress_cb receives the running hit count as `cache_hits`.
+    mode="batch" sends all GPT-backed records through one Batch API job
+    (see gpt_batch.py), checkpointed under `job_id`.
+    """
+    writer = open_writer(records, output_format)
+    gpt_records = [r for r in records if r.get("type") not in PASSTHROUGH_TYPES]
+    enrich_results(
+        gpt_records, prompt,
+        lambda record, result: write_result(writer, record.get("type", "Unknown"), result),
+        progress_cb=progress_cb, mode=mode, job_id=job_id,
+    )
+    with span("result_build", format=output_format):
+        return writer.close()
+
+def enrich_many(prompt_records, progress_cb=None, mode="interactive", job_id=None,
+                output_format="xlsx"):
+    """
+    enrich() for a multi-prompt job: [(prompt, records), ...] into one
+    EnrichedOutput, every row tagged with its prompt in a "Prompt" column.
+    progress_cb counts over all prompts' GPT-backed records.
+    """
+    writer = get_writer(output_format)
+    gpt_lists = [[r for r in records if r.get("type") not in PASSTHROUGH_TYPES]
+                 for _, records in prompt_records]
+    total = sum(len(g) for g in gpt_lists)
+    done_before, hits_before = 0, 0
+    for n, ((prompt, records), gpt_records) in enumerate(zip(prompt_records, gpt_lists)):
+        open_writer(records, writer=writer, prompt=prompt)
+        hits = [0]
+
+        def prompt_progress(done, tot, cache_hits=0, offset=done_before, hits_offset=hits_before):
+            hits[0] = cache_hits
+            if progress_cb:
+                progress_cb(offset + done, total, cache_hits=hits_offset + cache_hits)
+
+        enrich_results(
+            gpt_records, prompt,
+            lambda record, result, prompt=prompt: write_result(writer, record.get("type", "Unknown"),
+                                                               result, prompt),
+            progress_cb=prompt_progress, mode=mode, job_id=f"{job_id}:{n}" if job_id else None,
+        )
+        done_before += len(gpt_records)
+        hits_before += hits[0]
+    with span("result_build", format=output_format):
+        return writer.close()
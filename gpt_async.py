@@ -0,0 +1,201 @@
+"""
+Asyncio enrichment engine for gpt.enrich (ENRICH_ENGINE=async).
+
+- A token bucket paces requests and is re-synced from the x-ratelimit-*
+  headers of every response, so the job tracks the account's real quota.
+- Concurrency adapts AIMD-style: +1/limit per success, halved on a 429
+  (at most once per cooldown window).
+- Retries use jittered exponential backoff and honour Retry-After.
+
+Point OPENAI_BASE_URL at fake_openai.py to exercise it locally.
+"""
+import asyncio
+import os
+import random
+import re
+import time
+
+from openai import AsyncOpenAI, APIStatusError, RateLimitError
+
+from gpt import (GPT_MODEL, WEB_SEARCH_OPTIONS, PROMPT_TEMPLATE_VERSION,
+                 build_messages, empty_result, extract_json_and_source)
+from enrich_cache import get_cache, cache_key
+from metrics import span, record_gpt_usage, GPT_ATTEMPTS
+
+INITIAL_CONCURRENCY = int(os.getenv("ENRICH_INITIAL_CONCURRENCY", "5"))
+MAX_CONCURRENCY = int(os.getenv("ENRICH_MAX_CONCURRENCY", "50"))
+INITIAL_RPM = float(os.getenv("ENRICH_INITIAL_RPM", "500"))
+BACKOFF_BASE = float(os.getenv("ENRICH_BACKOFF_BASE", "1.0"))
+BACKOFF_CAP = float(os.getenv("ENRICH_BACKOFF_CAP", "60.0"))
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_reset(value):
+    """Parse OpenAI reset durations like '1s', '6m0s' or '20ms' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    return sum(float(n) * _UNITS[u] for n, u in parts) if parts else None
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff; never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+class TokenBucket:
+    """Requests-per-second bucket whose rate and level follow the rate-limit headers."""
+
+    def __init__(self, rpm=INITIAL_RPM):
+        self.rate = rpm / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update_from_headers(self, headers):
+        limit = headers.get("x-ratelimit-limit-requests")
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        reset = parse_reset(headers.get("x-ratelimit-reset-requests"))
+        if limit:
+            self.rate = float(limit) / 60.0           # limits are per minute
+            self.capacity = max(1.0, self.rate)
+        if remaining is not None:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, float(remaining))
+            if float(remaining) <= 0 and reset:
+                self.blocked_until = time.monotonic() + reset
+
+    def pause(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: additive increase on success, multiplicative decrease on throttle."""
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, maximum=MAX_CONCURRENCY, cooldown=1.0):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(1.0, self.limit / 2)
+            self._last_decrease = now
+
+async def _enrich_one(client, bucket, limiter, record, prompt, max_retries):
+    """(result, ok); ok is False when every attempt failed and result is all-null."""
+    if os.getenv("DRY_RUN"):
+        return empty_result(record), False
+    messages = build_messages(record, prompt)
+    name = record.get("company")
+    with span("gpt_call", engine="async") as attrs:
+        result = await _attempts(client, bucket, limiter, record, messages, name, max_retries, attrs)
+        attrs["failed"] = int(not result[1])
+        return result
+
+async def _attempts(client, bucket, limiter, record, messages, name, max_retries, attrs):
+    for attempt in range(max_retries):
+        attrs["attempts"] = attempt + 1
+        retry_after = None
+        async with limiter:
+            await bucket.acquire()
+            try:
+                raw = await client.chat.completions.with_raw_response.create(
+                    model=GPT_MODEL,
+                    web_search_options=WEB_SEARCH_OPTIONS,
+                    messages=messages
+                )
+                bucket.update_from_headers(raw.headers)
+                response = raw.parse()
+                GPT_ATTEMPTS.labels("ok").inc()
+                record_gpt_usage(attrs, getattr(response, "usage", None))
+                data = extract_json_and_source(response.choices[0].message.content.strip())
+                limiter.on_success()
+                return data, True
+            except RateLimitError as e:
+                GPT_ATTEMPTS.labels("rate_limited").inc()
+                limiter.on_throttle()
+                bucket.update_from_headers(e.response.headers)
+                retry_after = parse_reset(e.response.headers.get("retry-after"))
+                print(f"Rate limited on {name} (attempt {attempt+1}), concurrency now {int(limiter.limit)}")
+            except APIStatusError as e:
+                GPT_ATTEMPTS.labels("error").inc()
+                bucket.update_from_headers(e.response.headers)
+                print(f"Error processing {name} on attempt {attempt+1}: {e}")
+            except Exception as e:
+                GPT_ATTEMPTS.labels("error").inc()
+                print(f"Error processing {name} on attempt {attempt+1}: {e}")
+        if attempt == max_retries - 1:
+            break
+        # sleep outside the limiter so a waiting retry doesn't hold a slot
+        delay = backoff_delay(attempt, retry_after)
+        if retry_after:
+            bucket.pause(retry_after)
+        await asyncio.sleep(delay)
+    return empty_result(record), False
+
+async def _enrich_all(records, prompt, on_result, max_retries):
+    client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    bucket, limiter = TokenBucket(), AdaptiveLimiter()
+    cache = get_cache()
+
+    async def run(record):
+        result, ok = await _enrich_one(client, bucket, limiter, record, prompt, max_retries)
+        return record, result, ok
+
+    try:
+        tasks = [asyncio.create_task(run(r)) for r in records]
+        for next_done in asyncio.as_completed(tasks):
+            record, result, ok = await next_done
+            if ok and cache is not None:
+                cache.set(cache_key(record, prompt, PROMPT_TEMPLATE_VERSION), result)
+            on_result(record, result)
+    finally:
+        await client.close()
+
+def enrich_async(records, prompt, on_result, max_retries=3):
+    """
+    Enrich `records` concurrently; on_result(record, result) is called in
+    this thread as each finishes, matching gpt._enrich_threaded.
+    """
+    if records:
+        asyncio.run(_enrich_all(records, prompt, on_result, max_retries))
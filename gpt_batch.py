@@ -0,0 +1,186 @@
+"""
+Batch-API enrichment engine for large offline jobs (enrich mode="batch").
+
+All build_prompt outputs go into one JSONL request file that is submitted
+as a single batch, polled until it finishes, and whose output is streamed
+back through extract_json_and_source. The batch id is checkpointed under
+BATCH_DIR/<job_id>.json, so a restarted worker resumes polling the same
+batch instead of paying for a second one; once the batch finishes, its
+output reference is checkpointed too, so a job that fails later (writing
+or uploading the file) re-downloads the output on retry. The task removes
+the checkpoint (clear_checkpoints) only after its upload succeeded.
+
+BATCH_BACKEND=local swaps the OpenAI Batch API for LocalBatchBackend, which
+runs the same request file through the chat endpoint (e.g. fake_openai.py).
+"""
+import glob
+import json
+import os
+import time
+import uuid
+
+from gpt import (client, GPT_MODEL, WEB_SEARCH_OPTIONS, PROMPT_TEMPLATE_VERSION,
+                 build_messages, empty_result, extract_json_and_source)
+from enrich_cache import get_cache, cache_key
+
+BATCH_DIR = os.getenv("BATCH_DIR", "data/batches")
+BATCH_MODEL = os.getenv("BATCH_MODEL", GPT_MODEL)
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+ENDPOINT = "/v1/chat/completions"
+
+# batch states after which no more polling is useful
+FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+class OpenAIBatchBackend:
+    def submit(self, path):
+        with open(path, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id, endpoint=ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        """(status, output reference or None, completed count)."""
+        batch = client.batches.retrieve(batch_id)
+        done = batch.request_counts.completed if batch.request_counts else 0
+        return batch.status, batch.output_file_id, done
+
+    def results(self, output_ref):
+        for line in client.files.content(output_ref).text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+class LocalBatchBackend:
+    """Offline stand-in: executes the request file line by line at submit time."""
+
+    def __init__(self, directory=BATCH_DIR):
+        self.directory = directory
+
+    def _output_path(self, batch_id):
+        return os.path.join(self.directory, f"{batch_id}.output.jsonl")
+
+    def submit(self, path):
+        batch_id = f"local_{uuid.uuid4().hex}"
+        tmp = self._output_path(batch_id) + ".tmp"
+        with open(path) as src, open(tmp, "w") as out:
+            for line in src:
+                req = json.loads(line)
+                try:
+                    body = client.chat.completions.create(**req["body"]).model_dump()
+                    row = {"custom_id": req["custom_id"], "error": None,
+                           "response": {"status_code": 200, "body": body}}
+                except Exception as e:
+                    row = {"custom_id": req["custom_id"], "response": None,
+                           "error": {"message": str(e)}}
+                out.write(json.dumps(row) + "\n")
+        os.replace(tmp, self._output_path(batch_id))
+        return batch_id
+
+    def poll(self, batch_id):
+        path = self._output_path(batch_id)
+        if not os.path.exists(path):
+            return "in_progress", None, 0
+        with open(path) as f:
+            done = sum(1 for _ in f)
+        return "completed", path, done
+
+    def results(self, output_ref):
+        with open(output_ref) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def get_backend():
+    if os.getenv("BATCH_BACKEND", "openai") == "local":
+        return LocalBatchBackend()
+    return OpenAIBatchBackend()
+
+def write_batch_file(records, prompt, path):
+    """One chat-completions request per record; custom_id is the record's position."""
+    with open(path, "w") as f:
+        for i, record in enumerate(records):
+            body = {"model": BATCH_MODEL, "messages": build_messages(record, prompt)}
+            if BATCH_MODEL == GPT_MODEL:
+                body["web_search_options"] = WEB_SEARCH_OPTIONS
+            f.write(json.dumps({"custom_id": str(i), "method": "POST",
+                                "url": ENDPOINT, "body": body}) + "\n")
+
+def _parse_output_row(row):
+    response = row.get("response") or {}
+    if row.get("error") or response.get("status_code") != 200:
+        raise ValueError(f"batch request failed: {row.get('error') or response}")
+    content = response["body"]["choices"][0]["message"]["content"].strip()
+    return extract_json_and_source(content)
+
+def _save_checkpoint(path, checkpoint):
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+def clear_checkpoints(job_id):
+    """Drop the batch checkpoints of a finished job (multi-prompt jobs: <job_id>:<n>)."""
+    paths = [os.path.join(BATCH_DIR, f"{job_id}.json")] + \
+        glob.glob(os.path.join(BATCH_DIR, glob.escape(f"{job_id}:") + "*.json"))
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def enrich_batch(records, prompt, on_result, job_id, backend=None):
+    """
+    Enrich `records` through one batch; on_result(record, result) is called
+    for each output row as it is streamed back. Resumes from the checkpoint
+    of `job_id` if one exists; the caller removes it with clear_checkpoints.
+    """
+    if not records:
+        return
+    backend = backend or get_backend()
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    checkpoint_path = os.path.join(BATCH_DIR, f"{job_id}.json")
+
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        # the checkpointed records match the submitted custom_ids
+        records = checkpoint["records"]
+        print(f"[BATCH] resuming {checkpoint['batch_id']} for job {job_id}")
+    else:
+        input_path = os.path.join(BATCH_DIR, f"{job_id}.input.jsonl")
+        write_batch_file(records, prompt, input_path)
+        records = [{k: v for k, v in r.items() if k != "combined_text"} for r in records]
+        checkpoint = {"batch_id": backend.submit(input_path), "prompt": prompt, "records": records}
+        _save_checkpoint(checkpoint_path, checkpoint)
+        os.remove(input_path)
+        print(f"[BATCH] submitted {checkpoint['batch_id']} with {len(records)} requests")
+
+    batch_id = checkpoint["batch_id"]
+    while "status" not in checkpoint:
+        status, output_ref, done = backend.poll(batch_id)
+        print(f"[BATCH] {batch_id}: {status} ({done}/{len(records)})")
+        if status in FINAL_STATES:
+            checkpoint.update(status=status, output_ref=output_ref)
+            _save_checkpoint(checkpoint_path, checkpoint)
+            break
+        time.sleep(BATCH_POLL_SECONDS)
+    output_ref = checkpoint["output_ref"]
+
+    cache = get_cache()
+    seen = set()
+    if output_ref:
+        for row in backend.results(output_ref):
+            i = int(row["custom_id"])
+            record = records[i]
+            try:
+                result = _parse_output_row(row)
+                if cache is not None:
+                    cache.set(cache_key(record, prompt, PROMPT_TEMPLATE_VERSION), result)
+            except Exception as e:
+                print(f"Error processing {record.get('company')} in batch {batch_id}: {e}")
+                result = empty_result(record)
+            seen.add(i)
+            on_result(record, result)
+    # expired / failed requests still get a row in the workbook
+    for i, record in enumerate(records):
+        if i not in seen:
+            on_result(record, empty_result(record))
+    # the checkpoint stays until the job's upload succeeded (tasks → clear_checkpoints)
@@ -0,0 +1,18 @@
+"""
+gunicorn settings for the web tier, read from the working directory:
+
+    gunicorn app:app
+
+/events/<task_id> holds its request open while it streams Server-Sent
+Events (up to SSE_MAX_SECONDS, then the browser reconnects). With sync
+workers every open progress tab would pin a whole worker process, so the
+web tier runs threaded workers: each process serves GUNICORN_THREADS
+requests at once, streams included. Command-line flags (-w, -k, --threads)
+still override these.
+"""
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
@@ -0,0 +1,74 @@
+"""
+Import-time budget for the web entry point.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter and fails
+(exit 1) if the import pulls in a worker-only package or exceeds the
+cumulative budget:
+
+    python importtime_check.py                      # entry point "app", budget WEB_IMPORT_BUDGET_MS
+    python importtime_check.py --module app --budget-ms 800 --top 15
+
+tests/test_importtime.py runs the same check with the test suite.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# packages only the Celery workers may load
+FORBIDDEN = ("torch", "pandas", "sentence_transformers", "transformers", "onnxruntime",
+             "numpy", "openai", "xlsxwriter")
+BUDGET_MS = float(os.getenv("WEB_IMPORT_BUDGET_MS", "1500"))
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def measure(module="app"):
+    """(rows, cumulative ms, worker-only packages loaded) for importing `module` in a fresh interpreter."""
+    env = dict(os.environ)
+    env.setdefault("S3_BUCKET_NAME", "importtime-check")     # app.py refuses to start without it
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=env,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise ImportError(proc.stderr.splitlines()[-1] if proc.stderr else f"import {module} failed")
+    rows = parse_importtime(proc.stderr)
+    # cumulative times of the top-level imports add up to the total
+    total_ms = sum(cum for _, _, cum, depth in rows if depth == 0) / 1000
+    loaded = {name.split(".")[0] for name, *_ in rows}
+    return rows, total_ms, sorted(loaded & set(FORBIDDEN))
+
+def check(module="app", budget_ms=BUDGET_MS, top=10):
+    try:
+        rows, total_ms, forbidden = measure(module)
+    except ImportError as e:
+        print(e)
+        return False
+
+    print(f"import {module}: {total_ms:.0f} ms cumulative (budget {budget_ms:.0f} ms), {len(rows)} modules")
+    for name, _, cum, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"  {cum / 1000:8.1f} ms  {name}")
+    ok = True
+    if forbidden:
+        print(f"FAIL: {module} imports worker-only packages: {', '.join(forbidden)}")
+        ok = False
+    if total_ms > budget_ms:
+        print(f"FAIL: {module} import takes {total_ms:.0f} ms > {budget_ms:.0f} ms")
+        ok = False
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if the web entry point imports too much.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(0 if check(args.module, args.budget_ms, args.top) else 1)
@@ -0,0 +1,203 @@
+"""
+Stage timing spans, per-task traces and Prometheus metrics.
+
+    with span("semantic"):                    # times the block
+        ...
+    with span("gpt_call") as attrs:           # numeric attrs are summed per stage
+        attrs["prompt_tokens"] = usage.prompt_tokens
+
+Every span is observed in the ctic_stage_seconds histogram (label: stage).
+Inside `with trace(task_id):` spans are also collected for that task, and
+trace.summary() (count / total / max ms and summed attrs per stage) goes into
+the task's progress metadata (progress.ProgressPublisher attaches the
+current trace on every flush) and result. Chunks of a fanned-out job trace
+under the parent's id; the merge step combines their summaries
+(merge_summaries) with the parent's.
+
+Stages: init, s3_check, encode, semantic, bm25, rerank, search, enrich,
+gpt_call, result_build, s3_upload.
+
+prometheus_client is optional: without it spans still feed traces and the
+metrics are no-ops. With several processes per host (gunicorn, Celery
+prefork) set PROMETHEUS_MULTIPROC_DIR to a directory shared by all of them
+before they start; app.py's /metrics aggregates it, and worker-only hosts
+expose the same view with `python metrics.py serve --port 9464` (or
+METRICS_PORT, started by the Celery worker).
+"""
+import argparse
+import contextvars
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+try:
+    import prometheus_client as prom
+except ImportError:
+    prom = None
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, value=1):
+        pass
+
+    def set(self, value):
+        pass
+
+def _metric(kind, name, doc, labels, **kwargs):
+    if prom is None:
+        return _NoopMetric()
+    return getattr(prom, kind)(name, doc, labels, **kwargs)
+
+STAGE_SECONDS = _metric("Histogram", "ctic_stage_seconds", "Time spent per pipeline stage.", ["stage"],
+                        buckets=STAGE_BUCKETS)
+STAGE_ERRORS = _metric("Counter", "ctic_stage_errors", "Stage spans that raised.", ["stage"])
+GPT_ATTEMPTS = _metric("Counter", "ctic_gpt_attempts", "GPT requests by outcome (ok, rate_limited, error).",
+                       ["outcome"])
+GPT_TOKENS = _metric("Counter", "ctic_gpt_tokens", "GPT token usage.", ["kind"])
+JOBS = _metric("Counter", "ctic_jobs", "Finished enrichment jobs.", ["outcome"])
+RSS_BYTES = _metric("Gauge", "ctic_rss_bytes", "Resident memory at search.log_mem steps.", ["step"],
+                    multiprocess_mode="livemax")
+
+# ---- traces ----
+
+class Trace:
+    """Spans of one task; appended from any thread or asyncio task running in its context."""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, attrs, error=False):
+        with self._lock:
+            self.spans.append((stage, seconds, attrs, error))
+
+    def summary(self):
+        """{"trace_id", "stages": {stage: {"count", "total_ms", "max_ms", "errors", <summed attrs>}}}"""
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for stage, seconds, attrs, error in spans:
+            s = stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            s["count"] += 1
+            s["total_ms"] += seconds * 1000
+            s["max_ms"] = max(s["max_ms"], seconds * 1000)
+            s["errors"] += int(error)
+            for k, v in attrs.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    s[k] = s.get(k, 0) + v
+        for s in stages.values():
+            s["total_ms"] = round(s["total_ms"], 1)
+            s["max_ms"] = round(s["max_ms"], 1)
+        return {"trace_id": self.trace_id, "stages": stages}
+
+def merge_summaries(summaries, trace_id=None):
+    """One summary from several (chunks of a job): counts / totals / attrs summed, max of max."""
+    stages = {}
+    for summary in summaries:
+        if not summary:
+            continue
+        trace_id = trace_id or summary.get("trace_id")
+        for stage, s in summary.get("stages", {}).items():
+            merged = stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            for k, v in s.items():
+                merged[k] = max(merged.get(k, 0), v) if k == "max_ms" else merged.get(k, 0) + v
+    for s in stages.values():
+        s["total_ms"] = round(s["total_ms"], 1)
+    return {"trace_id": trace_id, "stages": stages}
+
+_current = contextvars.ContextVar("ctic_trace", default=None)
+
+@contextmanager
+def trace(trace_id=None):
+    """Collect the spans of this block (and of threads / tasks started in its context)."""
+    t = Trace(trace_id)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+
+def current_trace():
+    """Trace of the running task, or None outside `with trace(...)`."""
+    return _current.get()
+
+@contextmanager
+def span(stage, **attrs):
+    """Time a stage; yields a dict the block may add numeric attributes to."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield attrs
+    except BaseException:
+        error = True
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        t = _current.get()
+        if t is not None:
+            t.add(stage, seconds, attrs, error)
+
+def record_gpt_usage(attrs, usage):
+    """Token counts of one GPT response into the counters and the call's span attrs."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = getattr(usage, kind, None) or 0
+        GPT_TOKENS.labels(kind.split("_")[0]).inc(n)
+        attrs[kind] = attrs.get(kind, 0) + n
+
+# ---- exposition ----
+
+def registry():
+    """Registry to export: the multiprocess aggregate when PROMETHEUS_MULTIPROC_DIR is set."""
+    if prom is None:
+        return None
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        r = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(r)
+        return r
+    return prom.REGISTRY
+
+def render():
+    """(body, content type) for a /metrics response."""
+    if prom is None:
+        return b"# prometheus_client is not installed\n", "text/plain; charset=utf-8"
+    return prom.generate_latest(registry()), prom.CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid):
+    """Drop a finished process's live gauges (multiprocess mode)."""
+    if prom is not None and MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+def serve(port=METRICS_PORT):
+    """Standalone /metrics listener (worker-only hosts)."""
+    if prom is None:
+        print("[METRICS] prometheus_client not installed; not serving")
+        return
+    prom.start_http_server(port, registry=registry())
+    print(f"[METRICS] serving /metrics on :{port}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prometheus metrics for the search and enrichment pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("serve", help="expose /metrics for the processes on this host")
+    s.add_argument("--port", type=int, default=METRICS_PORT or 9464)
+    args = parser.parse_args()
+    serve(args.port)
+    threading.Event().wait()
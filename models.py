@@ -1,14 +1,29 @@
 # purpose of this file is reducing memory usage through model injection
 
+import os
 from functools import lru_cache
-from sentence_transformers import SentenceTransformer, CrossEncoder
+
+SENTENCE_MODEL_NAME = "multi-qa-MiniLM-L6-cos-v1"
+CROSS_ENCODER_NAME = "cross-encoder/ms-marco-TinyBERT-L2-v2"
+
+# "torch" (sentence_transformers) or "onnx" (quantized graphs, see onnx_backend.py);
+# sentence_transformers / torch are only imported for the torch backend
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
 
 @lru_cache(maxsize=1)
 def get_sentence_model():
-    print("Loading sentence model...")
-    return SentenceTransformer("multi-qa-MiniLM-L6-cos-v1")
+    print(f"Loading sentence model ({INFERENCE_BACKEND})...")
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_backend import load_sentence_encoder
+        return load_sentence_encoder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(SENTENCE_MODEL_NAME)
 
 @lru_cache(maxsize=1)
 def get_cross_encoder():
-    print("Loading cross encoder...")
-    return CrossEncoder("cross-encoder/ms-marco-TinyBERT-L2-v2")
+    print(f"Loading cross encoder ({INFERENCE_BACKEND})...")
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_backend import load_cross_encoder
+        return load_cross_encoder()
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(CROSS_ENCODER_NAME)
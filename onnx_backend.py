@@ -0,0 +1,245 @@
+"""
+ONNX Runtime inference backend for the sentence model and cross-encoder
+(INFERENCE_BACKEND=onnx in models.py).
+
+Runtime needs only onnxruntime + tokenizers, so workers skip importing
+torch. Graphs are exported once, with dynamic int8 weight quantization:
+
+    python onnx_backend.py export              # torch + sentence_transformers needed here
+    python onnx_backend.py parity              # rank correlation + latency vs torch; exits 1
+                                               # below --min-spearman (ONNX_PARITY_MIN_SPEARMAN)
+
+Layout under ONNX_MODEL_DIR (default models_onnx/):
+
+    sentence/{model.onnx, model_int8.onnx, tokenizer.json, config.json}
+    cross_encoder/{model.onnx, model_int8.onnx, tokenizer.json, config.json}
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+ONNX_DIR = os.getenv("ONNX_MODEL_DIR", "models_onnx")
+ONNX_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))       # 0 → onnxruntime default
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "1") != "0"
+# parity gate: mean Spearman of ONNX vs torch rankings (semantic and rerank) must reach this
+PARITY_MIN_SPEARMAN = float(os.getenv("ONNX_PARITY_MIN_SPEARMAN", "0.95"))
+
+def _session(path):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_THREADS:
+        options.intra_op_num_threads = ONNX_THREADS
+        options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+class _OnnxModel:
+    def __init__(self, directory, quantized=ONNX_QUANTIZED):
+        from tokenizers import Tokenizer
+        with open(os.path.join(directory, "config.json")) as f:
+            self.config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_length"], strategy="longest_first")
+        self.tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+        self.session = _session(os.path.join(directory, "model_int8.onnx" if quantized else "model.onnx"))
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _run(self, encodings):
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feed = {k: v for k, v in feed.items() if k in self.input_names}
+        return self.session.run(None, feed)[0], feed["attention_mask"]
+
+class OnnxSentenceEncoder(_OnnxModel):
+    """Drop-in for SentenceTransformer.encode (numpy output only)."""
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=None, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        out = []
+        for start in range(0, len(sentences), batch_size):
+            hidden, mask = self._run(self.tokenizer.encode_batch(sentences[start:start + batch_size]))
+            if self.config["pooling"] == "cls":
+                emb = hidden[:, 0]
+            else:
+                m = mask[..., None].astype(np.float32)
+                emb = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+            if self.config["normalize"] or normalize_embeddings:
+                emb = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            out.append(emb.astype(np.float32))
+        emb = np.concatenate(out) if out else np.empty((0, self.config["dim"]), dtype=np.float32)
+        return emb[0] if single else emb
+
+class OnnxCrossEncoder(_OnnxModel):
+    """Drop-in for CrossEncoder.predict on (query, passage) pairs."""
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        pairs = [tuple(p) for p in pairs]
+        out = []
+        for start in range(0, len(pairs), batch_size):
+            logits, _ = self._run(self.tokenizer.encode_batch(pairs[start:start + batch_size]))
+            scores = logits[:, 0]
+            if self.config["sigmoid"]:
+                scores = 1 / (1 + np.exp(-scores))
+            out.append(scores.astype(np.float32))
+        return np.concatenate(out) if out else np.empty(0, dtype=np.float32)
+
+def load_sentence_encoder(directory=ONNX_DIR):
+    return OnnxSentenceEncoder(os.path.join(directory, "sentence"))
+
+def load_cross_encoder(directory=ONNX_DIR):
+    return OnnxCrossEncoder(os.path.join(directory, "cross_encoder"))
+
+# ---- export (offline; needs torch) ----
+
+def _export_graph(module, tokenizer, out_dir, output_name, config):
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            out = self.inner(input_ids=input_ids, attention_mask=attention_mask,
+                             token_type_ids=token_type_ids)
+            return out[0]
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample = tokenizer(["warm up", "another sample"], ["pair text", "more"],
+                       padding=True, return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    export_kwargs = dict(
+        input_names=names,
+        output_names=[output_name],
+        dynamic_axes={**{n: {0: "batch", 1: "seq"} for n in names}, output_name: {0: "batch"}},
+        opset_version=14,
+    )
+    # newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic_axes
+    if "dynamo" in torch.onnx.export.__code__.co_varnames:
+        export_kwargs["dynamo"] = False
+    torch.onnx.export(Wrapper(module.eval()), tuple(sample[n] for n in names), fp32_path, **export_kwargs)
+    quantize_dynamic(fp32_path, os.path.join(out_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(out_dir)             # writes tokenizer.json for fast tokenizers
+    config.update(pad_id=tokenizer.pad_token_id, pad_token=tokenizer.pad_token)
+    with open(os.path.join(out_dir, "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    print(f"[ONNX] exported {out_dir}")
+
+def export(out_dir=ONNX_DIR):
+    import torch
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+    from models import SENTENCE_MODEL_NAME, CROSS_ENCODER_NAME
+
+    st = SentenceTransformer(SENTENCE_MODEL_NAME, device="cpu")
+    # older sentence_transformers expose pooling_mode_*_token flags, newer a pooling_mode string
+    pooling = st[1].get_config_dict()
+    pooling_mode = pooling.get("pooling_mode") or ("cls" if pooling.get("pooling_mode_cls_token") else "mean")
+    _export_graph(st[0].auto_model, st.tokenizer, os.path.join(out_dir, "sentence"), "last_hidden_state", {
+        "max_length": st.max_seq_length,
+        "pooling": "cls" if "cls" in str(pooling_mode) else "mean",
+        "normalize": any(type(m).__name__ == "Normalize" for m in st),
+        "dim": st.get_sentence_embedding_dimension(),
+    })
+
+    ce = CrossEncoder(CROSS_ENCODER_NAME, device="cpu")
+    activation = getattr(ce, "activation_fn", None) or getattr(ce, "default_activation_function", None)
+    _export_graph(ce.model, ce.tokenizer, os.path.join(out_dir, "cross_encoder"), "logits", {
+        "max_length": (getattr(ce, "max_seq_length", None) or getattr(ce, "max_length", None)
+                       or ce.tokenizer.model_max_length),
+        "sigmoid": isinstance(activation, torch.nn.Sigmoid),
+    })
+
+# ---- parity / latency check against torch ----
+
+PARITY_FIXTURE = [
+    ("Chinese ophthalmology companies", [
+        "Zhaoke Ophthalmology develops eye drops for presbyopia and dry eye in China.",
+        "Ocumension Therapeutics is a Shanghai-based ophthalmic pharmaceutical company.",
+        "Arcutis Biotherapeutics focuses on immuno-dermatology topical treatments.",
+        "A phase 3 trial of atropine for myopia progression in children in Beijing.",
+        "Moderna mRNA vaccine collaboration for respiratory syncytial virus.",
+        "Acquisition of an Irish contract manufacturer of sterile injectables.",
+    ]),
+    ("KRAS G12C inhibitors in non-small cell lung cancer", [
+        "Sotorasib is a covalent KRAS G12C inhibitor approved for NSCLC.",
+        "Adagrasib phase 2 KRYSTAL-1 results in previously treated lung cancer.",
+        "A gene therapy for spinal muscular atrophy delivered by AAV9.",
+        "Pan-RAS inhibitor licensing deal with an upfront payment of $100M.",
+        "Anti-PD-1 antibody combination study in melanoma.",
+        "A wearable glucose monitor for type 1 diabetes.",
+    ]),
+    ("obesity GLP-1 acquisitions", [
+        "Novo Holdings acquires Catalent to expand GLP-1 fill-finish capacity.",
+        "Roche acquires Carmot Therapeutics and its incretin portfolio for obesity.",
+        "AbbVie licenses an oral GLP-1 agonist from a Chinese biotech.",
+        "A CAR-T therapy for relapsed multiple myeloma.",
+        "Semaglutide reduces cardiovascular events in overweight adults.",
+        "A veterinary vaccine company raises a Series A.",
+    ]),
+]
+
+def _spearman(a, b):
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+def _timed(fn, repeats=5):
+    fn()                                           # warm-up
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)) * 1000
+
+def parity(directory=ONNX_DIR, rerank_pairs=500, min_spearman=PARITY_MIN_SPEARMAN):
+    """Compare the ONNX graphs with torch; True when both mean rank correlations reach min_spearman."""
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+    from models import SENTENCE_MODEL_NAME, CROSS_ENCODER_NAME
+
+    torch_st, torch_ce = SentenceTransformer(SENTENCE_MODEL_NAME), CrossEncoder(CROSS_ENCODER_NAME)
+    onnx_st, onnx_ce = load_sentence_encoder(directory), load_cross_encoder(directory)
+
+    sem_rho, ce_rho = [], []
+    for query, passages in PARITY_FIXTURE:
+        pairs = [(query, p) for p in passages]
+        t_sim = torch_st.encode(passages) @ torch_st.encode(query)
+        o_sim = onnx_st.encode(passages) @ onnx_st.encode(query)
+        sem_rho.append(_spearman(t_sim, o_sim))
+        ce_rho.append(_spearman(torch_ce.predict(pairs), onnx_ce.predict(pairs)))
+    print(f"semantic rank correlation (mean spearman): {np.mean(sem_rho):.4f}  min {np.min(sem_rho):.4f}")
+    print(f"rerank   rank correlation (mean spearman): {np.mean(ce_rho):.4f}  min {np.min(ce_rho):.4f}")
+    failed = [name for name, rho in (("semantic", sem_rho), ("rerank", ce_rho)) if np.mean(rho) < min_spearman]
+
+    passages = [p for _, ps in PARITY_FIXTURE for p in ps]
+    pairs = [(PARITY_FIXTURE[0][0], passages[i % len(passages)]) for i in range(rerank_pairs)]
+    print(f"encode 1 query:      torch {_timed(lambda: torch_st.encode('KRAS inhibitors')):8.1f} ms"
+          f"   onnx {_timed(lambda: onnx_st.encode('KRAS inhibitors')):8.1f} ms")
+    print(f"rerank {rerank_pairs} pairs:  torch {_timed(lambda: torch_ce.predict(pairs), 3):8.1f} ms"
+          f"   onnx {_timed(lambda: onnx_ce.predict(pairs), 3):8.1f} ms")
+    if failed:
+        print(f"PARITY FAIL: {', '.join(failed)} below mean spearman {min_spearman}")
+        return False
+    print(f"PARITY OK (mean spearman >= {min_spearman})")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export / check the ONNX inference backend.")
+    parser.add_argument("command", choices=["export", "parity"])
+    parser.add_argument("--dir", default=ONNX_DIR)
+    parser.add_argument("--min-spearman", type=float, default=PARITY_MIN_SPEARMAN,
+                        help="parity fails (exit 1) below this mean rank correlation")
+    args = parser.parse_args()
+    if args.command == "export":
+        export(args.dir)
+    elif not parity(args.dir, min_spearman=args.min_spearman):
+        sys.exit(1)
@@ -0,0 +1,190 @@
+"""
+Task progress over Redis pub/sub, coalesced per task.
+
+Workers report through ProgressPublisher: at most one update per
+PROGRESS_INTERVAL_MS reaches Redis (and the Celery result backend, which
+the /status polling fallback reads); intermediate updates are dropped, the
+latest one is kept and sent on the next tick or at the end. Each published
+event also overwrites a short-lived "last event" key so a browser that
+subscribes late still gets the current state first. Inside a
+metrics.trace, flushed events also carry its stage summary ("trace").
+
+app.py streams the channel to the browser as Server-Sent Events
+(/events/<task_id>, see sse_stream), in short streams the browser reconnects.
+"""
+import json
+import os
+import threading
+import time
+
+import metrics
+
+PROGRESS_REDIS_URL = os.getenv("PROGRESS_REDIS_URL") or os.getenv("CELERY_BROKER_URL")
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL_MS", "500")) / 1000
+CHANNEL_PREFIX = "ctic:progress:"
+LAST_KEY_PREFIX = "ctic:progress_last:"
+GATE_KEY_PREFIX = "ctic:progress_gate:"       # shared coalescing window across processes
+CHUNKS_KEY_PREFIX = "ctic:progress_chunks:"   # per-chunk counts of a fanned-out task
+LAST_TTL = 3600
+SSE_KEEPALIVE = 15          # seconds between comment lines on an idle stream
+# streams end after this and EventSource reconnects on its own (the last event is replayed),
+# so a request never holds a web worker thread for long (see gunicorn.conf.py)
+SSE_MAX_SECONDS = int(os.getenv("SSE_MAX_SECONDS", "25"))
+FINAL_STATES = ("SUCCESS", "FAILURE")
+
+def _redis():
+    import redis
+    return redis.Redis.from_url(PROGRESS_REDIS_URL)
+
+def progress_meta(done, total, cache_hits=0):
+    pct = int(done * 100 / total) if total else 100
+    return {
+        "status": f"Processed {done}/{total} records",
+        "current": done,
+        "total": total,
+        "percent": pct,
+        "cache_hits": cache_hits,
+        "cache_hit_ratio": round(cache_hits / total, 3) if total else 0.0,
+    }
+
+class ProgressPublisher:
+    """
+    Coalescing progress sink for one task. `on_flush(state, meta)` runs for
+    every event that is actually emitted (tasks pass self.update_state).
+    With shared=True, the interval is enforced across processes through a
+    Redis key, for chunks of one task reporting from several workers.
+    """
+
+    def __init__(self, task_id, on_flush=None, interval=PROGRESS_INTERVAL, shared=False):
+        self.task_id = task_id
+        self.on_flush = on_flush
+        self.interval = interval
+        self.shared = shared
+        self._last_emit = 0.0
+        self._pending = None
+        try:
+            self._redis = _redis() if PROGRESS_REDIS_URL else None
+        except Exception as e:
+            print(f"[PROGRESS] pub/sub disabled: {e}")
+            self._redis = None
+
+    def update(self, meta, state="PROGRESS"):
+        """Emit now if the interval has passed, else keep as the pending update."""
+        self._pending = (state, meta)
+        if time.monotonic() - self._last_emit >= self.interval and self._open_gate():
+            self.flush()
+
+    def _open_gate(self):
+        if not self.shared or self._redis is None:
+            return True
+        try:
+            return bool(self._redis.set(GATE_KEY_PREFIX + self.task_id, 1, nx=True,
+                                        px=max(int(self.interval * 1000), 1)))
+        except Exception:
+            return True
+
+    def flush(self):
+        if self._pending is not None:
+            state, meta = self._pending
+            self._pending = None
+            # stage timings so far; summarised here, at most once per interval, not per update
+            trace = metrics.current_trace()
+            if trace is not None:
+                meta = {**meta, "trace": trace.summary()}
+            self._emit(state, meta)
+
+    def finish(self, state, meta):
+        """Final event (SUCCESS / FAILURE); never coalesced away."""
+        self._pending = None
+        self._emit(state, meta, backend=False)       # Celery records the final state itself
+
+    def _emit(self, state, meta, backend=True):
+        self._last_emit = time.monotonic()
+        if backend and self.on_flush:
+            self.on_flush(state, meta)
+        if self._redis is None:
+            return
+        event = json.dumps({"state": state, **meta})
+        try:
+            pipe = self._redis.pipeline()
+            pipe.setex(LAST_KEY_PREFIX + self.task_id, LAST_TTL, event)
+            pipe.publish(CHANNEL_PREFIX + self.task_id, event)
+            pipe.execute()
+        except Exception as e:
+            print(f"[PROGRESS] publish failed for {self.task_id}: {e}")
+
+# chunk counts per parent task when there is no Redis (eager / local runs: all chunks in this process)
+_local_chunks = {}
+_local_chunks_lock = threading.Lock()
+
+class ChunkProgress:
+    """
+    Progress of one chunk of a fanned-out task: the chunk's counts go into a
+    Redis hash (or an in-process table without Redis) and the sum over all
+    chunks is published under the parent task.
+    """
+
+    def __init__(self, parent_id, chunk_no, total, on_flush=None):
+        self.chunk_no = chunk_no
+        self.total = total
+        self.publisher = ProgressPublisher(parent_id, on_flush, shared=True)
+        self._key = CHUNKS_KEY_PREFIX + parent_id
+
+    def update(self, done, cache_hits=0):
+        r = self.publisher._redis
+        if r is None:
+            with _local_chunks_lock:
+                counts = _local_chunks.setdefault(self._key, {})
+                counts[self.chunk_no] = (done, cache_hits)
+                done_all = sum(d for d, _ in counts.values())
+                hits_all = sum(h for _, h in counts.values())
+        else:
+            pipe = r.pipeline()
+            pipe.hset(self._key, mapping={f"{self.chunk_no}:done": done, f"{self.chunk_no}:hits": cache_hits})
+            pipe.expire(self._key, LAST_TTL)
+            pipe.hgetall(self._key)
+            counts = pipe.execute()[-1]
+            done_all = sum(int(v) for k, v in counts.items() if k.endswith(b":done"))
+            hits_all = sum(int(v) for k, v in counts.items() if k.endswith(b":hits"))
+        self.publisher.update(progress_meta(done_all, self.total, hits_all))
+
+def clear_chunk_progress(parent_id):
+    """Drop a finished fan-out's chunk counts."""
+    with _local_chunks_lock:
+        _local_chunks.pop(CHUNKS_KEY_PREFIX + parent_id, None)
+    if PROGRESS_REDIS_URL:
+        try:
+            _redis().delete(CHUNKS_KEY_PREFIX + parent_id)
+        except Exception as e:
+            print(f"[PROGRESS] could not clear chunk counts of {parent_id}: {e}")
+
+def _sse(data):
+    return f"data: {data}\n\n"
+
+def sse_stream(task_id, max_seconds=SSE_MAX_SECONDS):
+    """
+    Generator of SSE lines for one task: the last known event, then live
+    events until a final state or max_seconds.
+    """
+    r = _redis()
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL_PREFIX + task_id)       # subscribe before reading the last event
+    try:
+        yield "retry: 3000\n\n"
+        last = r.get(LAST_KEY_PREFIX + task_id)
+        if last:
+            yield _sse(last.decode())
+            if json.loads(last).get("state") in FINAL_STATES:
+                return
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=SSE_KEEPALIVE)
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            data = message["data"].decode()
+            yield _sse(data)
+            if json.loads(data).get("state") in FINAL_STATES:
+                return
+    finally:
+        pubsub.close()
@@ -0,0 +1,119 @@
+"""
+Pre-enrichment compaction (gpt.enrich_results):
+
+    group_entities    records about the same entity (enrich_cache.record_identity:
+                      company, or acquirer + target for deals) share one GPT call
+    trim_text         combined_text cut to the passages most relevant to the
+                      prompt, within ENRICH_TOKEN_BUDGET tokens (0 = keep all)
+
+Trimming is off by default: a budget changes what GPT sees for every long
+record, so it is opted into per deployment (e.g. ENRICH_TOKEN_BUDGET=800).
+Token counts use tiktoken when installed, else ~4 characters per token.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+from enrich_cache import record_identity
+
+TOKEN_BUDGET = int(os.getenv("ENRICH_TOKEN_BUDGET", "0"))
+ENTITY_DEDUP = os.getenv("ENRICH_ENTITY_DEDUP", "1") != "0"
+PASSAGE_WORDS = 80              # long paragraphs are split into passages of about this size
+
+_WORD = re.compile(r"\w+")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text):
+        return len(_encoding.encode(text or "", disallowed_special=()))
+except ImportError:
+    def count_tokens(text):
+        return (len(text or "") + 3) // 4
+
+def _terms(text):
+    return _WORD.findall(text.lower())
+
+def split_passages(text):
+    """Paragraphs, with long ones split at sentence ends into ~PASSAGE_WORDS chunks."""
+    passages = []
+    for paragraph in re.split(r"\n\s*\n|\n", text or ""):
+        sentences = re.split(r"(?<=[.!?])\s+", paragraph.strip())
+        current = []
+        for sentence in filter(None, sentences):
+            current.append(sentence)
+            if sum(len(s.split()) for s in current) >= PASSAGE_WORDS:
+                passages.append(" ".join(current))
+                current = []
+        if current:
+            passages.append(" ".join(current))
+    return passages
+
+def trim_text(text, prompt, budget=TOKEN_BUDGET):
+    """
+    Highest-scoring passages for `prompt` (BM25-style term weights over the
+    text's own passages) up to `budget` tokens, kept in their original order.
+    """
+    if not budget or count_tokens(text) <= budget:
+        return text
+    passages = list(dict.fromkeys(split_passages(text)))        # drop repeated passages
+    terms = set(_terms(prompt))
+    counts = [Counter(_terms(p)) for p in passages]
+    df = Counter(t for c in counts for t in terms if c[t])
+    n = len(passages)
+
+    def score(c):
+        length = max(sum(c.values()), 1)
+        return sum(
+            math.log(1 + n / df[t]) * c[t] * 2.2 / (c[t] + 1.2 * (0.25 + 0.75 * length / PASSAGE_WORDS))
+            for t in terms if c[t]
+        )
+
+    ranked = sorted(range(n), key=lambda i: score(counts[i]), reverse=True)
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = count_tokens(passages[i])
+        if used + cost > budget:
+            continue
+        chosen.add(i)
+        used += cost
+    if not chosen:
+        # a single passage larger than the budget: keep its head
+        return passages[ranked[0]][:budget * 4]
+    return "\n".join(passages[i] for i in sorted(chosen))
+
+def entity_key(record):
+    """Grouping key, or None when the record names no entity (never grouped)."""
+    identity = record_identity(record)
+    if not identity.strip("|"):
+        return None
+    return f"{record.get('type')}|{identity}"
+
+def group_entities(records, prompt, budget=TOKEN_BUDGET, dedup=ENTITY_DEDUP, stats=None):
+    """
+    [(representative, members)]: one plain-dict representative per entity,
+    whose combined_text merges the members' texts trimmed to `budget`.
+    A `stats` dict gets the combined_text token totals: "text_tokens" over
+    all records and "sent_tokens" over the representatives.
+    """
+    groups = {}
+    for n, record in enumerate(records):
+        key = entity_key(record) if dedup else None
+        groups.setdefault(key if key is not None else ("record", n), []).append(record)
+
+    out = []
+    for members in groups.values():
+        representative = dict(members[0])
+        if len(members) > 1 and budget:
+            text = "\n".join(m.get("combined_text") or "" for m in members)
+        else:
+            text = representative.get("combined_text") or ""
+        representative["combined_text"] = trim_text(text, prompt, budget)
+        out.append((representative, members))
+        if stats is not None:
+            stats["text_tokens"] = stats.get("text_tokens", 0) + sum(
+                count_tokens(m.get("combined_text")) for m in members)
+            stats["sent_tokens"] = stats.get("sent_tokens", 0) + count_tokens(representative["combined_text"])
+    return out
@@ -0,0 +1,264 @@
+"""
+Quantized tiers of the per-type shards (same row order as
+embeddings_by_type_fp16.npy, so the type offsets apply unchanged):
+
+    embeddings_by_type_int8.npy     (n, dim) int8, per-row symmetric scale
+    embeddings_by_type_scales.npy   (n,) float32, row ≈ int8 * scale / 127
+    embeddings_by_type_bits.npy     (n, dim / 8) uint8, packed sign bits
+
+Selected per query with search(..., tier=...):
+
+    fp16     current path (ANN or exact blocked scan)
+    int8     int8 scan (half the bytes), exact fp16 rescoring of the top candidates
+    binary   sign-bit Hamming scan (1/16 of the bytes) → int8 rescoring of a
+             shortlist → exact fp16 rescoring of the final sem_top_k
+
+Built by search init when QUANTIZED_TIERS=1, or `python quantized_tiers.py`.
+Benchmark against the exact fp16 scan (one process per tier for RSS):
+
+    python quantized_tiers.py bench --dir data --k 2000
+    python quantized_tiers.py bench --synthetic 500000 --out tiers.json
+"""
+import argparse
+import os
+import time
+import numpy as np
+
+from embedding_shards import SHARDS_FILE, SCAN_BLOCK
+from build_lock import build_lock, tmp_path
+
+INT8_FILE   = "embeddings_by_type_int8.npy"
+SCALES_FILE = "embeddings_by_type_scales.npy"
+BITS_FILE   = "embeddings_by_type_bits.npy"
+
+TIERS = ("fp16", "int8", "binary")
+BINARY_OVERSAMPLE = int(os.getenv("BINARY_OVERSAMPLE", "10"))    # Hamming shortlist = k × this
+RESCORE_OVERSAMPLE = int(os.getenv("RESCORE_OVERSAMPLE", "2"))   # fp16 rescoring of k × this
+
+def tier_paths(directory):
+    return [os.path.join(directory, f) for f in (INT8_FILE, SCALES_FILE, BITS_FILE)]
+
+def tiers_stale(directory):
+    """True if any tier file is missing or older than the fp16 shards."""
+    paths = tier_paths(directory)
+    if not all(os.path.exists(p) for p in paths):
+        return True
+    return min(os.path.getmtime(p) for p in paths) < os.path.getmtime(os.path.join(directory, SHARDS_FILE))
+
+def build_quantized_tiers(directory, block=65536):
+    """Quantize the fp16 shards in `directory` block by block."""
+    shards = np.load(os.path.join(directory, SHARDS_FILE), mmap_mode="r")
+    n, dim = shards.shape
+    int8_path, scales_path, bits_path = tier_paths(directory)
+    q8 = np.lib.format.open_memmap(tmp_path(int8_path, ".npy"), mode="w+", dtype=np.int8, shape=(n, dim))
+    bits = np.lib.format.open_memmap(tmp_path(bits_path, ".npy"), mode="w+", dtype=np.uint8,
+                                     shape=(n, (dim + 7) // 8))
+    scales = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block):
+        chunk = np.asarray(shards[start:start + block], dtype=np.float32)
+        scale = np.maximum(np.abs(chunk).max(axis=1), 1e-12)
+        q8[start:start + len(chunk)] = np.round(chunk / scale[:, None] * 127).astype(np.int8)
+        scales[start:start + len(chunk)] = scale / 127
+        bits[start:start + len(chunk)] = np.packbits(chunk > 0, axis=1)
+    q8.flush()
+    bits.flush()
+    del q8, bits
+    np.save(tmp_path(scales_path, ".npy"), scales)
+    for path in (int8_path, scales_path, bits_path):
+        os.replace(tmp_path(path, ".npy"), path)
+    print(f"[TIERS] wrote int8 + sign-bit tiers for {n} rows to {directory}")
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x):
+        return _POP8[x.view(np.uint8)].reshape(x.shape + (-1,)).sum(axis=-1, dtype=np.uint16)
+
+def _topk(scores, rows, k):
+    if len(scores) > k:
+        keep = np.argpartition(scores, -k)[-k:]
+        return rows[keep], scores[keep]
+    return rows, scores
+
+class QuantizedTiers:
+    def __init__(self, directory):
+        int8_path, scales_path, bits_path = tier_paths(directory)
+        self.int8 = np.load(int8_path, mmap_mode="r")
+        self.shards = np.load(os.path.join(directory, SHARDS_FILE), mmap_mode="r")   # exact rescoring
+        self.scales = np.load(scales_path, mmap_mode="r")
+        self.bits = np.load(bits_path, mmap_mode="r")
+        # 64-bit words when the row length allows: fewer XOR / popcount calls
+        words = self.bits.shape[1] // 8 if self.bits.shape[1] % 8 == 0 else 0
+        self._bits_words = self.bits.view(np.uint64).reshape(len(self.bits), words) if words else self.bits
+
+    def _hamming_shortlist(self, q, m, ranges, block):
+        qbits = np.packbits(q > 0)
+        qwords = qbits.view(np.uint64) if self._bits_words.dtype == np.uint64 else qbits
+        best_rows = np.empty(0, dtype=np.int64)
+        best = np.empty(0, dtype=np.int32)
+        for lo, hi in ranges:
+            for start in range(lo, hi, block):
+                stop = min(start + block, hi)
+                # similarity = -distance so the shared top-k helper keeps the nearest
+                sim = -_popcount(self._bits_words[start:stop] ^ qwords).sum(axis=1, dtype=np.int32)
+                rows, sim = _topk(sim, np.arange(start, stop), m)
+                best_rows, best = _topk(np.concatenate([best, sim]), np.concatenate([best_rows, rows]), m)
+        return best_rows
+
+    def _int8_scores(self, q, rows):
+        rows = np.sort(rows)                                   # sequential-ish gather from the mmap
+        return rows, (np.asarray(self.int8[rows], dtype=np.float32) @ q) * self.scales[rows]
+
+    def _int8_scan(self, q, m, ranges, block):
+        buf = np.empty((block, self.int8.shape[1]), dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        best = np.empty(0, dtype=np.float32)
+        for lo, hi in ranges:
+            for start in range(lo, hi, block):
+                stop = min(start + block, hi)
+                np.copyto(buf[:stop - start], self.int8[start:stop])
+                scores = (buf[:stop - start] @ q) * self.scales[start:stop]
+                rows, scores = _topk(scores, np.arange(start, stop), m)
+                best_rows, best = _topk(np.concatenate([best, scores]), np.concatenate([best_rows, rows]), m)
+        return best_rows
+
+    def topk(self, q, k, ranges, tier="binary", block=SCAN_BLOCK):
+        """
+        Shard row indices and exact fp16 scores of the approximate top-k over
+        the row `ranges`, best first.
+        """
+        q = np.asarray(q, dtype=np.float32).ravel()
+        rescore = k * RESCORE_OVERSAMPLE
+        if tier == "binary":
+            rows = self._hamming_shortlist(q, k * BINARY_OVERSAMPLE, ranges, block)
+            rows, scores = self._int8_scores(q, rows)
+            rows, _ = _topk(scores, rows, rescore)
+        elif tier == "int8":
+            rows = self._int8_scan(q, rescore, ranges, block)
+        else:
+            raise ValueError(f"Unknown quantized tier: {tier}")
+        rows = np.sort(rows)
+        exact = np.asarray(self.shards[rows], dtype=np.float32) @ q
+        rows, exact = _topk(exact, rows, k)
+        order = np.argsort(exact)[::-1]
+        return rows[order], exact[order]
+
+def load_quantized_tiers(directory):
+    """QuantizedTiers for `directory`, or None if missing or stale."""
+    if tiers_stale(directory):
+        return None
+    return QuantizedTiers(directory)
+
+# ---- benchmark: latency, RSS and recall of each tier against the exact fp16 scan ----
+
+def synthetic_shards(directory, n=200000, dim=384, clusters=256, seed=0):
+    """Clustered unit vectors written as an fp16 shards file, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    out = np.lib.format.open_memmap(os.path.join(directory, SHARDS_FILE), mode="w+",
+                                    dtype=np.float16, shape=(n, dim))
+    for start in range(0, n, 65536):
+        m = min(65536, n - start)
+        x = centers[rng.integers(clusters, size=m)] + 0.8 * rng.standard_normal((m, dim)).astype(np.float32)
+        out[start:start + m] = x / np.linalg.norm(x, axis=1, keepdims=True)
+    out.flush()
+
+def _bench_tier(directory, tier, queries_path, truth_path, k):
+    """
+    Runs in a fresh process so RSS reflects only the pages this tier touches.
+    rss_delta counts mapped file pages too (page cache: shared, reclaimable;
+    kernel fault-around maps neighbours of every gathered row); anon_delta is
+    the process's own heap.
+    """
+    import psutil
+    from embedding_shards import blocked_topk
+    proc = psutil.Process()
+    queries, truth = np.load(queries_path), np.load(truth_path)
+    shards = np.load(os.path.join(directory, SHARDS_FILE), mmap_mode="r")
+    tiers = None if tier == "fp16" else QuantizedTiers(directory)
+    ranges = [(0, len(shards))]
+    mem0 = proc.memory_info()
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        if tiers is None:
+            rows, _ = blocked_topk(shards, q, k, ranges)
+        else:
+            rows, _ = tiers.topk(q, k, ranges, tier=tier)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        recalls.append(len(set(rows.tolist()) & set(expected.tolist())) / k)
+    mem = proc.memory_info()
+    scanned = {"fp16": shards.nbytes, "int8": tiers and tiers.int8.nbytes,
+               "binary": tiers and tiers.bits.nbytes}[tier]
+    return {
+        "tier": tier,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "rss_delta_mb": round((mem.rss - mem0.rss) / 1024**2, 1),
+        "anon_delta_mb": round(((mem.rss - mem.shared) - (mem0.rss - mem0.shared)) / 1024**2, 1),
+        "scan_mb": round(scanned / 1024**2, 1),
+    }
+
+def bench(directory, queries=50, k=2000, seed=1):
+    """[report per tier]; ground truth is the exact fp16 blocked scan."""
+    import json
+    import subprocess
+    import sys
+    import tempfile
+    from embedding_shards import blocked_topk
+    if tiers_stale(directory):
+        build_quantized_tiers(directory)
+    shards = np.load(os.path.join(directory, SHARDS_FILE), mmap_mode="r")
+    rng = np.random.default_rng(seed)
+    # queries near stored rows, like real prompts near their answers
+    picks = np.asarray(shards[np.sort(rng.choice(len(shards), queries, replace=False))], dtype=np.float32)
+    q = picks + 0.5 * rng.standard_normal(picks.shape).astype(np.float32) / np.sqrt(shards.shape[1])
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    truth = np.stack([blocked_topk(shards, v, k, [(0, len(shards))])[0] for v in q])
+    del shards
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        queries_path, truth_path = os.path.join(tmp, "q.npy"), os.path.join(tmp, "truth.npy")
+        np.save(queries_path, q)
+        np.save(truth_path, truth)
+        for tier in TIERS:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "bench-tier", "--dir", directory,
+                                  "--tier", tier, "--queries-file", queries_path, "--truth-file", truth_path,
+                                  "--k", str(k)], capture_output=True, text=True, check=True)
+            reports.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            print(f"[TIERS] {reports[-1]}")
+    return reports
+
+if __name__ == "__main__":
+    import json
+    parser = argparse.ArgumentParser(description="Build or benchmark int8 and sign-bit tiers of the fp16 type shards.")
+    parser.add_argument("command", nargs="?", default="build", choices=["build", "bench", "bench-tier"])
+    parser.add_argument("--dir", default="data")
+    parser.add_argument("--synthetic", type=int, default=0, help="bench on N synthetic rows in a temp dir")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=2000)
+    parser.add_argument("--tier", choices=TIERS)
+    parser.add_argument("--queries-file")
+    parser.add_argument("--truth-file")
+    parser.add_argument("--out", help="write the bench report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with build_lock(args.dir):
+            build_quantized_tiers(args.dir)
+    elif args.command == "bench-tier":
+        print(json.dumps(_bench_tier(args.dir, args.tier, args.queries_file, args.truth_file, args.k)))
+    else:
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = args.dir
+            if args.synthetic:
+                directory = tmp
+                synthetic_shards(directory, n=args.synthetic)
+            reports = bench(directory, queries=args.queries, k=args.k)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(reports, f, indent=2)
@@ -0,0 +1,81 @@
+"""
+In-process query caches for search, each an LRU with a TTL:
+
+    embeddings   query text -> query embedding
+    semantic     (snapshot version, query text, types, k, exact, nprobe, tier, filters) -> semantic top-k
+    rerank       (snapshot version, query, record index) -> cross-encoder score
+
+Data-dependent layers are keyed by the snapshot version, so a hot reload
+(search.reload_snapshot) never serves results for the old data. The rerank
+layer is keyed on the raw query only, which is what the cross-encoder sees,
+so re-running a prompt with other search types or quotas reuses every
+pair already scored. stats() reports hits / misses per layer.
+
+QUERY_CACHE=off disables all layers.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE", "on") != "off"
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+class TTLCache:
+    """Thread-safe LRU with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, name, max_entries, ttl=QUERY_CACHE_TTL):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value or None."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data),
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0}
+
+def _layer(name, env, default):
+    return TTLCache(name, int(os.getenv(env, str(default))) if QUERY_CACHE_ENABLED else 0)
+
+embeddings = _layer("embeddings", "QUERY_CACHE_EMBEDDINGS", 10000)
+semantic = _layer("semantic", "QUERY_CACHE_SEMANTIC", 500)
+rerank = _layer("rerank", "QUERY_CACHE_RERANK_PAIRS", 200000)
+
+LAYERS = (embeddings, semantic, rerank)
+
+def stats():
+    return {layer.name: layer.stats() for layer in LAYERS}
+
+def clear():
+    for layer in LAYERS:
+        layer.clear()
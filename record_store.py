@@ -0,0 +1,193 @@
+"""
+Memory-mapped columnar store for data/records.json.
+
+Each field is a column of variable-length cells (one blob + an int64 end
+offset per record), and the record type is a uint8 code column. Workers
+mmap the files, so forked processes share one copy through the page cache
+and only the cells a query touches are ever decoded.
+
+    records_meta.json         {"n", "fields", "type_names"}
+    records_type.npy          (n,) uint8 type codes
+    records_f<i>.bin          concatenated cells of field i
+    records_f<i>.off          (n + 1,) raw int64 cell boundaries of field i
+
+A cell is empty when the record lacks the field, b"s" + utf-8 for strings
+and b"j" + JSON for anything else.
+"""
+import json
+import mmap
+import os
+from collections.abc import Mapping
+import numpy as np
+from build_lock import tmp_path
+
+META_FILE = "records_meta.json"
+TYPE_FILE = "records_type.npy"
+
+def _field_paths(directory, i):
+    base = os.path.join(directory, f"records_f{i}")
+    return base + ".bin", base + ".off"
+
+def store_stale(directory, records_path):
+    meta = os.path.join(directory, META_FILE)
+    return not os.path.exists(meta) or os.path.getmtime(meta) < os.path.getmtime(records_path)
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos, started = "", 0, False
+        while True:
+            # skip whitespace / separators, refilling the buffer as needed
+            while pos < len(buf) and buf[pos] in " \t\r\n,[":
+                if buf[pos] == "[":
+                    started = True
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]" and started:
+                return
+            if pos >= len(buf):
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield obj
+            pos = end
+
+def _encode(value):
+    if isinstance(value, str):
+        return b"s" + value.encode("utf-8")
+    return b"j" + json.dumps(value).encode("utf-8")
+
+def build_record_store(records_path, out_dir):
+    """Stream records.json into the columnar layout, one record at a time."""
+    os.makedirs(out_dir, exist_ok=True)
+    fields, blobs, ends, positions = {}, [], [], []
+    type_names, type_codes = {}, bytearray()
+    n = 0
+
+    for rec in iter_json_array(records_path):
+        type_codes.append(type_names.setdefault(rec["type"], len(type_names)))
+        for key, value in rec.items():
+            if key == "type":
+                continue
+            if key not in fields:
+                i = fields[key] = len(fields)
+                bin_path, off_path = _field_paths(out_dir, i)
+                blobs.append(open(tmp_path(bin_path), "wb"))
+                ends.append(open(tmp_path(off_path), "wb"))
+                positions.append(0)
+                # records seen before this field appeared have empty cells
+                ends[i].write(np.zeros(n + 1, dtype=np.int64).tobytes())
+            i = fields[key]
+            cell = _encode(value)
+            blobs[i].write(cell)
+            positions[i] += len(cell)
+        for i in range(len(fields)):
+            ends[i].write(np.int64(positions[i]).tobytes())
+        n += 1
+
+    for i in range(len(fields)):
+        blobs[i].close()
+        ends[i].close()
+        bin_path, off_path = _field_paths(out_dir, i)
+        os.replace(tmp_path(bin_path), bin_path)
+        os.replace(tmp_path(off_path), off_path)
+    np.save(tmp_path(os.path.join(out_dir, TYPE_FILE), ".npy"), np.frombuffer(bytes(type_codes), dtype=np.uint8))
+    os.replace(tmp_path(os.path.join(out_dir, TYPE_FILE), ".npy"), os.path.join(out_dir, TYPE_FILE))
+    meta = {"n": n, "fields": list(fields), "type_names": list(type_names)}
+    with open(tmp_path(os.path.join(out_dir, META_FILE)), "w") as f:
+        json.dump(meta, f)
+    # meta last: its mtime marks the store as complete
+    os.replace(tmp_path(os.path.join(out_dir, META_FILE)), os.path.join(out_dir, META_FILE))
+    print(f"[STORE] wrote {n} records, {len(fields)} fields to {out_dir}")
+
+class LazyRecord(Mapping):
+    """Read-only dict view of one stored record; fields are decoded on first access."""
+    __slots__ = ("_store", "index", "_cache")
+
+    def __init__(self, store, index):
+        self._store = store
+        self.index = index
+        self._cache = {}
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            self._cache[key] = self._store.field(self.index, key)
+        return self._cache[key]
+
+    def __iter__(self):
+        yield "type"
+        for name in self._store.fields:
+            if self._store.has_field(self.index, name):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"LazyRecord({self.index}, type={self['type']!r})"
+
+    @property
+    def store(self):
+        return self._store
+
+class RecordStore:
+    def __init__(self, directory):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.n = meta["n"]
+        self.fields = meta["fields"]
+        self.type_names = meta["type_names"]
+        self.type_codes = np.load(os.path.join(directory, TYPE_FILE), mmap_mode="r")
+        self._columns = {}
+        for i, name in enumerate(self.fields):
+            bin_path, off_path = _field_paths(directory, i)
+            ends = np.memmap(off_path, dtype=np.int64, mode="r")
+            with open(bin_path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(bin_path) else b""
+            self._columns[name] = (ends, data)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        return LazyRecord(self, int(index))
+
+    def type_of(self, index):
+        return self.type_names[self.type_codes[index]]
+
+    def has_field(self, index, name):
+        ends, _ = self._columns[name]
+        return ends[index + 1] > ends[index]
+
+    def field(self, index, name):
+        if name == "type":
+            return self.type_of(index)
+        if name not in self._columns:
+            raise KeyError(name)
+        ends, data = self._columns[name]
+        lo, hi = int(ends[index]), int(ends[index + 1])
+        if lo == hi:
+            raise KeyError(name)
+        cell = data[lo:hi]
+        if cell[:1] == b"s":
+            return cell[1:].decode("utf-8")
+        return json.loads(cell[1:])
+
+    def iter_field(self, name, default=""):
+        """Yield one field for every record in order (e.g. combined_text for index builds)."""
+        for i in range(self.n):
+            try:
+                yield self.field(i, name)
+            except KeyError:
+                yield default
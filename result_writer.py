@@ -0,0 +1,197 @@
+"""
+Row-by-row writers for enrichment results.
+
+enrich writes each result as soon as it completes into a spooled temp file
+(in memory up to RESULT_SPOOL_MAX_BYTES, then on disk), which tasks hands
+straight to a multipart S3 upload. Formats:
+
+    xlsx      one sheet per record type, XlsxWriter constant_memory mode
+    csv       zip of one CSV per record type
+    parquet   zip of one Parquet file per record type (needs pyarrow)
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+import zipfile
+from collections import namedtuple
+
+SPOOL_MAX_BYTES = int(os.getenv("RESULT_SPOOL_MAX_BYTES", str(16 * 1024**2)))
+
+SHEET_NAMES = {
+    "company": "Companies",
+    "deal": "Deals",
+    "trial": "Trials",
+    "asset": "Assets",
+    "award": "Awards",
+}
+
+# Define expected columns per record type
+EXPECTED_COLUMNS = {
+    "deal": [
+        "Acquirer", "Target Company", "Deal Type", "Deal Value",
+        "Payment Structure", "Financial Advisors", "Announcement Date",
+        "Deal Terms", "Strategic Rationale", "Additional Details"
+    ],
+    "company": [
+        "Company", "Asset", "Asset Target", "Asset Type",
+        "Modality", "Disease", "Global Highest Phase",
+        "Indication", "Mechanism/Technology"
+    ],
+    "trial": [
+        "BriefTitle", "NCTId", "TherapeuticArea", "StudyType", "Disease",
+        "Interventions", "Phase", "Sponsor", "Countries"
+    ]
+    # Add "asset": [...] here if needed
+}
+
+EnrichedOutput = namedtuple("EnrichedOutput", ["file", "extension", "content_type"])
+
+def sheet_name(key):
+    return SHEET_NAMES.get(key, key)[:31]
+
+def _cell(value):
+    """Scalars as-is; nested values as JSON text (spreadsheets hold no lists)."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value)
+
+class ResultWriter:
+    extension = None
+    content_type = None
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        self.columns = {}
+
+    def add_sheet(self, key, columns):
+        self.columns[key] = list(columns)
+        self._open_sheet(key)
+
+    def write_row(self, key, row):
+        self._write(key, [_cell(row.get(c)) for c in self.columns[key]])
+
+    def close(self):
+        """Finish the file and return it as an EnrichedOutput rewound to the start."""
+        self._close()
+        self.file.seek(0)
+        return EnrichedOutput(self.file, self.extension, self.content_type)
+
+class XlsxResultWriter(ResultWriter):
+    extension = "xlsx"
+    content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    def __init__(self):
+        import xlsxwriter
+        super().__init__()
+        # constant_memory flushes each row to a per-sheet temp file
+        self._book = xlsxwriter.Workbook(self.file, {"constant_memory": True})
+        self._sheets, self._next_row = {}, {}
+
+    def _open_sheet(self, key):
+        sheet = self._book.add_worksheet(sheet_name(key))
+        sheet.write_row(0, 0, self.columns[key])
+        self._sheets[key], self._next_row[key] = sheet, 1
+
+    def _write(self, key, values):
+        self._sheets[key].write_row(self._next_row[key], 0, values)
+        self._next_row[key] += 1
+
+    def _close(self):
+        self._book.close()
+
+class _ZippedSheetsWriter(ResultWriter):
+    """One spooled part per sheet, zipped on close (zipfile allows one open member at a time)."""
+    extension = "zip"
+    content_type = "application/zip"
+    part_extension = None
+
+    def __init__(self):
+        super().__init__()
+        self._parts = {}
+
+    def _close(self):
+        with zipfile.ZipFile(self.file, "w", zipfile.ZIP_DEFLATED) as zf:
+            for key, part in self._parts.items():
+                self._finish_part(key)
+                part.seek(0)
+                with zf.open(f"{sheet_name(key)}.{self.part_extension}", "w") as member:
+                    while chunk := part.read(1 << 20):
+                        member.write(chunk)
+                part.close()
+
+class CsvResultWriter(_ZippedSheetsWriter):
+    part_extension = "csv"
+
+    def __init__(self):
+        super().__init__()
+        self._csv = {}                              # key -> (text wrapper, csv writer)
+
+    def _open_sheet(self, key):
+        part = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+b")
+        text = io.TextIOWrapper(part, encoding="utf-8", newline="", write_through=True)
+        self._parts[key] = part
+        self._csv[key] = (text, csv.writer(text))
+        self._write(key, self.columns[key])
+
+    def _write(self, key, values):
+        self._csv[key][1].writerow(values)
+
+    def _finish_part(self, key):
+        text, _ = self._csv[key]
+        text.flush()
+        text.detach()                               # keep the binary part open for zipping
+
+class ParquetResultWriter(_ZippedSheetsWriter):
+    part_extension = "parquet"
+    ROW_GROUP = 1000
+
+    def __init__(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("parquet output requires pyarrow (pip install pyarrow)")
+        super().__init__()
+        self._writers, self._buffers = {}, {}
+
+    def _open_sheet(self, key):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        part = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        # everything as strings: result values are free text of mixed type
+        schema = pa.schema([(c, pa.string()) for c in self.columns[key]])
+        self._parts[key] = part
+        self._writers[key] = pq.ParquetWriter(part, schema)
+        self._buffers[key] = []
+
+    def _write(self, key, values):
+        self._buffers[key].append([None if v is None else str(v) for v in values])
+        if len(self._buffers[key]) >= self.ROW_GROUP:
+            self._flush(key)
+
+    def _flush(self, key):
+        import pyarrow as pa
+        rows = self._buffers[key]
+        if rows:
+            columns = list(zip(*rows))
+            self._writers[key].write_table(pa.table(
+                {c: list(columns[i]) for i, c in enumerate(self.columns[key])},
+                schema=self._writers[key].schema,
+            ))
+            self._buffers[key] = []
+
+    def _finish_part(self, key):
+        self._flush(key)
+        self._writers[key].close()
+
+WRITERS = {
+    "xlsx": XlsxResultWriter,
+    "csv": CsvResultWriter,
+    "parquet": ParquetResultWriter,
+}
+
+def get_writer(output_format="xlsx"):
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return WRITERS[output_format]()
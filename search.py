@@ -1,153 +1,504 @@
-import threading
-from sentence_transformers import util, SentenceTransformer, CrossEncoder
 import json
+import threading
+import time
 import numpy as np
-from rank_bm25 import BM25Okapi
-from file_downloader import download_files_from_s3
+from file_downloader import (download_files_from_s3, RECORDS_PATH, EMBEDDINGS_PATH,
+                             RECORDS_FILE, EMBEDDINGS_FILE, get_snapshot_source,
+                             sync_snapshot, latest_snapshot_version)
 from models import get_sentence_model, get_cross_encoder
+from ann_index import load_ivf_index, DEFAULT_NPROBE
+from embedding_shards import (shards_stale, build_type_shards, load_type_shards, blocked_topk,
+                              blocked_topk_many)
+from quantized_tiers import tiers_stale, build_quantized_tiers, load_quantized_tiers
+from field_index import fields_stale, build_field_index, FieldIndex
+from bm25_index import bm25_stale, build_bm25_index, BM25Index
+from record_store import store_stale, build_record_store, RecordStore
+from build_lock import build_lock
+import query_cache
+from metrics import span, RSS_BYTES
 import psutil, os
-import gc
 
 process = psutil.Process(os.getpid())
 
 def log_mem(step: str):
-    """Print current RSS in MB with a label."""
-    log = os.getenv("LOG_MEM")
-    if not log:
+    """Export current RSS as a gauge; with LOG_MEM, also print it in MB with a label."""
+    rss = process.memory_info().rss
+    RSS_BYTES.labels(step).set(rss)
+    if not os.getenv("LOG_MEM"):
         return
-    rss = process.memory_info().rss / 1024**2
-    print(f"[MEM] {step:30s}: {rss:7.1f} MB")
+    print(f"[MEM] {step:30s}: {rss / 1024**2:7.1f} MB")
 
 # ---- lazy initialization globals ----
 _init_lock = threading.Lock()
+_reload_lock = threading.Lock()
 _initialized = False
+_data = None                # SearchData of the snapshot being served
+_watcher_pid = None
 
-def _initialize_search_resources():
-    global records, indices_by_type, _tokenized_corpus, _bm25, _embeddings, _re_ranker, _initialized
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "300"))   # 0 → no hot reload
+QUANTIZED_TIERS = os.getenv("QUANTIZED_TIERS", "0") == "1"      # build int8 / sign-bit tiers at load
+SEARCH_TIER = os.getenv("SEARCH_TIER", "fp16")                  # default semantic tier per query
+
+class SearchData:
+    """
+    Everything one data version is served from: record store, type shards,
+    embeddings mmap, ANN and BM25 indexes. Derived indexes are built next to
+    the inputs in `data_dir` when missing or stale, under a per-directory
+    lock so concurrent processes build them once. A query takes one
+    reference (current_data()) so a concurrent reload never mixes versions.
+    """
+
+    def __init__(self, data_dir, version):
+        self.data_dir = data_dir
+        self.version = version
+        records_path = os.path.join(data_dir, RECORDS_FILE)
+        embeddings_path = os.path.join(data_dir, EMBEDDINGS_FILE)
+
+        # one process per host builds missing / stale indexes; the others wait and only open them
+        with build_lock(data_dir):
+            # columnar record store (mmap; rebuilt from records.json when it changes)
+            if store_stale(data_dir, records_path):
+                build_record_store(records_path, data_dir)
+            self.records = RecordStore(data_dir)
+            log_mem("after opening record store")
+
+            # structured-field prefilters: bitmaps + sorted ranges (rebuilt with the store)
+            if fields_stale(data_dir):
+                build_field_index(self.records, data_dir)
+            self.fields = FieldIndex(data_dir, self.records.type_codes, self.records.type_names)
+            log_mem("after loading field index")
+
+            # per-type contiguous shards + offset table (re-exported when inputs change)
+            if shards_stale(data_dir, records_path, embeddings_path):
+                build_type_shards(np.asarray(self.records.type_names)[self.records.type_codes],
+                                  embeddings_path, data_dir)
+            self.shards, self.shard_ids, self.type_offsets = load_type_shards(data_dir)
+            log_mem("after loading type shards mmap")
 
-    log_mem("start")
-    # 1) ensure we have the latest files
-    download_files_from_s3()
-    log_mem("after download_files_from_s3")
+            # optional int8 / sign-bit tiers of the shards (None → fp16 only)
+            if QUANTIZED_TIERS and tiers_stale(data_dir):
+                build_quantized_tiers(data_dir)
+            self.tiers = load_quantized_tiers(data_dir)
+            log_mem("after loading quantized tiers")
+
+            # embeddings in record order (memory‑map), used to score ANN candidates
+            self.embeddings = np.load(embeddings_path, mmap_mode="r")
+            log_mem("after loading embeddings mmap")
+
+            # IVF index built offline by ann_index.py (None → exact scan only)
+            self.ann_index = load_ivf_index(embeddings_path)
+            log_mem("after loading ANN index")
+
+            # corpus-level BM25 inverted index (rebuilt when records change)
+            if bm25_stale(data_dir, records_path):
+                build_bm25_index(self.records.iter_field("combined_text"), data_dir)
+            self.bm25 = BM25Index(data_dir)
+            log_mem("after loading BM25 index")
+
+    def type_ranges(self, search_types):
+        """Shard row ranges [(start, end), ...] for the selected types."""
+        return [self.type_offsets[t] for t in search_types if t in self.type_offsets]
+
+    def type_mask(self, search_types):
+        """Boolean mask over record indices for the selected types."""
+        mask = np.zeros(len(self.embeddings), dtype=bool)
+        for lo, hi in self.type_ranges(search_types):
+            mask[self.shard_ids[lo:hi]] = True
+        return mask
+
+    def allowed_mask(self, search_types, filters):
+        """type_mask narrowed by structured `filters`, or None when no filter applies."""
+        field_mask = self.fields.mask(filters) if filters else None
+        return None if field_mask is None else self.type_mask(search_types) & field_mask
+
+    def allowed_rows(self, search_types, allowed):
+        """Sorted shard rows of the selected types whose records pass `allowed`."""
+        rows = [lo + np.flatnonzero(allowed[self.shard_ids[lo:hi]]) for lo, hi in self.type_ranges(search_types)]
+        return np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+
+def _local_version():
+    """Version tag for the unversioned data/ files (their mtimes)."""
+    return "local-" + "-".join(
+        str(int(os.path.getmtime(p))) for p in (RECORDS_PATH, EMBEDDINGS_PATH)
+    )
 
-    # 2) load JSON
-    with open("data/records.json", 'r') as f:
-        records = json.load(f)
-    log_mem("after loading JSON")
+def _initialize_search_resources():
+    global _data, _re_ranker, _initialized
 
-    # 3) build indices_by_type
-    indices_by_type = {}
-    for idx, rec in enumerate(records):
-        indices_by_type.setdefault(rec["type"], []).append(idx)
-    log_mem("after building indices_by_type")
+    with span("init"):
+        log_mem("start")
+        # 1) ensure we have the latest files: a versioned snapshot, or data/ as before
+        with span("s3_check"):
+            source = get_snapshot_source()
+            if source is None:
+                download_files_from_s3()
+                data_dir, version = os.path.dirname(RECORDS_PATH), _local_version()
+            else:
+                version, data_dir = sync_snapshot(source)
+        log_mem("after fetching data files")
 
-    # 4) embeddings (memory‑map)
-    _embeddings = np.load("data/embeddings_fp16.npy", mmap_mode="r")
-    log_mem("after loading embeddings mmap")
+        # 2) record store, shards, embeddings, ANN + BM25 indexes
+        _data = SearchData(data_dir, version)
 
-    # 5) cross‑encoder
-    _re_ranker = get_cross_encoder()
-    log_mem("after get_cross_encoder()")
+        # 3) cross‑encoder
+        _re_ranker = get_cross_encoder()
+        log_mem("after get_cross_encoder()")
 
     _initialized = True
     log_mem("finished init")
 
-def _ensure_initialized():
+def _ensure_initialized(watch=True):
     with _init_lock:
         if not _initialized:
             _initialize_search_resources()
+    if watch:
+        _start_snapshot_watcher()
 
-def search(query, search_types, model,
-           sem_top_k=2000,      # first stage semantic cut
-           alpha=0.7,           # hybrid α weight
-           top_k=1000,          # how many to return
-           rerank_top_n=500):   # how many to rerank
+def current_data():
+    """The SearchData new queries are served from."""
+    _ensure_initialized()
+    return _data
 
+def snapshot_version():
+    return current_data().version
+
+def reload_snapshot(source=None):
+    """
+    Load the source's current version if it differs from the one being
+    served. Download and index building happen outside _init_lock, so queries
+    keep running on the old version; only the reference swap takes the lock.
+    Returns True if a new version was swapped in.
+    """
+    global _data
+    source = source or get_snapshot_source()
+    if source is None:
+        return False
     _ensure_initialized()
+    with _reload_lock:
+        if latest_snapshot_version(source) == _data.version:
+            return False
+        version, data_dir = sync_snapshot(source)
+        fresh = SearchData(data_dir, version)
+        with _init_lock:
+            old, _data = _data, fresh
+    print(f"[SNAPSHOT] now serving {version} (was {old.version})")
+    return True
 
-    def normalize(arr: np.ndarray) -> np.ndarray:
-        mn, mx = arr.min(), arr.max()
-        return (arr - mn) / (mx - mn) if mx > mn else arr * 0
+def _watch_snapshots():
+    while True:
+        time.sleep(SNAPSHOT_POLL_SECONDS)
+        try:
+            reload_snapshot()
+        except Exception as e:
+            print(f"[SNAPSHOT] reload failed, still serving {_data.version}: {e}")
 
-    # 1) Semantic stage: filter by type, then chunked top-k
-    # flatten & filter indices_by_type
-    all_type_idxs = [
-        i
-        for t in search_types
-        for i in indices_by_type.get(t, [])
-    ]
-    if not all_type_idxs:
-        return []
+def _start_snapshot_watcher():
+    """One polling thread per process (threads do not survive a fork)."""
+    global _watcher_pid
+    if not SNAPSHOT_POLL_SECONDS or get_snapshot_source() is None or _watcher_pid == os.getpid():
+        return
+    with _init_lock:
+        if _watcher_pid != os.getpid():
+            _watcher_pid = os.getpid()
+            threading.Thread(target=_watch_snapshots, daemon=True).start()
 
-    # encode once as a tensor
-    q_emb = model.encode(
-        query + " " + " ".join(search_types),
-        convert_to_tensor=True
-    )
+def _semantic_stage(data, q_emb, search_types, sem_top_k, exact=False, nprobe=None, tier="fp16",
+                    allowed=None):
+    """
+    Top `sem_top_k` record indices of the selected types with their cosine
+    scores (the model emits unit vectors, so dot == cosine). Uses the IVF
+    index when one is loaded, otherwise (or with exact=True) a blocked scan
+    of the type shards straight from the mmap. tier="int8" / "binary" scans
+    the quantized tiers instead and rescores the shortlist on fp16.
+    With an `allowed` record mask (field prefilters) only the surviving shard
+    rows are gathered and scored exactly, whatever the tier or index.
+    """
+    if allowed is not None:
+        rows, scores = blocked_topk(data.shards, q_emb, sem_top_k, None,
+                                    rows=data.allowed_rows(search_types, allowed))
+        return data.shard_ids[rows].tolist(), scores
+
+    if tier != "fp16" and not exact:
+        if data.tiers is None:
+            print(f"[SEARCH] tier {tier!r} not built for {data.data_dir}, using fp16")
+        else:
+            rows, scores = data.tiers.topk(q_emb, sem_top_k, data.type_ranges(search_types), tier=tier)
+            return data.shard_ids[rows].tolist(), scores
 
-    # slice embeddings, run semantic_search
-    emb_slice = _embeddings[all_type_idxs].astype(np.float32)    # mmap‑backed, cheap
-    hits = util.semantic_search(
-        query_embeddings=q_emb,
-        corpus_embeddings=emb_slice,
-        top_k=sem_top_k
-    )[0]                                               # list of dicts
-
-    # unpack hits → absolute record indices + normalized scores
-    top_idxs      = [all_type_idxs[h['corpus_id']] for h in hits]
-    top_sem_scores= np.array([h['score']        for h in hits])
-    top_sem_norm  = normalize(top_sem_scores)
-
-    # free big buffers
-    del emb_slice, hits, top_sem_scores
-    gc.collect()
-
-    # 2) Lexical stage: BM25 only on top_idxs
-    small_corpus = [records[i]["combined_text"].lower().split() for i in top_idxs]
-    small_bm25        = BM25Okapi(small_corpus)
-
-    lex_scores_small  = small_bm25.get_scores(query.lower().split())
-    lex_norm_small    = normalize(lex_scores_small)
-
-    # free corpus & bm25 if you like
-    del small_corpus, small_bm25
-    gc.collect()
-
-    # 3) Combine & pick top_k
-    combined = alpha * top_sem_norm + (1 - alpha) * lex_norm_small
-    pick     = np.argsort(combined)[::-1][:top_k]
-    candidates = [
-        (records[top_idxs[i]], combined[i])
-        for i in pick
+    if data.ann_index is not None and not exact:
+        top_idxs, scores = data.ann_index.search(
+            data.embeddings, q_emb, sem_top_k,
+            nprobe=nprobe or DEFAULT_NPROBE, allowed=data.type_mask(search_types)
+        )
+        available = sum(hi - lo for lo, hi in data.type_ranges(search_types))
+        if len(top_idxs) >= min(sem_top_k, available):
+            return top_idxs.tolist(), scores
+        # index out of step with the shards (rows missing from its lists) → exact scan below
+        print(f"[SEARCH] ANN found {len(top_idxs)} of {sem_top_k} candidates, using exact scan")
+
+    rows, scores = blocked_topk(data.shards, q_emb, sem_top_k, data.type_ranges(search_types))
+    return data.shard_ids[rows].tolist(), scores
+
+def ann_recall(queries, search_types, model, sem_top_k=2000, nprobe=None):
+    """
+    Mean recall@sem_top_k of the ANN semantic stage against the exact scan,
+    for tuning `nprobe` / ANN_NPROBE.
+    """
+    data = current_data()
+    if data.ann_index is None or not data.type_ranges(search_types):
+        return 1.0
+    recalls = []
+    for query in queries:
+        q_emb = model.encode(query + " " + " ".join(search_types))
+        exact, _ = _semantic_stage(data, q_emb, search_types, sem_top_k, exact=True)
+        approx, _ = _semantic_stage(data, q_emb, search_types, sem_top_k, nprobe=nprobe)
+        recalls.append(len(set(exact) & set(approx)) / max(len(exact), 1))
+    return float(np.mean(recalls))
+
+DEFAULT_TYPE_QUOTA = 50     # results kept per search type
+DEFAULT_SCORE_FLOOR = -1.0  # cross-encoder score below which results are dropped
+
+def _normalize(arr: np.ndarray) -> np.ndarray:
+    if not len(arr):
+        return arr
+    mn, mx = arr.min(), arr.max()
+    return (arr - mn) / (mx - mn) if mx > mn else arr * 0
+
+def _encode_many(model, texts):
+    """
+    Query embeddings (read-only, shared by every cache hit); the uncached
+    texts go through one model.encode call.
+    """
+    embs = [query_cache.embeddings.get(t) for t in texts]
+    missing = [n for n, e in enumerate(embs) if e is None]
+    if missing:
+        encoded = np.asarray(model.encode([texts[n] for n in missing]), dtype=np.float32)
+        for n, emb in zip(missing, encoded):
+            emb = emb.copy()
+            emb.flags.writeable = False
+            query_cache.embeddings.set(texts[n], emb)
+            embs[n] = emb
+    return embs
+
+def _cross_scores(data, pairs, re_ranker):
+    """
+    Cross-encoder scores for (query, record index) pairs, from any number of
+    queries; only uncached pairs are predicted, in one batched call.
+    """
+    scores = [query_cache.rerank.get((data.version, query, i)) for query, i in pairs]
+    missing = [n for n, sc in enumerate(scores) if sc is None]
+    if missing:
+        predicted = re_ranker.predict([(pairs[n][0], data.records[pairs[n][1]]["combined_text"])
+                                       for n in missing])
+        for n, score in zip(missing, predicted):
+            scores[n] = float(score)
+            query_cache.rerank.set((data.version, *pairs[n]), scores[n])
+    return scores
+
+def _rerank_many(data, jobs, score_floor, rerank_top_n, re_ranker):
+    """
+    Cross-encode each type's hybrid-ordered head in quota-sized rounds, for
+    every (query, heads, quotas) job at once: one batched predict per round
+    across all queries and types. A type stops once `quota` of its reranked
+    candidates clear the floor: the quota is filled, and candidates further
+    down the hybrid order are not scored at all.
+    Pair scores are cached per snapshot version (query_cache.rerank).
+    Returns per job {type: [(record index, score), ...]} best first, cut to the quota.
+    """
+    heads = {(n, t): head for n, (_, job_heads, _) in enumerate(jobs) for t, head in job_heads.items()}
+    quotas = {(n, t): jobs[n][2][t] for n, t in heads}
+    reranked = {key: [] for key in heads}
+    pos = {key: 0 for key in heads}
+    active = [key for key in heads if len(heads[key])]
+    while active:
+        batch = []
+        for key in active:
+            stop = min(pos[key] + quotas[key], rerank_top_n, len(heads[key]))
+            batch.extend((key, i) for i in heads[key][pos[key]:stop])
+            pos[key] = stop
+        pairs = [(jobs[key[0]][0], i) for key, i in batch]
+        for (key, i), score in zip(batch, _cross_scores(data, pairs, re_ranker)):
+            reranked[key].append((i, score))
+        active = [
+            key for key in active
+            if pos[key] < min(rerank_top_n, len(heads[key]))
+            and sum(sc >= score_floor for _, sc in reranked[key]) < quotas[key]
+        ]
+
+    results = [{} for _ in jobs]
+    for (n, t), scored in reranked.items():
+        scored.sort(key=lambda x: x[1], reverse=True)
+        kept = [(i, sc) for i, sc in scored if sc >= score_floor]
+        if len(kept) == len(scored):
+            # nothing fell below the floor: the un-reranked tail follows in hybrid order
+            kept += [(i, None) for i in heads[n, t][pos[n, t]:]]
+        results[n][t] = kept[:quotas[n, t]]
+    return results
+
+def _hybrid_heads(data, query, q_emb, search_types, top_idxs, top_sem_scores, alpha, top_k, lex_top_k,
+                  allowed=None):
+    """
+    Lexical + hybrid stages on a semantic top-k: ({type: [record index, ...]}
+    in hybrid order, cut to top_k; {record index: hybrid score}).
+    `allowed` (field prefilters) also restricts the lexical-only candidates.
+    """
+    records = data.records
+
+    # 2) Lexical stage: corpus-level BM25 scored on the candidate set
+    with span("bm25"):
+        if lex_top_k:
+            # recall exact company / drug names the embedding stage missed
+            lex_idxs, _ = data.bm25.top_k(query, lex_top_k,
+                                          allowed=data.type_mask(search_types) if allowed is None else allowed)
+            seen  = set(top_idxs)
+            extra = np.array(sorted(i for i in lex_idxs.tolist() if i not in seen), dtype=np.int64)
+            if len(extra):
+                extra_sem = np.asarray(data.embeddings[extra], dtype=np.float32) @ np.asarray(q_emb, dtype=np.float32)
+                top_idxs       = top_idxs + extra.tolist()
+                top_sem_scores = np.concatenate([top_sem_scores, extra_sem])
+
+        top_idxs     = np.asarray(top_idxs, dtype=np.int64)
+        top_sem_norm = _normalize(top_sem_scores)
+        lex_norm     = _normalize(data.bm25.get_scores(query, top_idxs))
+
+    # 3) Combine, then keep a per-type head of up to top_k in hybrid order
+    combined = alpha * top_sem_norm + (1 - alpha) * lex_norm
+    cand_types = np.asarray(records.type_codes)[top_idxs]
+    heads = {}
+    for t in search_types:
+        members = np.flatnonzero(cand_types == records.type_names.index(t))
+        order = members[np.argsort(combined[members])[::-1][:top_k]]
+        heads[t] = top_idxs[order].tolist()
+    return heads, dict(zip(top_idxs.tolist(), combined.tolist()))
+
+def _semantic_many(data, q_embs, search_types, sem_top_k, exact=False, nprobe=None, tier="fp16",
+                   allowed=None):
+    """
+    _semantic_stage for several query embeddings. When the stage is an exact
+    fp16 scan (no ANN index, exact=True, or field prefilters) all queries
+    share one pass over the shards; ANN probes and quantized tiers run per query.
+    """
+    if allowed is not None or (tier == "fp16" and (data.ann_index is None or exact)):
+        rows = None if allowed is None else data.allowed_rows(search_types, allowed)
+        hits = blocked_topk_many(data.shards, np.stack(q_embs), sem_top_k, data.type_ranges(search_types),
+                                 rows=rows)
+        return [(data.shard_ids[rows].tolist(), scores) for rows, scores in hits]
+    return [_semantic_stage(data, q_emb, search_types, sem_top_k, exact=exact, nprobe=nprobe, tier=tier)
+            for q_emb in q_embs]
+
+def _search_many_indices(queries, search_types, model, sem_top_k=2000, alpha=0.7, top_k=1000,
+                         rerank_top_n=500, exact=False, nprobe=None, tier=None, lex_top_k=0,
+                         type_quotas=None, score_floor=DEFAULT_SCORE_FLOOR, filters=None,
+                         re_ranker=None, data=None):
+    """
+    search_many() on record indices: [{type: [(record index, score), ...]}, ...]
+    in query order. `re_ranker` overrides the process-wide cross-encoder
+    (e.g. a batched proxy); `data` pins the snapshot the indices refer to
+    (default: current_data()).
+    """
+    data = data or current_data()
+
+    search_types = [t for t in dict.fromkeys(search_types) if t in data.type_offsets]
+    if not search_types or not queries:
+        return [{} for _ in queries]
+    # 0) Structured prefilter: field indexes ∩ type index, before any embedding math
+    allowed = data.allowed_mask(search_types, filters)
+    if allowed is not None and not allowed.any():
+        return [{} for _ in queries]
+    quotas = {t: (type_quotas or {}).get(t, DEFAULT_TYPE_QUOTA) for t in search_types}
+
+    # 1) Semantic stage: all queries encoded in one call, uncached ones scanned together
+    q_texts = [query + " " + " ".join(search_types) for query in queries]
+    with span("encode", queries=len(q_texts)):
+        q_embs = _encode_many(model, q_texts)
+
+    tier = tier or SEARCH_TIER
+    filter_key = json.dumps(filters, sort_keys=True) if allowed is not None else None
+    sem_keys = [(data.version, q_text, tuple(search_types), sem_top_k, exact, nprobe, tier, filter_key)
+                for q_text in q_texts]
+    semantic = [query_cache.semantic.get(key) for key in sem_keys]
+    missing = [n for n, hit in enumerate(semantic) if hit is None]
+    if missing:
+        with span("semantic", queries=len(missing)):
+            computed = _semantic_many(data, [q_embs[n] for n in missing], search_types, sem_top_k,
+                                      exact=exact, nprobe=nprobe, tier=tier, allowed=allowed)
+        for n, hit in zip(missing, computed):
+            hit[1].flags.writeable = False
+            query_cache.semantic.set(sem_keys[n], hit)
+            semantic[n] = hit
+
+    # 2-3) Lexical + hybrid heads per query
+    jobs, hybrids = [], []
+    for query, q_emb, (top_idxs, top_sem_scores) in zip(queries, q_embs, semantic):
+        heads, hybrid = _hybrid_heads(data, query, q_emb, search_types, top_idxs, top_sem_scores,
+                                      alpha, top_k, lex_top_k, allowed=allowed)
+        jobs.append((query, heads, quotas))
+        hybrids.append(hybrid)
+
+    # 4) Cross-encoder rerank: pairs of every query in one predict per round
+    with span("rerank"):
+        results = _rerank_many(data, jobs, score_floor, rerank_top_n, re_ranker or _re_ranker)
+    return [
+        {t: [(i, hybrid[i] if sc is None else sc) for i, sc in scored] for t, scored in result.items()}
+        for result, hybrid in zip(results, hybrids)
     ]
 
-    # 4) Optional Cross‑Encoder rerank on the head
-    head    = candidates[:rerank_top_n]
-    texts   = [r["combined_text"] for r,_ in head]
-    queries = [query] * len(head)
+def _search_indices(query, search_types, model, **options):
+    """search() on record indices: {type: [(record index, score), ...]}."""
+    return _search_many_indices([query], search_types, model, **options)[0]
 
-    rerank_scores = _re_ranker.predict(list(zip(queries, texts)))
-    reranked     = sorted(
-        [(head[i][0], rerank_scores[i]) for i in range(len(head))],
-        key=lambda x: x[1],
-        reverse=True
-    )
+def search(query, search_types, model,
+           sem_top_k=2000,      # first stage semantic cut
+           alpha=0.7,           # hybrid α weight
+           top_k=1000,          # hybrid candidates kept per type
+           rerank_top_n=500,    # max reranked per type
+           exact=False,         # bypass the ANN index
+           nprobe=None,         # ANN lists scanned per query (recall/latency knob)
+           tier=None,           # "fp16" | "int8" | "binary" semantic tier (default SEARCH_TIER)
+           lex_top_k=0,         # extra lexical-only candidates from the global BM25 index
+           type_quotas=None,    # {type: n} results per type (default DEFAULT_TYPE_QUOTA)
+           score_floor=DEFAULT_SCORE_FLOOR,
+           filters=None):       # {field: value | [values] | {"min", "max"}} prefilters (field_index.py)
+    """
+    Hybrid semantic + BM25 retrieval with cross-encoder rerank, grouped by type:
+    {type: [(record, score), ...]} with at most the type's quota, best first.
+    """
+    data = current_data()
+    grouped = _search_indices(query, search_types, model, sem_top_k=sem_top_k, alpha=alpha,
+                              top_k=top_k, rerank_top_n=rerank_top_n, exact=exact, nprobe=nprobe,
+                              tier=tier, lex_top_k=lex_top_k, type_quotas=type_quotas, score_floor=score_floor,
+                              filters=filters, data=data)
+    records = data.records
+    return {t: [(records[i], score) for i, score in scored] for t, scored in grouped.items()}
 
-    final = reranked + candidates[rerank_top_n:]
-    return final
+def search_many(queries, search_types, model, **options):
+    """
+    search() for several related queries at once: one encode call, one shard
+    scan and one cross-encoder predict per rerank round for the whole batch,
+    so the cost grows with batch size rather than query count. Takes the same
+    options as search(); returns one {type: [(record, score), ...]} per query.
+    """
+    data = current_data()
+    grouped = _search_many_indices(list(queries), search_types, model, data=data, **options)
+    records = data.records
+    return [{t: [(records[i], score) for i, score in scored] for t, scored in result.items()}
+            for result in grouped]
 
-def filter(company_score_pairs, doc_type):
+def filter(company_score_pairs, doc_type, limit=DEFAULT_TYPE_QUOTA, score_floor=DEFAULT_SCORE_FLOOR):
     """
     Filter the keyword relevance data to return most relevant results.
-    For now, returns top 50 with a threshold score.
-    Could potentially return results that surpass some relevance threshold.
+    Accepts search()'s grouped output (already cut to quota and floor) or a
+    flat best-first list of (record, score) pairs; returns up to `limit`
+    records of `doc_type`.
     """
+    if isinstance(company_score_pairs, dict):
+        return [record for record, _ in company_score_pairs.get(doc_type, [])[:limit]]
     records = []
     for record, score in company_score_pairs:
-        if len(records) == 50:
+        if len(records) == limit:
             break
-        if score < -1:
+        if score < score_floor:
             break
         if record["type"] == doc_type:
             records.append(record)
-    return records
\ No newline at end of file
+    return records
@@ -0,0 +1,129 @@
+"""
+Thin client for search_service.py. Workers call search() here instead of
+search.search(): the daemon does the model work, the worker only maps the
+returned record indices through its own mmap of the record store.
+
+While the daemon is warming up (503) the client waits for it with a short
+backoff, up to SEARCH_SERVICE_WARMUP_WAIT seconds. Only if the daemon is
+unreachable (not started, restarting) or never becomes ready does the query
+run in-process, loading models and indexes on first use as before. Other
+service errors are raised.
+"""
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+
+from search_service import SERVICE_HOST, SERVICE_PORT, SERVICE_SOCKET
+from record_store import RecordStore
+
+CLIENT_TIMEOUT = float(os.getenv("SEARCH_SERVICE_TIMEOUT", "120"))
+WARMUP_WAIT = float(os.getenv("SEARCH_SERVICE_WARMUP_WAIT", "120"))
+WARMUP_BACKOFF_MAX = 5.0        # seconds between retries while the daemon warms up
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+class ServiceError(RuntimeError):
+    def __init__(self, path, status, error):
+        super().__init__(f"search service {path}: {status} {error}")
+        self.status = status
+
+class _Unavailable(Exception):
+    """The daemon cannot serve this query; run it in-process."""
+
+def _connection():
+    if SERVICE_SOCKET:
+        return _UnixHTTPConnection(SERVICE_SOCKET, CLIENT_TIMEOUT)
+    return http.client.HTTPConnection(SERVICE_HOST, SERVICE_PORT, timeout=CLIENT_TIMEOUT)
+
+def _request(path, body=None):
+    conn = _connection()
+    try:
+        if body is None:
+            conn.request("GET", path)
+        else:
+            conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        payload = json.loads(response.read() or b"{}")
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise ServiceError(path, response.status, payload.get("error"))
+    return payload
+
+def _call(path, body):
+    """_request, waiting out the daemon's warm-up; _Unavailable when it is unreachable or never ready."""
+    deadline = time.monotonic() + WARMUP_WAIT
+    delay = 0.25
+    while True:
+        try:
+            return _request(path, body)
+        except OSError as e:
+            raise _Unavailable(e)
+        except ServiceError as e:
+            if e.status != 503:
+                raise
+            if time.monotonic() + delay > deadline:
+                raise _Unavailable(f"still warming up after {WARMUP_WAIT:.0f}s")
+            print(f"[SEARCH] service warming up; retrying in {delay:.2f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_BACKOFF_MAX)
+
+def open_store(data_dir):
+    """RecordStore for `data_dir`, opened once per process."""
+    with _stores_lock:
+        if data_dir not in _stores:
+            _stores[data_dir] = RecordStore(data_dir)
+        return _stores[data_dir]
+
+def service_available():
+    try:
+        return _request("/healthz").get("ready", False)
+    except (OSError, RuntimeError):
+        return False
+
+def search(query, search_types, model=None, **options):
+    """
+    Same contract as search.search: {type: [(record, score), ...]}.
+    `model` is only used by the in-process fallback (loaded lazily if None).
+    """
+    try:
+        payload = _call("/search", {"query": query, "search_types": list(search_types),
+                                    "options": options})
+    except _Unavailable as e:
+        print(f"[SEARCH] service unavailable ({e}); searching in-process")
+        import search as local
+        from models import get_sentence_model
+        return local.search(query, search_types, model or get_sentence_model(), **options)
+
+    records = open_store(payload["data_dir"])
+    return {t: [(records[i], score) for i, score in scored]
+            for t, scored in payload["results"].items()}
+
+def search_many(queries, search_types, model=None, **options):
+    """Same contract as search.search_many: one {type: [(record, score), ...]} per query."""
+    try:
+        payload = _call("/search_many", {"queries": list(queries), "search_types": list(search_types),
+                                         "options": options})
+    except _Unavailable as e:
+        print(f"[SEARCH] service unavailable ({e}); searching in-process")
+        import search as local
+        from models import get_sentence_model
+        return local.search_many(queries, search_types, model or get_sentence_model(), **options)
+
+    records = open_store(payload["data_dir"])
+    return [{t: [(records[i], score) for i, score in scored] for t, scored in result.items()}
+            for result in payload["results"]]
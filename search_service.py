@@ -0,0 +1,222 @@
+"""
+Local search daemon: one process owns the models and indexes for every
+Celery worker on the host, and coalesces concurrent requests into batches.
+
+    python search_service.py                         # 127.0.0.1:8765
+    SEARCH_SERVICE_SOCKET=/tmp/ctic-search.sock python search_service.py
+
+POST /search {"query", "search_types", "options"} runs search._search_indices
+and answers {"results": {type: [[record index, score], ...]}, "data_dir", "version"};
+POST /search_many {"queries", ...} runs search._search_many_indices and answers
+with "results" as one such dict per query;
+clients map indices to records through their own mmap of the record store
+(search_client.py). GET /healthz reports readiness.
+
+Encode and rerank calls from concurrent requests go through MicroBatcher:
+the first request opens a batch that closes at SEARCH_BATCH_MAX_ITEMS items
+or SEARCH_BATCH_MAX_WAIT_MS after it arrived, whichever comes first.
+"""
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import search
+import query_cache
+from models import get_sentence_model, get_cross_encoder
+
+SERVICE_HOST = os.getenv("SEARCH_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SEARCH_SERVICE_PORT", "8765"))
+SERVICE_SOCKET = os.getenv("SEARCH_SERVICE_SOCKET")       # Unix socket path, overrides host/port
+BATCH_MAX_ITEMS = int(os.getenv("SEARCH_BATCH_MAX_ITEMS", "256"))
+BATCH_MAX_WAIT_MS = float(os.getenv("SEARCH_BATCH_MAX_WAIT_MS", "10"))
+
+class MicroBatcher:
+    """
+    Runs `fn(list of items) -> sequence of results` on one background thread,
+    merging the items of requests that arrive within the max-wait deadline.
+    """
+
+    def __init__(self, fn, max_items=BATCH_MAX_ITEMS, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.fn = fn
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, items):
+        """Block until `items` have been processed; returns their results in order."""
+        request = {"items": list(items), "done": threading.Event()}
+        if not request["items"]:
+            return []
+        self._queue.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["results"]
+
+    def _loop(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0]["items"])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_items:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(request)
+                size += len(request["items"])
+            self._run(pending)
+
+    def _run(self, pending):
+        items = [item for request in pending for item in request["items"]]
+        try:
+            results = self.fn(items)
+            self.batches += 1
+            self.items += len(items)
+            pos = 0
+            for request in pending:
+                n = len(request["items"])
+                request["results"] = results[pos:pos + n]
+                pos += n
+        except Exception as e:
+            for request in pending:
+                request["error"] = e
+        for request in pending:
+            request["done"].set()
+
+class BatchedEncoder:
+    """model.encode(str) through a MicroBatcher."""
+
+    def __init__(self, model):
+        self._batcher = MicroBatcher(lambda texts: model.encode(texts))
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._batcher.submit([sentences])[0]
+        return np.asarray(self._batcher.submit(sentences))
+
+class BatchedCrossEncoder:
+    """cross_encoder.predict(pairs) through a MicroBatcher."""
+
+    def __init__(self, cross_encoder):
+        self._batcher = MicroBatcher(lambda pairs: cross_encoder.predict(pairs))
+
+    def predict(self, pairs, **kwargs):
+        return np.asarray(self._batcher.submit([tuple(p) for p in pairs]))
+
+class SearchService:
+    def __init__(self):
+        self.ready = False
+        self.encoder = None
+        self.re_ranker = None
+
+    def load(self):
+        search._ensure_initialized()
+        self.encoder = BatchedEncoder(get_sentence_model())
+        self.re_ranker = BatchedCrossEncoder(get_cross_encoder())
+        self.encoder.encode("warm up")
+        self.ready = True
+
+    def search(self, query, search_types, options):
+        data = search.current_data()           # indices below refer to this snapshot
+        results = search._search_indices(query, search_types, self.encoder,
+                                         re_ranker=self.re_ranker, data=data, **options)
+        return {
+            "results": {t: [[int(i), float(s)] for i, s in scored] for t, scored in results.items()},
+            "data_dir": data.data_dir,
+            "version": data.version,
+        }
+
+    def search_many(self, queries, search_types, options):
+        data = search.current_data()
+        results = search._search_many_indices(queries, search_types, self.encoder,
+                                              re_ranker=self.re_ranker, data=data, **options)
+        return {
+            "results": [{t: [[int(i), float(s)] for i, s in scored] for t, scored in result.items()}
+                        for result in results],
+            "data_dir": data.data_dir,
+            "version": data.version,
+        }
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "encode_batches": self.encoder._batcher.batches if self.encoder else 0,
+            "rerank_batches": self.re_ranker._batcher.batches if self.re_ranker else 0,
+            "query_cache": query_cache.stats(),
+        }
+
+def _make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def address_string(self):
+            return str(self.client_address or "unix")
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                return self._send(200 if service.ready else 503, service.stats())
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path not in ("/search", "/search_many"):
+                return self._send(404, {"error": "not found"})
+            if not service.ready:
+                return self._send(503, {"error": "warming up"})
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            try:
+                if self.path == "/search_many":
+                    return self._send(200, service.search_many(body["queries"], body["search_types"],
+                                                               body.get("options", {})))
+                self._send(200, service.search(body["query"], body["search_types"], body.get("options", {})))
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    return Handler
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service):
+    handler = _make_handler(service)
+    if SERVICE_SOCKET:
+        if os.path.exists(SERVICE_SOCKET):
+            os.remove(SERVICE_SOCKET)
+        return ThreadingUnixHTTPServer(SERVICE_SOCKET, handler)
+    server = ThreadingHTTPServer((SERVICE_HOST, SERVICE_PORT), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    service = SearchService()
+    server = make_server(service)
+    # listen immediately so /healthz can report warm-up, then load models + indexes
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Search service listening on {SERVICE_SOCKET or f'{SERVICE_HOST}:{SERVICE_PORT}'}, loading...")
+    service.load()
+    print("Search service ready")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,34 @@
+"""
+Celery app and task signatures shared by the web tier and the workers.
+
+The web process enqueues by task name through this module and never imports
+tasks.py, so gpt / models / search (torch, numpy, openai ...) are loaded in
+the workers only. importtime_check.py guards that.
+"""
+import os
+
+from celery import Celery
+
+# Initialize the Celery app (using Redis as the broker)
+broker_url = os.environ.get("CELERY_BROKER_URL")
+result_backend = os.environ.get("CELERY_RESULT_BACKEND")
+celery = Celery('tasks',
+                broker=broker_url,
+                backend=result_backend)
+
+ENRICH_TASK = "tasks.enrich_data_task"
+ENRICH_CHUNK_TASK = "tasks.enrich_chunk_task"
+MERGE_CHUNKS_TASK = "tasks.merge_chunks_task"
+ENRICH_MANY_TASK = "tasks.enrich_many_task"
+
+def enqueue_enrich(prompt, search_types, request_id, mode="interactive", output_format="xlsx",
+                   task_id=None, dedup_key=None, filters=None):
+    """Queue enrich_data_task by name; returns the AsyncResult."""
+    return celery.send_task(ENRICH_TASK, args=[prompt, search_types, request_id, mode, output_format],
+                            kwargs={"dedup_key": dedup_key, "filters": filters}, task_id=task_id)
+
+def enqueue_enrich_many(prompts, search_types, request_id, mode="interactive", output_format="xlsx",
+                        task_id=None, dedup_key=None, filters=None):
+    """Queue enrich_many_task (several related prompts, one output file) by name."""
+    return celery.send_task(ENRICH_MANY_TASK, args=[list(prompts), search_types, request_id, mode, output_format],
+                            kwargs={"dedup_key": dedup_key, "filters": filters}, task_id=task_id)
@@ -1,22 +1,65 @@
-from celery import Celery
+from celery import chord
+from celery.exceptions import Ignore
+from celery.signals import (worker_init, worker_process_init, worker_process_shutdown, worker_ready,
+                            worker_shutdown)
 from gpt import *
 import boto3, uuid, os, json, datetime, io
+from boto3.s3.transfer import TransferConfig
 import re, textwrap
-from file_downloader import download_files_from_s3
-from models import get_sentence_model
-from search import search, filter
-
-# Initialize the Celery app (using Redis as the broker)
-broker_url = os.environ.get("CELERY_BROKER_URL")
-result_backend = os.environ.get("CELERY_RESULT_BACKEND")
-celery = Celery('tasks', 
-                broker=broker_url,
-                backend=result_backend)             
+from search import filter
+import search_client
+import warm_start
+import dedup
+import metrics
+from task_signatures import celery, ENRICH_TASK, ENRICH_CHUNK_TASK, MERGE_CHUNKS_TASK, ENRICH_MANY_TASK
+from progress import ProgressPublisher, ChunkProgress, progress_meta, clear_chunk_progress
+from prompt_compaction import entity_key
+from gpt_batch import clear_checkpoints
 
 S3_BUCKET = os.environ.get('S3_BUCKET_NAME')
 s3 = boto3.client("s3")
+UPLOAD_CONFIG = TransferConfig(multipart_threshold=8 * 1024**2, multipart_chunksize=8 * 1024**2)
+
+# interactive jobs with more GPT-backed records than this fan out as a chord of chunks
+ENRICH_CHUNK_SIZE = int(os.environ.get("ENRICH_CHUNK_SIZE", "50"))
+CHUNK_MAX_RETRIES = int(os.environ.get("ENRICH_CHUNK_MAX_RETRIES", "3"))
+
+# ---- worker warm start (see warm_start.py) ----
+_startup_report = None
+
+@worker_init.connect
+def _preload(**kwargs):
+    """Prefork parent: load data + models once so pool children inherit them."""
+    global _startup_report
+    if warm_start.WORKER_PRELOAD:
+        _startup_report = warm_start.preload()
+    if metrics.METRICS_PORT:
+        metrics.serve(metrics.METRICS_PORT)
 
-model = None
+@worker_process_shutdown.connect
+def _drop_process_metrics(pid=None, **kwargs):
+    metrics.mark_process_dead(pid or os.getpid())
+
+@worker_process_init.connect
+def _after_fork(**kwargs):
+    if warm_start.WORKER_PRELOAD:
+        warm_start.after_fork()
+
+@worker_ready.connect
+def _mark_ready(sender=None, **kwargs):
+    try:
+        key = warm_start.publish_ready(_startup_report or warm_start.StartupReport(),
+                                       getattr(sender, "hostname", None))
+        warm_start.keep_ready(key)
+    except Exception as e:
+        print(f"[WARM] could not publish readiness: {e}")
+
+@worker_shutdown.connect
+def _mark_not_ready(sender=None, **kwargs):
+    try:
+        warm_start.clear_ready(getattr(sender, "hostname", None))
+    except Exception as e:
+        print(f"[WARM] could not clear readiness: {e}")
 
 def _sanitize_kw(prompt):
    """join prompt with '_' and keep only safe chars"""
@@ -24,62 +67,240 @@ def _sanitize_kw(prompt):
    safe = re.sub(r"[^A-Za-z0-9\-]+", "_", "_".join(prompt))  # → china_ophthalmology
    return textwrap.shorten(safe, width=40, placeholder="")
 
-def _upload_excel(raw_bytes: bytes, prompt, rid) -> str:
-    key = f"results/{_sanitize_kw(prompt)}_{rid}.xlsx"
-    s3.put_object(
-        Bucket=S3_BUCKET,
-        Key=key,
-        Body=raw_bytes,
-        ContentType=(
-            "application/vnd.openxmlformats-"
-            "officedocument.spreadsheetml.sheet"
-        ),
-        ServerSideEncryption="aws:kms",
-    )
+def _upload_result(output, prompt, rid) -> str:
+    """Stream an EnrichedOutput to S3 (multipart above the threshold) and close it."""
+    key = f"results/{_sanitize_kw(prompt)}_{rid}.{output.extension}"
+    try:
+        with metrics.span("s3_upload"):
+            s3.upload_fileobj(
+                output.file,
+                S3_BUCKET,
+                key,
+                ExtraArgs={
+                    "ContentType": output.content_type,
+                    "ServerSideEncryption": "aws:kms",
+                },
+                Config=UPLOAD_CONFIG,
+            )
+    finally:
+        output.file.close()
     return key
 
-@celery.task(bind=True)
-def enrich_data_task(self, prompt, search_types, request_id):
-    self.update_state(state='PROGRESS', meta={'status': 'Identifying companies and assets of interest...'})
-    global model
-    if model is None:
-        download_files_from_s3()         # grab JSON + embeddings
-        model = get_sentence_model()  # load the SentenceTransformer
-        _ = model.encode("warm up")
+# acks_late: a worker lost mid-job gets the task redelivered, and batch-mode
+# jobs then resume from their checkpoint instead of resubmitting.
+@celery.task(name=ENRICH_TASK, bind=True, acks_late=True, reject_on_worker_lost=True)
+def enrich_data_task(self, prompt, search_types, request_id, mode="interactive",
+                     output_format="xlsx", dedup_key=None, filters=None):
+    # progress goes out coalesced: Redis pub/sub for /events, result backend for /status
+    publisher = ProgressPublisher(self.request.id,
+                                  on_flush=lambda state, meta: self.update_state(state=state, meta=meta))
+    try:
+        with metrics.trace(self.request.id) as trace:
+            result = _enrich(self, publisher, prompt, search_types, request_id, mode, output_format,
+                             dedup_key, filters)
+            result["trace"] = trace.summary()
+    except Ignore:
+        raise                                       # replaced by the chunk chord (see _fan_out)
+    except _FannedOut as fanned:
+        return fanned.result                        # eager: merge_chunks_task already finished the job
+    except Exception as e:
+        _finish_failed(publisher, dedup_key, self.request.id, e)
+        raise
+    _finish_done(publisher, dedup_key, self.request.id, result)
+    return result
 
+def _finish_done(publisher, dedup_key, task_id, result):
+    metrics.JOBS.labels("done").inc()
+    publisher.finish("SUCCESS", result)
+    try:
+        dedup.mark_done(dedup_key, task_id, result["s3_key"])
+    except Exception as e:
+        print(f"[DEDUP] could not record {task_id}: {e}")
+
+def _finish_failed(publisher, dedup_key, task_id, error):
+    metrics.JOBS.labels("failed").inc()
+    publisher.finish("FAILURE", {"status": str(error)})
+    try:
+        dedup.release(dedup_key, task_id)
+    except Exception as e:
+        print(f"[DEDUP] could not release {task_id}: {e}")
+
+def _enrich(self, publisher, prompt, search_types, request_id, mode, output_format, dedup_key, filters=None):
+    publisher.update({'status': 'Identifying companies and assets of interest...'})
     records = []
-    matched = search(prompt, search_types, model)
+    # local search daemon if running, else in-process (preloaded by worker_init, or on first use)
+    # grouped by type, quota-limited; structured filters narrow the candidates before the scan
+    with metrics.span("search"):
+        matched = search_client.search(prompt, search_types, filters=filters)
     for search_type in search_types:
-        filtered = filter(matched, doc_type=search_type)
-        if filtered:
-            records.extend(filtered)
-    
+        records.extend(filter(matched, doc_type=search_type))
+
     # Count only GPT‑backed records for progress
-    total = len([r for r in records if r.get("type") != "trial"])
-
-    def progress_cb(done, tot):
-        pct = int(done * 100 / tot) if tot else 100
-        self.update_state(
-            state="PROGRESS",
-            meta={
-                "status": f"Processed {done}/{tot} records",
-                "current": done,
-                "total": tot,
-                "percent": pct,
-            },
-        )
+    gpt_records = [r for r in records if r.get("type") not in PASSTHROUGH_TYPES]
+    total = len(gpt_records)
+    if mode == "interactive" and total > ENRICH_CHUNK_SIZE:
+        publisher.flush()
+        _fan_out(self, prompt, records, gpt_records, request_id, output_format, dedup_key,
+                 metrics.current_trace().summary())
+
+    def progress_cb(done, tot, cache_hits=0):
+        publisher.update(progress_meta(done, tot, cache_hits))
 
     # first update so the front‑end sees 0 %
     progress_cb(0, total)
-    excel_b64 = enrich(records, prompt, progress_cb=progress_cb)
-
-    # decode & upload
-    excel_bytes = base64.b64decode(excel_b64)
-    s3_key = _upload_excel(excel_bytes, prompt, request_id)
+    with metrics.span("enrich", records=total):
+        output = enrich(records, prompt, progress_cb=progress_cb,
+                        mode=mode, job_id=str(request_id), output_format=output_format)
+    publisher.flush()                               # last coalesced count before the upload
+    s3_key = _upload_result(output, prompt, request_id)
+    if mode == "batch":
+        clear_checkpoints(str(request_id))          # kept until now so a failed upload does not resubmit
 
     # return only a small payload
     return {
         "status": "Task completed!",
         "s3_key": s3_key,
         "filename": os.path.basename(s3_key)
-    }
\ No newline at end of file
+    }
+
+# ---- multi-prompt jobs: one search_many batch, one output file ----
+
+@celery.task(name=ENRICH_MANY_TASK, bind=True, acks_late=True, reject_on_worker_lost=True)
+def enrich_many_task(self, prompts, search_types, request_id, mode="interactive",
+                     output_format="xlsx", dedup_key=None, filters=None):
+    """
+    Several related prompts (e.g. one per indication or region) searched as
+    one batch (search_many) and enriched into a single file with a Prompt column.
+    """
+    publisher = ProgressPublisher(self.request.id,
+                                  on_flush=lambda state, meta: self.update_state(state=state, meta=meta))
+    try:
+        with metrics.trace(self.request.id) as trace:
+            result = _enrich_many(publisher, prompts, search_types, request_id, mode, output_format, filters)
+            result["trace"] = trace.summary()
+    except Exception as e:
+        _finish_failed(publisher, dedup_key, self.request.id, e)
+        raise
+    _finish_done(publisher, dedup_key, self.request.id, result)
+    return result
+
+def _enrich_many(publisher, prompts, search_types, request_id, mode, output_format, filters=None):
+    publisher.update({'status': f'Identifying companies and assets of interest for {len(prompts)} prompts...'})
+    prompt_records = []
+    with metrics.span("search", queries=len(prompts)):
+        batches = search_client.search_many(prompts, search_types, filters=filters)
+    for prompt, matched in zip(prompts, batches):
+        records = []
+        for search_type in search_types:
+            records.extend(filter(matched, doc_type=search_type))
+        prompt_records.append((prompt, records))
+
+    def progress_cb(done, tot, cache_hits=0):
+        publisher.update(progress_meta(done, tot, cache_hits))
+
+    total = sum(1 for _, records in prompt_records for r in records if r.get("type") not in PASSTHROUGH_TYPES)
+    progress_cb(0, total)
+    with metrics.span("enrich", records=total):
+        output = enrich_many(prompt_records, progress_cb=progress_cb,
+                             mode=mode, job_id=str(request_id), output_format=output_format)
+    publisher.flush()
+    s3_key = _upload_result(output, prompts[0], request_id)
+    if mode == "batch":
+        clear_checkpoints(str(request_id))
+    return {
+        "status": "Task completed!",
+        "s3_key": s3_key,
+        "filename": os.path.basename(s3_key)
+    }
+
+# ---- chunked fan-out: enrich_chunk_task × N → merge_chunks_task ----
+
+class _FannedOut(Exception):
+    """Eager mode: the chunk chord ran inline and its callback finished the job."""
+
+    def __init__(self, result):
+        super().__init__("replaced by chunk chord")
+        self.result = result
+
+def _fan_out(self, prompt, records, gpt_records, request_id, output_format, dedup_key, trace=None):
+    """
+    Replace this task with a chord: GPT-backed records split into chunks of
+    ENRICH_CHUNK_SIZE, enriched in parallel by any worker, merged into one
+    file by the callback (which takes over this task's id and result).
+    Chunks carry record-store indices, not records; `trace` (this task's
+    stage summary so far) is merged into the job's trace by the callback.
+    """
+    data_dir = records[0].store.directory
+    # same-entity records in the same chunk, so they still share one GPT call
+    order = sorted(range(len(gpt_records)), key=lambda n: entity_key(gpt_records[n]) or "")
+    indices = [gpt_records[n].index for n in order]
+    passthrough = [r.index for r in records if r.get("type") in PASSTHROUGH_TYPES]
+    chunks = [indices[i:i + ENRICH_CHUNK_SIZE] for i in range(0, len(indices), ENRICH_CHUNK_SIZE)]
+    print(f"[FANOUT] {self.request.id}: {len(indices)} records in {len(chunks)} chunks")
+    header = [
+        enrich_chunk_task.s(prompt, data_dir, chunk, self.request.id, n, len(indices))
+        for n, chunk in enumerate(chunks)
+    ]
+    callback = merge_chunks_task.s(prompt, data_dir, passthrough, request_id,
+                                   output_format, self.request.id, dedup_key, trace)
+    # raises Ignore; eager mode runs the chord inline and returns its result instead
+    raise _FannedOut(self.replace(chord(header, callback)))
+
+@celery.task(name=ENRICH_CHUNK_TASK, bind=True, acks_late=True, reject_on_worker_lost=True,
+             autoretry_for=(Exception,), max_retries=CHUNK_MAX_RETRIES,
+             retry_backoff=True, retry_jitter=True)
+def enrich_chunk_task(self, prompt, data_dir, indices, parent_id, chunk_no, total):
+    """
+    Enrich one chunk; returns {"rows": [[record index, record type, result], ...],
+    "trace": stage summary}. A retried chunk re-serves its finished records
+    from the enrichment cache.
+    """
+    store = search_client.open_store(data_dir)
+    records = [store[i] for i in indices]
+    progress = ChunkProgress(
+        parent_id, chunk_no, total,
+        on_flush=lambda state, meta: self.update_state(task_id=parent_id, state=state, meta=meta),
+    )
+    rows = []
+    # spans of every chunk trace under the parent's id
+    with metrics.trace(parent_id) as trace:
+        with metrics.span("enrich", records=len(records)):
+            enrich_results(
+                records, prompt,
+                lambda record, result: rows.append([record.index, record.get("type", "Unknown"), result]),
+                progress_cb=lambda done, tot, cache_hits=0: progress.update(done, cache_hits),
+                job_id=f"{parent_id}:{chunk_no}",
+            )
+    return {"rows": rows, "trace": trace.summary()}
+
+@celery.task(name=MERGE_CHUNKS_TASK, bind=True)
+def merge_chunks_task(self, chunks, prompt, data_dir, passthrough, request_id,
+                      output_format, parent_id, dedup_key=None, trace=None):
+    """
+    Chord callback: one output file from all chunks, uploaded like an
+    unchunked job; the job's trace merges the parent's, the chunks' and its own.
+    """
+    publisher = ProgressPublisher(parent_id)
+    clear_chunk_progress(parent_id)
+    try:
+        with metrics.trace(parent_id) as merge_trace:
+            store = search_client.open_store(data_dir)
+            writer = open_writer([store[i] for i in passthrough], output_format)
+            for chunk in chunks:
+                for _, record_type, result in chunk["rows"]:
+                    write_result(writer, record_type, result)
+            with metrics.span("result_build", format=output_format):
+                output = writer.close()
+            s3_key = _upload_result(output, prompt, request_id)
+    except Exception as e:
+        _finish_failed(publisher, dedup_key, parent_id, e)
+        raise
+    result = {
+        "status": "Task completed!",
+        "s3_key": s3_key,
+        "filename": os.path.basename(s3_key),
+        "trace": metrics.merge_summaries([trace] + [chunk["trace"] for chunk in chunks]
+                                         + [merge_trace.summary()], parent_id),
+    }
+    _finish_done(publisher, dedup_key, parent_id, result)
+    return result
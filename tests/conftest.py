@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# the modules are top-level scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# gpt creates its OpenAI client at import time
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """fake_openai.py server that every GPT engine talks to; yields its state (request counts)."""
+    import fake_openai
+    import gpt
+    import gpt_batch
+    from openai import OpenAI
+
+    server, state = fake_openai.serve(port=0)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    monkeypatch.setenv("OPENAI_BASE_URL", base_url)            # gpt_async builds its client per job
+    client = OpenAI(base_url=base_url, api_key="fake")
+    monkeypatch.setattr(gpt, "client", client)
+    monkeypatch.setattr(gpt_batch, "client", client)
+    yield state
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def enrich_cache(monkeypatch, tmp_path):
+    """A fresh SQLite enrichment cache for the GPT engines."""
+    import gpt
+    import gpt_async
+    import gpt_batch
+    from enrich_cache import SQLiteCache
+
+    cache = SQLiteCache(str(tmp_path / "enrich_cache.sqlite3"))
+    for module in (gpt, gpt_async, gpt_batch):
+        monkeypatch.setattr(module, "get_cache", lambda: cache)
+    return cache
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from ann_index import build_ivf_index, IVFIndex
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n, dim = 30000, 32
+    centres = rng.standard_normal((60, dim))
+    x = centres[rng.integers(0, 60, n)] + 0.6 * rng.standard_normal((n, dim))
+    x = (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float16)
+    directory = tmp_path_factory.mktemp("ann")
+    path = directory / "embeddings_fp16.npy"
+    np.save(path, x)
+    build_ivf_index(str(path), n_lists=200)
+    return x, IVFIndex(str(directory))
+
+def _exact(x, q, k, allowed):
+    scores = x.astype(np.float32) @ q
+    scores[~allowed] = -np.inf
+    return np.argsort(-scores)[:k]
+
+@pytest.mark.parametrize("share", [1.0, 0.3, 0.05])
+@pytest.mark.parametrize("k", [100, 1000])
+def test_masked_search_fills_top_k_with_exact_recall(corpus, share, k):
+    x, index = corpus
+    rng = np.random.default_rng(1)
+    allowed = rng.random(len(x)) < share
+    recalls = []
+    for _ in range(10):
+        q = x[rng.integers(len(x))].astype(np.float32)
+        got, scores = index.search(x, q, k, nprobe=8, allowed=allowed)
+        assert len(got) == k
+        assert allowed[got].all()
+        assert (np.diff(scores) <= 0).all()
+        recalls.append(len(set(got.tolist()) & set(_exact(x, q, k, allowed).tolist())) / k)
+    assert np.mean(recalls) >= 0.95
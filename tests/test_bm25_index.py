@@ -0,0 +1,76 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from bm25_index import BM25Index, build_bm25_index, tokenize
+
+CORPUS = [
+    "The kinase inhibitor for the retina",
+    "the retina gene therapy the company runs",
+    "An antibody for the liver and the kidney",
+    "the kinase the kinase the kinase",
+    "Gene therapy for the eye",
+    "the",
+    "ophthalmology company in the clinic",
+]
+
+class ReferenceBM25:
+    """rank_bm25.BM25Okapi (0.2.2), which bm25_index replaces, restated."""
+
+    def __init__(self, corpus, k1=1.5, b=0.75, epsilon=0.25):
+        self.k1, self.b = k1, b
+        docs = [tokenize(text) for text in corpus]
+        self.doc_freqs = [Counter(doc) for doc in docs]
+        self.doc_len = np.array([len(doc) for doc in docs])
+        self.avgdl = self.doc_len.sum() / len(docs)
+        nd = Counter(word for freqs in self.doc_freqs for word in freqs)
+        self.idf, negative = {}, []
+        for word, freq in nd.items():
+            self.idf[word] = math.log(len(docs) - freq + 0.5) - math.log(freq + 0.5)
+            if self.idf[word] < 0:
+                negative.append(word)
+        eps = epsilon * sum(self.idf.values()) / len(self.idf)
+        for word in negative:
+            self.idf[word] = eps
+
+    def get_scores(self, query):
+        score = np.zeros(len(self.doc_freqs))
+        for q in tokenize(query):
+            q_freq = np.array([freqs.get(q, 0) for freqs in self.doc_freqs])
+            score += (self.idf.get(q) or 0) * (q_freq * (self.k1 + 1) /
+                                               (q_freq + self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)))
+        return score
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("bm25")
+    build_bm25_index(iter(CORPUS), str(directory))
+    return BM25Index(str(directory))
+
+QUERIES = ["kinase retina", "the kinase", "gene therapy company", "the the liver", "unknown words", "THE Eye"]
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_scores_match_bm25okapi(index, query):
+    reference = ReferenceBM25(CORPUS).get_scores(query)
+    assert np.allclose(index.get_scores(query, np.arange(len(CORPUS))), reference, rtol=1e-5, atol=1e-6)
+    subset = np.array([6, 0, 3])                             # any order, any subset
+    assert np.allclose(index.get_scores(query, subset), reference[subset], rtol=1e-5, atol=1e-6)
+
+def test_negative_idf_is_floored(index):
+    reference = ReferenceBM25(CORPUS)
+    assert reference.idf["the"] > 0                          # in most documents: floored to epsilon * mean
+    assert np.isclose(index.idf[index.vocab["the"]], reference.idf["the"], rtol=1e-5)
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_top_k_ranks_like_the_reference(index, query):
+    reference = ReferenceBM25(CORPUS).get_scores(query)
+    ids, scores = index.top_k(query, 3)
+    expected = sorted((s for s in reference if s > 0), reverse=True)[:3]
+    assert np.allclose(scores, expected, rtol=1e-5)
+    assert np.allclose(reference[ids], scores, rtol=1e-5)
+    allowed = np.zeros(len(CORPUS), dtype=bool)
+    allowed[[1, 3, 4]] = True
+    ids, _ = index.top_k(query, 10, allowed=allowed)
+    assert set(ids) <= {1, 3, 4}
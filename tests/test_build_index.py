@@ -0,0 +1,88 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import build_index
+from file_downloader import RECORDS_FILE, EMBEDDINGS_FILE
+
+# stand-in for sentence_transformers in the spawned build workers: deterministic
+# vectors per text, and every encoded text logged to BUILD_TEST_ENCODE_LOG
+FAKE_ENCODER = '''
+import os, zlib
+import numpy as np
+
+class SentenceTransformer:
+    def __init__(self, name):
+        self.name = name
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        if texts != ["dimension probe"]:
+            with open(os.environ["BUILD_TEST_ENCODE_LOG"], "a") as f:
+                f.writelines(t.replace("\\n", " ") + "\\n" for t in texts)
+        out = [np.random.default_rng(zlib.crc32(t.encode())).standard_normal(16) for t in texts]
+        return np.array([v / np.linalg.norm(v) for v in out], dtype=np.float32)
+'''
+
+@pytest.fixture
+def encoder_log(tmp_path, monkeypatch):
+    package = tmp_path / "fake_models" / "sentence_transformers"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text(FAKE_ENCODER)
+    monkeypatch.syspath_prepend(str(package.parent))         # spawned workers inherit sys.path
+    log = tmp_path / "encoded.log"
+    log.write_text("")
+    monkeypatch.setenv("BUILD_TEST_ENCODE_LOG", str(log))
+    return log
+
+def _raw(path, records):
+    path.write_text("\n".join(json.dumps(r) for r in records))
+    return str(path)
+
+def _encoded(log):
+    texts = log.read_text().splitlines()
+    log.write_text("")
+    return texts
+
+def _build(raw, out_dir, **kwargs):
+    build_index.build_index(raw, str(out_dir), workers=2, chunk_size=2, **kwargs)
+    with open(os.path.join(out_dir, RECORDS_FILE)) as f:
+        records = json.load(f)
+    return records, np.load(os.path.join(out_dir, EMBEDDINGS_FILE))
+
+RECORDS = [{"type": "company", "company": f"Company {i}", "country": "China"} for i in range(7)]
+
+def test_incremental_build_encodes_only_changes_and_matches_a_full_build(tmp_path, encoder_log):
+    out = tmp_path / "data"
+    records, first = _build(_raw(tmp_path / "raw.jsonl", RECORDS), out)
+    assert len(_encoded(encoder_log)) == 7
+    assert records[0]["combined_text"] == "company: Company 0\ncountry: China"
+    assert first.shape == (7, 16) and first.dtype == np.float16
+
+    changed = RECORDS[:3] + [dict(RECORDS[3], country="Japan")] + RECORDS[4:] + [{"type": "deal", "acquirer": "X"}]
+    raw = _raw(tmp_path / "raw2.jsonl", changed)
+    records, incremental = _build(raw, out)
+    assert sorted(_encoded(encoder_log)) == ["acquirer: X", "company: Company 3 country: Japan"]
+    assert [r["combined_text"] for r in records][-1] == "acquirer: X"
+
+    _, full = _build(raw, tmp_path / "full", full=True)
+    assert np.array_equal(incremental, full)
+    assert not [name for name in os.listdir(out) if ".tmp" in name or ".partial" in name]
+
+def test_unchanged_input_loads_no_model(tmp_path, encoder_log):
+    raw = _raw(tmp_path / "raw.jsonl", RECORDS)
+    _, first = _build(raw, tmp_path / "data")
+    _encoded(encoder_log)
+    _, again = _build(raw, tmp_path / "data")
+    assert _encoded(encoder_log) == []
+    assert np.array_equal(first, again)
+
+def test_missing_build_meta_forces_a_full_re_embed(tmp_path, encoder_log):
+    # a crash between swapping the embeddings and writing the meta: nothing may be reused
+    raw = _raw(tmp_path / "raw.jsonl", RECORDS)
+    _build(raw, tmp_path / "data")
+    _encoded(encoder_log)
+    os.remove(tmp_path / "data" / build_index.BUILD_META_FILE)
+    _build(raw, tmp_path / "data")
+    assert len(_encoded(encoder_log)) == 7
@@ -0,0 +1,60 @@
+import pytest
+
+import dedup
+
+class FakeRedis:
+    """The few Redis commands dedup uses, in memory (expiry ignored)."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+@pytest.fixture
+def redis(monkeypatch):
+    r = FakeRedis()
+    monkeypatch.setattr(dedup, "_redis", lambda: r)
+    monkeypatch.setattr(dedup, "snapshot_version", lambda: "v1")
+    return r
+
+def _submit(enqueue, request_id="r1"):
+    return dedup.submit("kinase inhibitors", ["company"], request_id, "interactive", "xlsx", enqueue)
+
+def test_identical_submissions_attach_then_reuse(redis):
+    queued = []
+    task_id, _, status, _ = _submit(lambda tid, key: queued.append((tid, key)))
+    assert status == "new" and len(queued) == 1
+
+    assert _submit(queued.append, "r2")[:3] == (task_id, "r1", "attached")
+    dedup.mark_done(queued[0][1], task_id, "results/kinase.xlsx")
+    assert _submit(queued.append, "r3") == (task_id, "r1", "reused", "results/kinase.xlsx")
+    assert dedup.result_key(task_id) == "results/kinase.xlsx"
+    assert len(queued) == 1
+
+def test_failed_enqueue_releases_the_claim(redis):
+    def broker_down(task_id, key):
+        raise ConnectionError("broker unavailable")
+
+    with pytest.raises(ConnectionError):
+        _submit(broker_down)
+    assert not redis.data
+
+    queued = []
+    _, _, status, _ = _submit(lambda tid, key: queued.append(tid), "r2")
+    assert status == "new" and len(queued) == 1
@@ -0,0 +1,66 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from field_index import FieldIndex, build_field_index
+from record_store import RecordStore, build_record_store
+
+RECORDS = [
+    {"type": "trial", "Phase": "Phase 2", "start": "2019-05-01", "combined_text": "a"},
+    {"type": "trial", "Phase": "Phase 3", "start": "2021-02-10", "combined_text": "b"},
+    {"type": "deal", "value": "$150M", "date": "2020-03-15", "combined_text": "c"},
+    {"type": "deal", "value": "$1.2B", "date": "2021-07-01", "combined_text": "d"},
+    {"type": "deal", "value": "90M", "date": "2022-01-20", "combined_text": "e"},
+    {"type": "company", "company": "Alpha", "combined_text": "f"},
+]
+
+def _build(directory, records):
+    path = os.path.join(directory, "records.json")
+    with open(path, "w") as f:
+        json.dump(records, f)
+    build_record_store(path, str(directory))
+    store = RecordStore(str(directory))
+    build_field_index(store, str(directory))
+    return store
+
+@pytest.fixture
+def index(tmp_path):
+    store = _build(tmp_path, RECORDS)
+    return FieldIndex(str(tmp_path), store.type_codes, store.type_names)
+
+def _matches(index, filters):
+    return list(np.flatnonzero(index.mask(filters)))
+
+def test_fields_are_classified(index):
+    assert index.fields() == {"Phase": "categorical", "company": "categorical",
+                              "start": "date", "value": "number", "date": "date"}
+
+def test_range_and_categorical_filters(index):
+    # records without the field (the company, the trials) are not constrained by it
+    assert _matches(index, {"value": {"min": "100M", "max": "$2B"}}) == [0, 1, 2, 3, 5]
+    assert _matches(index, {"date": {"min": "2021"}, "Phase": ["phase 3"]}) == [1, 3, 4, 5]
+
+def test_rebuild_leaves_open_indexes_intact(tmp_path, index):
+    values_before = np.array(index._ranges["value"][0])
+    bitmaps_before = np.array(index.bitmaps)
+    _build(tmp_path, RECORDS[:3] + [dict(RECORDS[3], value="$3B")] + RECORDS[4:])
+
+    # the open index still maps the previous files, unchanged
+    assert np.array_equal(index._ranges["value"][0], values_before)
+    assert np.array_equal(index.bitmaps, bitmaps_before)
+    assert not [name for name in os.listdir(tmp_path) if ".tmp-" in name]
+    store = RecordStore(str(tmp_path))
+    rebuilt = FieldIndex(str(tmp_path), store.type_codes, store.type_names)
+    assert 3e9 in rebuilt._ranges["value"][0]
+
+def test_plain_values_on_range_fields_match_exactly(index):
+    # what the form sends for filter.value=... : a list
+    assert _matches(index, {"value": ["$150M"]}) == [0, 1, 2, 5]
+    assert _matches(index, {"value": ["150M", "90M"]}) == [0, 1, 2, 4, 5]
+    assert _matches(index, {"date": ["2021"]}) == [0, 1, 3, 5]
+    assert _matches(index, {"value": "1.2B"}) == [0, 1, 3, 5]
+
+def test_unparseable_plain_value_matches_nothing(index):
+    assert _matches(index, {"value": ["soon"]}) == [0, 1, 5]
@@ -0,0 +1,34 @@
+import gpt
+
+RECORDS = [
+    {"type": "company", "company": name, "combined_text": f"{name} develops a kinase inhibitor."}
+    for name in ("Alpha Bio", "Beta Thera", "Gamma Pharma")
+]
+
+def _run(prompt):
+    results, hits = {}, []
+    gpt.enrich_results([dict(r) for r in RECORDS], prompt,
+                       lambda record, result: results.__setitem__(record["company"], result),
+                       progress_cb=lambda done, total, cache_hits=0: hits.append(cache_hits))
+    return results, hits[-1]
+
+def test_second_run_is_served_from_the_cache(fake_openai, enrich_cache, monkeypatch):
+    monkeypatch.setattr(gpt, "ENRICH_ENGINE", "async")
+
+    first, first_hits = _run("find the lead asset")
+    assert fake_openai.requests == len(RECORDS)
+    assert first_hits == 0
+    assert {r["Company"] for r in first.values()} == {r["company"] for r in RECORDS}
+
+    second, second_hits = _run("find the lead asset")
+    assert fake_openai.requests == len(RECORDS)                 # no new GPT calls
+    assert second_hits == len(RECORDS)
+    assert second == first
+
+def test_cache_is_keyed_by_prompt(fake_openai, enrich_cache, monkeypatch):
+    monkeypatch.setattr(gpt, "ENRICH_ENGINE", "async")
+
+    _run("find the lead asset")
+    _, hits = _run("find the disease area")
+    assert hits == 0
+    assert fake_openai.requests == 2 * len(RECORDS)
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import gpt_batch
+from gpt_batch import LocalBatchBackend, clear_checkpoints, enrich_batch
+
+RECORDS = [
+    {"type": "company", "company": f"Company {n}", "combined_text": f"Company {n} runs a phase 2 trial."}
+    for n in range(4)
+]
+
+class Crash(Exception):
+    pass
+
+@pytest.fixture
+def batch_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(gpt_batch, "BATCH_DIR", str(tmp_path))
+    return tmp_path
+
+def test_retry_resumes_from_the_checkpointed_output(fake_openai, enrich_cache, batch_dir):
+    def crash_on_result(record, result):
+        raise Crash()
+
+    with pytest.raises(Crash):
+        enrich_batch(RECORDS, "find the lead asset", crash_on_result, "job1",
+                     backend=LocalBatchBackend(str(batch_dir)))
+    assert fake_openai.requests == len(RECORDS)
+    assert os.path.exists(batch_dir / "job1.json")
+
+    results = {}
+    enrich_batch(RECORDS, "find the lead asset",
+                 lambda record, result: results.__setitem__(record["company"], result), "job1",
+                 backend=LocalBatchBackend(str(batch_dir)))
+    assert fake_openai.requests == len(RECORDS)                 # the batch was not submitted again
+    assert sorted(results) == sorted(r["company"] for r in RECORDS)
+    assert all(results[name]["Company"] == name for name in results)
+    # kept until the job's upload succeeded
+    assert os.path.exists(batch_dir / "job1.json")
+
+def test_clear_checkpoints_removes_every_prompt_of_a_job(batch_dir):
+    for name in ("job1.json", "job1:0.json", "job1:1.json", "job10.json"):
+        (batch_dir / name).write_text("{}")
+    clear_checkpoints("job1")
+    assert sorted(os.listdir(batch_dir)) == ["job10.json"]
+
+def test_retried_batch_job_fans_out_to_the_right_records(fake_openai, enrich_cache, monkeypatch, tmp_path):
+    # part of the first attempt's results are cached, so the retry regroups fewer misses
+    import gpt
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("BATCH_BACKEND", "local")
+    records = [{"type": "company", "company": name, "combined_text": f"{name} is in the clinic."}
+               for name in ("Alpha", "Beta", "Alpha", "Gamma", "Delta", "Beta", "Epsilon")]
+    calls = []
+
+    def crash_on_third(record, result):
+        calls.append(record)
+        if len(calls) == 3:
+            raise Crash()
+
+    with pytest.raises(Crash):
+        gpt.enrich_results(records, "find the lead asset", crash_on_third, mode="batch", job_id="J")
+    submitted = fake_openai.requests
+
+    results = []
+    gpt.enrich_results(records, "find the lead asset",
+                       lambda record, result: results.append((record["company"], result["Company"])),
+                       mode="batch", job_id="J")
+    assert fake_openai.requests == submitted                    # resumed, not resubmitted
+    assert sorted(results) == sorted((r["company"], r["company"]) for r in records)
@@ -0,0 +1,23 @@
+import pytest
+
+import importtime_check
+
+def test_web_entry_point_stays_within_budget():
+    pytest.importorskip("flask")
+    pytest.importorskip("celery")
+    _, total_ms, forbidden = importtime_check.measure("app")
+    assert forbidden == []
+    assert total_ms <= importtime_check.BUDGET_MS
+    assert importtime_check.check("app")
+
+def test_worker_only_packages_are_reported():
+    # field_index is worker-side and loads numpy
+    _, total_ms, forbidden = importtime_check.measure("field_index")
+    assert "numpy" in forbidden
+    assert total_ms > 0
+    assert not importtime_check.check("field_index", budget_ms=1e9)
+
+def test_failed_import_fails_the_check():
+    with pytest.raises(ImportError):
+        importtime_check.measure("no_such_module_here")
+    assert not importtime_check.check("no_such_module_here")
@@ -0,0 +1,43 @@
+import pytest
+
+import progress
+from progress import ChunkProgress, clear_chunk_progress
+
+@pytest.fixture(autouse=True)
+def no_redis(monkeypatch):
+    # eager / local runs: the chunk counts live in this process
+    monkeypatch.setattr(progress, "PROGRESS_REDIS_URL", None)
+
+def _chunks(parent_id, n, total, events):
+    chunks = [ChunkProgress(parent_id, chunk_no, total, on_flush=lambda state, meta: events.append(meta))
+              for chunk_no in range(n)]
+    for chunk in chunks:
+        chunk.publisher.interval = 0                      # emit every update
+    return chunks
+
+def test_parent_progress_sums_the_chunks():
+    events = []
+    first, second = _chunks("parent-1", 2, 10, events)
+    first.update(3)
+    second.update(4, cache_hits=2)
+    first.update(5, cache_hits=1)                         # replaces chunk 0's earlier count
+    assert [e["current"] for e in events] == [3, 7, 9]
+    assert events[-1]["cache_hits"] == 3
+    assert events[-1]["total"] == 10
+    assert events[-1]["percent"] == 90
+    clear_chunk_progress("parent-1")
+
+def test_fan_outs_are_counted_separately_and_cleared():
+    events_a, events_b = [], []
+    (a,) = _chunks("parent-a", 1, 4, events_a)
+    (b,) = _chunks("parent-b", 1, 4, events_b)
+    a.update(2)
+    b.update(1)
+    assert events_a[-1]["current"] == 2 and events_b[-1]["current"] == 1
+
+    clear_chunk_progress("parent-a")
+    (again,) = _chunks("parent-a", 1, 4, events_a)
+    again.update(1)
+    assert events_a[-1]["current"] == 1
+    clear_chunk_progress("parent-b")
+    clear_chunk_progress("parent-a")
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+from embedding_shards import SHARDS_FILE
+from quantized_tiers import (build_quantized_tiers, load_quantized_tiers, synthetic_shards,
+                             tier_paths, tiers_stale)
+
+K = 50
+
+@pytest.fixture(scope="module")
+def tiers_dir(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("tiers"))
+    synthetic_shards(directory, n=20000, dim=64, clusters=64)
+    build_quantized_tiers(directory, block=4096)
+    return directory
+
+def _exact(shards, q, k, ranges):
+    rows = np.concatenate([np.arange(lo, hi) for lo, hi in ranges])
+    scores = np.asarray(shards[rows], dtype=np.float32) @ q
+    return rows[np.argsort(scores)[::-1][:k]]
+
+@pytest.mark.parametrize("tier,min_recall", [("int8", 0.95), ("binary", 0.8)])
+@pytest.mark.parametrize("ranges", [[(0, 20000)], [(1000, 6000), (12000, 15000)]])
+def test_tier_top_k_is_rescored_exactly(tiers_dir, tier, min_recall, ranges):
+    tiers = load_quantized_tiers(tiers_dir)
+    shards = np.load(os.path.join(tiers_dir, SHARDS_FILE), mmap_mode="r")
+    rng = np.random.default_rng(1)
+    recalls = []
+    for _ in range(10):
+        q = np.asarray(shards[rng.integers(len(shards))], dtype=np.float32) + 0.1 * rng.standard_normal(64)
+        q = (q / np.linalg.norm(q)).astype(np.float32)
+        rows, scores = tiers.topk(q, K, ranges, tier=tier)
+        assert len(rows) == K
+        assert all(any(lo <= r < hi for lo, hi in ranges) for r in rows)
+        # returned scores are the exact fp16 ones, best first
+        assert np.allclose(scores, np.asarray(shards[rows], dtype=np.float32) @ q, atol=1e-5)
+        assert np.all(np.diff(scores) <= 0)
+        recalls.append(len(set(rows) & set(_exact(shards, q, K, ranges))) / K)
+    assert np.mean(recalls) >= min_recall
+
+def test_reload_matches_and_stale_tiers_are_not_loaded(tiers_dir):
+    q = np.ones(64, dtype=np.float32) / 8
+    first = load_quantized_tiers(tiers_dir).topk(q, K, [(0, 20000)], tier="int8")
+    again = load_quantized_tiers(tiers_dir).topk(q, K, [(0, 20000)], tier="int8")
+    assert np.array_equal(first[0], again[0]) and np.array_equal(first[1], again[1])
+
+    # tiers older than the shards (the shards were re-exported)
+    earlier = os.path.getmtime(os.path.join(tiers_dir, SHARDS_FILE)) - 10
+    for path in tier_paths(tiers_dir):
+        os.utime(path, (earlier, earlier))
+    assert tiers_stale(tiers_dir) and load_quantized_tiers(tiers_dir) is None
+    build_quantized_tiers(tiers_dir, block=4096)
+    assert not tiers_stale(tiers_dir)
+    assert not [name for name in os.listdir(tiers_dir) if ".tmp-" in name]
+
+def test_unknown_tier_is_rejected(tiers_dir):
+    with pytest.raises(ValueError):
+        load_quantized_tiers(tiers_dir).topk(np.ones(64, dtype=np.float32), K, [(0, 100)], tier="int4")
@@ -0,0 +1,96 @@
+import json
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+import query_cache
+import search
+from query_cache import TTLCache
+
+DIM = 16
+TYPES = ["company", "deal", "trial"]
+
+class CountingEncoder:
+    def __init__(self):
+        self.texts = 0
+
+    def encode(self, texts, **kwargs):
+        self.texts += len(texts)
+        out = []
+        for text in texts:
+            v = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(DIM)
+            out.append(v / np.linalg.norm(v))
+        return np.array(out, dtype=np.float32)
+
+class CountingReRanker:
+    def __init__(self):
+        self.pairs = 0
+
+    def predict(self, pairs, **kwargs):
+        self.pairs += len(pairs)
+        return np.array([len(text) % 7 - 3.0 for _, text in pairs])
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("search")
+    rng = np.random.default_rng(0)
+    records = [{"type": TYPES[i % 3], "company": f"Company {i}",
+                "combined_text": " ".join(f"w{rng.integers(0, 40)}" for _ in range(12))}
+               for i in range(300)]
+    (directory / "records.json").write_text(json.dumps(records))
+    emb = rng.standard_normal((len(records), DIM))
+    np.save(directory / "embeddings_fp16.npy", (emb / np.linalg.norm(emb, axis=1, keepdims=True)).astype(np.float16))
+    return str(directory)
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    query_cache.clear()
+    yield
+    query_cache.clear()
+
+def _search(data, model, re_ranker, query="w1 w2"):
+    return search._search_indices(query, TYPES, model, re_ranker=re_ranker, data=data,
+                                  sem_top_k=60, type_quotas={t: 10 for t in TYPES}, score_floor=-10)
+
+def test_repeated_query_is_served_from_the_caches(data_dir):
+    data = search.SearchData(data_dir, "v1")
+    model, re_ranker = CountingEncoder(), CountingReRanker()
+    first = _search(data, model, re_ranker)
+    encoded, scored = model.texts, re_ranker.pairs
+    assert encoded == 1 and scored > 0
+
+    assert _search(data, model, re_ranker) == first
+    assert (model.texts, re_ranker.pairs) == (encoded, scored)
+    assert query_cache.semantic.stats()["hits"] >= 1
+
+def test_reloaded_snapshot_does_not_reuse_data_dependent_layers(data_dir):
+    model, re_ranker = CountingEncoder(), CountingReRanker()
+    first = _search(search.SearchData(data_dir, "v1"), model, re_ranker)
+    scored = re_ranker.pairs
+
+    # same files under a new version (a reload): embeddings are reused, scores are recomputed
+    reloaded = _search(search.SearchData(data_dir, "v2"), model, re_ranker)
+    assert model.texts == 1
+    assert re_ranker.pairs == 2 * scored
+    assert reloaded == first
+
+def test_ttl_cache_evicts_least_recently_used_and_expires():
+    cache = TTLCache("test", max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1                               # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+    expiring = TTLCache("test", max_entries=2, ttl=0.01)
+    expiring.set("a", 1)
+    time.sleep(0.02)
+    assert expiring.get("a") is None
+    assert expiring.stats() == {"hits": 0, "misses": 1, "size": 0, "hit_ratio": 0.0}
+
+def test_disabled_layer_stores_nothing():
+    cache = TTLCache("off", max_entries=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
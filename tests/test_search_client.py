@@ -0,0 +1,81 @@
+import json
+import sys
+import threading
+import types
+
+import pytest
+
+import search_client
+import search_service
+from record_store import build_record_store
+
+class FakeService:
+    """Answers like SearchService once `ready`; records how often it searched."""
+
+    def __init__(self, data_dir, ready=False):
+        self.data_dir, self.ready, self.searches = data_dir, ready, 0
+
+    def stats(self):
+        return {"ready": self.ready}
+
+    def search(self, query, search_types, options):
+        self.searches += 1
+        if query == "boom":
+            raise ValueError("bad query")
+        return {"results": {"company": [[1, 0.9], [0, 0.5]]}, "data_dir": self.data_dir, "version": "v1"}
+
+@pytest.fixture
+def data_dir(tmp_path):
+    path = tmp_path / "records.json"
+    path.write_text(json.dumps([{"type": "company", "company": "Alpha"},
+                                {"type": "company", "company": "Beta"}]))
+    build_record_store(str(path), str(tmp_path))
+    return str(tmp_path)
+
+@pytest.fixture
+def local_search(monkeypatch):
+    """Stand-in for the in-process fallback; returns the list of its calls."""
+    calls = []
+    local = types.ModuleType("search")
+    local.search = lambda query, search_types, model, **options: calls.append(query) or {"company": []}
+    models = types.ModuleType("models")
+    models.get_sentence_model = lambda: None
+    monkeypatch.setitem(sys.modules, "search", local)
+    monkeypatch.setitem(sys.modules, "models", models)
+    return calls
+
+@pytest.fixture
+def service(monkeypatch, data_dir):
+    service = FakeService(data_dir)
+    monkeypatch.setattr(search_client, "SERVICE_SOCKET", None)
+    monkeypatch.setattr(search_service, "SERVICE_SOCKET", None)
+    monkeypatch.setattr(search_service, "SERVICE_PORT", 0)
+    server = search_service.make_server(service)
+    monkeypatch.setattr(search_client, "SERVICE_PORT", server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield service
+    server.shutdown()
+    server.server_close()
+
+def test_waits_for_warm_up_instead_of_loading_models(service, local_search):
+    threading.Timer(0.5, setattr, (service, "ready", True)).start()
+    results = search_client.search("kinase", ["company"])
+    assert [(r["company"], s) for r, s in results["company"]] == [("Beta", 0.9), ("Alpha", 0.5)]
+    assert service.searches == 1 and local_search == []
+
+def test_never_ready_falls_back_in_process(service, local_search, monkeypatch):
+    monkeypatch.setattr(search_client, "WARMUP_WAIT", 0.3)
+    search_client.search("kinase", ["company"])
+    assert local_search == ["kinase"]
+
+def test_unreachable_service_falls_back_in_process(local_search, monkeypatch):
+    monkeypatch.setattr(search_client, "SERVICE_SOCKET", None)
+    monkeypatch.setattr(search_client, "SERVICE_PORT", 1)           # nothing listens there
+    search_client.search("kinase", ["company"])
+    assert local_search == ["kinase"]
+
+def test_service_errors_are_raised(service, local_search):
+    service.ready = True
+    with pytest.raises(search_client.ServiceError):
+        search_client.search("boom", ["company"])
+    assert local_search == []
@@ -0,0 +1,210 @@
+"""
+Worker warm start (WORKER_PRELOAD=1, the default).
+
+tasks.py calls preload() from Celery's worker_init signal, once in the
+prefork parent before the pool forks: data sync, record store and indexes,
+the sentence model and cross-encoder, plus a warm-up encode/predict.
+Children inherit all of it copy-on-write, so the first task no longer pays
+for loading. Each stage's wall time and RSS goes into a startup report,
+printed and published to Redis as the worker's readiness signal (see
+ready_workers and /healthz in app.py).
+
+    python warm_start.py measure --children 4    # cold vs preloaded: first query + per-child PSS/USS
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+WORKER_PRELOAD = os.getenv("WORKER_PRELOAD", "1") != "0"
+READY_KEY_PREFIX = "ctic:worker_ready:"
+READY_TTL = int(os.getenv("WORKER_READY_TTL", "300"))        # refreshed every TTL / 3 while alive
+READY_REDIS_URL = os.getenv("READINESS_REDIS_URL") or os.getenv("CELERY_BROKER_URL")
+
+def _rss_mb(pid=None):
+    return psutil.Process(pid or os.getpid()).memory_info().rss / 1024**2
+
+class StartupReport:
+    def __init__(self):
+        self.stages = []
+        self.started = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        yield
+        self.stages.append({"stage": name, "seconds": round(time.perf_counter() - t0, 3),
+                            "rss_mb": round(_rss_mb(), 1)})
+
+    def as_dict(self):
+        return {"host": socket.gethostname(), "pid": os.getpid(), "started": self.started,
+                "seconds": round(sum(s["seconds"] for s in self.stages), 3), "stages": self.stages}
+
+    def print(self):
+        print("[WARM] startup report")
+        for s in self.stages:
+            print(f"[WARM]   {s['stage']:32s} {s['seconds']:8.2f} s {s['rss_mb']:9.1f} MB")
+        print(f"[WARM]   {'total':32s} {self.as_dict()['seconds']:8.2f} s")
+
+# torch thread count before preload; children get it back in after_fork
+_torch_threads = None
+
+def preload():
+    """Load everything a task needs in this (parent) process; returns the StartupReport."""
+    global _torch_threads
+    import models
+    import search
+
+    report = StartupReport()
+    if models.INFERENCE_BACKEND == "torch":
+        import torch
+        # an OpenMP pool started in the parent is not fork-safe: warm up single-threaded
+        _torch_threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+
+    with report.stage("data + indexes + cross-encoder"):
+        search._ensure_initialized(watch=False)          # watcher threads are started per child
+    with report.stage("sentence model"):
+        model = models.get_sentence_model()
+    with report.stage("warm-up encode"):
+        model.encode("warm up")
+    with report.stage("warm-up rerank"):
+        models.get_cross_encoder().predict([("warm up", "warm up")])
+    report.print()
+    return report
+
+def after_fork():
+    """
+    Per-child fix-ups after the pool forks (Celery worker_process_init).
+    onnxruntime sessions keep thread pools that do not survive a fork, so
+    the ONNX backend reloads its (small) sessions here; data stays shared.
+    """
+    import models
+    import search
+
+    if models.INFERENCE_BACKEND == "torch":
+        if _torch_threads:
+            import torch
+            torch.set_num_threads(_torch_threads)
+    else:
+        models.get_sentence_model.cache_clear()
+        models.get_cross_encoder.cache_clear()
+        models.get_sentence_model().encode("warm up")
+        search._re_ranker = models.get_cross_encoder()
+
+# ---- readiness signal (Redis) ----
+
+def _redis():
+    import redis
+    return redis.Redis.from_url(READY_REDIS_URL)
+
+def publish_ready(report, hostname=None):
+    """Mark this worker ready; the key expires unless refreshed (see keep_ready)."""
+    key = READY_KEY_PREFIX + (hostname or socket.gethostname())
+    _redis().setex(key, READY_TTL, json.dumps(report.as_dict()))
+    return key
+
+def keep_ready(key):
+    def refresh():
+        while True:
+            time.sleep(READY_TTL / 3)
+            try:
+                _redis().expire(key, READY_TTL)
+            except Exception as e:
+                print(f"[WARM] readiness refresh failed: {e}")
+    threading.Thread(target=refresh, daemon=True).start()
+
+def clear_ready(hostname=None):
+    _redis().delete(READY_KEY_PREFIX + (hostname or socket.gethostname()))
+
+def ready_workers():
+    """{worker: startup report} for every worker currently marked ready."""
+    r = _redis()
+    keys = list(r.scan_iter(READY_KEY_PREFIX + "*"))
+    values = r.mget(keys) if keys else []
+    return {k.decode()[len(READY_KEY_PREFIX):]: json.loads(v) for k, v in zip(keys, values) if v}
+
+# ---- cold vs preloaded measurement ----
+
+def _first_query(query, search_types):
+    import search
+    from models import get_sentence_model
+    t0 = time.perf_counter()
+    search.search(query, search_types, get_sentence_model())
+    return time.perf_counter() - t0
+
+def _fork_children(n, query, search_types):
+    """Fork n children that each run one query; measure them all while alive."""
+    children = []
+    for _ in range(n):
+        r, w = os.pipe()
+        hold_r, hold_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(r)
+                os.close(hold_w)
+                if WORKER_PRELOAD:
+                    after_fork()
+                os.write(w, f"{_first_query(query, search_types):.6f}\n".encode())
+                os.read(hold_r, 1)                    # stay alive until the parent has measured
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(w)
+        os.close(hold_r)
+        children.append((pid, r, hold_w))
+
+    results = []
+    for pid, r, _ in children:
+        with os.fdopen(r) as f:
+            results.append({"pid": pid, "first_query_s": float(f.readline())})
+    for result in results:
+        mem = psutil.Process(result["pid"]).memory_full_info()
+        result.update(rss_mb=round(mem.rss / 1024**2, 1), pss_mb=round(mem.pss / 1024**2, 1),
+                      uss_mb=round(mem.uss / 1024**2, 1))
+    # later children inherited earlier hold pipes: close every one before waiting
+    for _, _, hold_w in children:
+        os.close(hold_w)
+    for pid, _, _ in children:
+        os.waitpid(pid, 0)
+    return results
+
+def _summary(label, results, parent_s=0.0):
+    n = len(results)
+    print(f"{label}: parent preload {parent_s:.2f} s, "
+          f"first query mean {sum(r['first_query_s'] for r in results) / n:.2f} s, "
+          f"per-child PSS {sum(r['pss_mb'] for r in results) / n:.1f} MB, "
+          f"USS {sum(r['uss_mb'] for r in results) / n:.1f} MB")
+
+def measure(children=4, query="KRAS G12C inhibitors", search_types=("company", "deal")):
+    """Cold children (load on first query) vs children forked from a preloaded parent."""
+    global WORKER_PRELOAD
+    search_types = list(search_types)
+    WORKER_PRELOAD = False
+    cold = _fork_children(children, query, search_types)
+    _summary("cold     ", cold)
+
+    WORKER_PRELOAD = True
+    t0 = time.perf_counter()
+    preload()
+    parent_s = time.perf_counter() - t0
+    warm = _fork_children(children, query, search_types)
+    _summary("preloaded", warm, parent_s)
+    return {"cold": cold, "preloaded": warm, "preload_s": parent_s}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker warm-start tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("measure", help="first-query latency and per-child memory, cold vs preloaded")
+    m.add_argument("--children", type=int, default=4)
+    m.add_argument("--query", default="KRAS G12C inhibitors")
+    m.add_argument("--types", nargs="+", default=["company", "deal"])
+    args = parser.parse_args()
+    print(json.dumps(measure(args.children, args.query, args.types), indent=2))